@@ -1,108 +1,307 @@
-from groq import Groq
+import asyncio
 import json
 import os
 import logging
+import uuid
 
-from tools import tool_definitions, available_tools
+from groq_client import get_async_client
+from history import ConversationHistory, message_to_dict
+import intents
+from tools import tool_definitions, submit_tool_call
 
 # Get logger for this module
 logger = logging.getLogger("sigint_agent")
 
-groq = Groq()
 model = os.environ.get("GROQ_MODEL", "llama-3.3-70b-versatile")
 temperature = 0.5
+# Maximum number of consecutive tool call rounds in a single turn
+max_tool_rounds = int(os.environ.get("MAX_TOOL_ROUNDS", "5"))
+# Seconds a cancelled turn waits for the tool calls already running
+INTERRUPTED_TOOL_WAIT = 10.0
 logger.info(f"Using GROQ model: {model}")
 
-messages = [
-    {
-        "role": "system",
-        "content": open("prompts/main.txt").read()
-    }
-]
-logger.debug("Loaded system prompt")
+_system_prompt = None
+_messages = None
+
+
+def get_system_prompt() -> str:
+    """Get the agent system prompt, read on first use."""
+    global _system_prompt
+    if _system_prompt is None:
+        with open("prompts/main.txt") as f:
+            _system_prompt = f.read()
+        logger.debug("Loaded system prompt")
+    return _system_prompt
+
+
+def new_history(session_id: str = None) -> ConversationHistory:
+    """Create a conversation starting from the system prompt, restoring
+    the saved history of `session_id` if there is one."""
+    return ConversationHistory(get_system_prompt(), session_id=session_id)
+
+
+def get_messages() -> ConversationHistory:
+    """Get the conversation of the interactive terminal session."""
+    global _messages
+    if _messages is None:
+        _messages = new_history(os.environ.get("AGENT_SESSION", "default"))
+    return _messages
+
 
+def __getattr__(name):
+    # Keep `agent.messages` working while creating it lazily
+    if name == "messages":
+        return get_messages()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+async def run(message: str, stream_handler=None, history=None):
+    """Run one agent turn, executing as many rounds of tool calls as the
+    model requests (up to `max_tool_rounds`) before its final answer.
+
+    The turn can be cancelled at any point, the history then keeps the
+    operator message, the tool calls that were run and whatever part of
+    the answer was already streamed.
+
+    Args:
+        message (str): The operator message
+        stream_handler (callable, optional): Called with each content chunk,
+            enables streaming mode
+        history (ConversationHistory, optional): The conversation to run
+            the turn in, defaults to the interactive session
+
+    Returns:
+        str: The final response of the model
+    """
+    if history is None:
+        history = get_messages()
 
-def run(message: str, stream_handler=None):
     msg_preview = message[:50] + "..." if len(message) > 50 else message
     logger.info(f"Processing message: {msg_preview}")
-    messages.append({"role": "user", "content": message})
+    history.append({"role": "user", "content": message})
+    turn_start = len(history)
 
-    logger.debug("Sending request to GROQ API")
+    intent = intents.match_intent(message)
+    if intent:
+        return await run_local_intent(
+            *intent, stream_handler=stream_handler, history=history)
 
-    # If stream_handler is provided, use streaming mode
+    streamed = []
     if stream_handler:
-        response_stream = groq.chat.completions.create(
-            model=model,
-            messages=messages,
-            tools=tool_definitions,
-            tool_choice="auto",
-            max_tokens=4096,
-            stream=True,
-            temperature=temperature,
-        )
-
-        # Process streaming response
-        final_response = process_streaming_response(
-            response_stream, stream_handler)
-        return final_response
+        def handle_chunk(text_chunk):
+            streamed.append(text_chunk)
+            stream_handler(text_chunk)
     else:
-        # Original non-streaming implementation
-        response = groq.chat.completions.create(
-            model=model,
-            messages=messages,
-            tools=tool_definitions,
-            tool_choice="auto",
-            max_tokens=4096,
-            temperature=temperature,
-        )
-
-        response_message = response.choices[0].message
-        messages.append(response_message)
-
-        tool_calls = response_message.tool_calls
-        if tool_calls:
-            logger.info(f"Received tool calls: {len(tool_calls)}")
-
-            for tool_call in tool_calls:
-                tool_name = tool_call.function.name
-                logger.info(f"Executing tool call: {tool_name}")
-                tool_function = available_tools[tool_name]
-                tool_args = json.loads(tool_call.function.arguments)
-                logger.debug(f"Tool arguments: {tool_args}")
-                result = tool_function(**tool_args)
-                messages.append(
-                    {
-                        "role": "tool",
-                        "content": result,
-                        "tool_call_id": tool_call.id,
-                        "name": tool_name
-                    }
-                )
-
-            logger.debug("Sending follow-up request to GROQ API")
-            response = groq.chat.completions.create(
+        handle_chunk = None
+
+    # (tool call, future) pairs of the current round
+    calls = []
+    round_start = turn_start
+    content = ""
+    try:
+        for tool_round in range(max_tool_rounds + 1):
+            streamed.clear()
+            round_start = len(history)
+            # On the last round the model has to answer with what it has
+            tool_choice = "auto" if tool_round < max_tool_rounds else "none"
+
+            logger.debug(f"Sending request to GROQ API (round {tool_round})")
+            response = await get_async_client().chat.completions.create(
                 model=model,
-                messages=messages,
+                messages=history,
+                tools=tool_definitions,
+                tool_choice=tool_choice,
                 max_tokens=4096,
+                stream=bool(stream_handler),
                 temperature=temperature,
             )
 
-            response_message = response.choices[0].message
-            messages.append(response_message)
-            logger.info("Received final response from GROQ API")
-
-            return response_message.content
+            if stream_handler:
+                assistant_message, futures = \
+                    await process_streaming_response(
+                        response, handle_chunk, calls)
+            else:
+                assistant_message = message_to_dict(
+                    response.choices[0].message)
+                futures = []
+                for tool_call in assistant_message.get("tool_calls") or []:
+                    futures.append(submit_tool_call(
+                        tool_call["function"]["name"],
+                        tool_call["function"]["arguments"]))
+                    calls.append((tool_call, futures[-1]))
+
+            content = assistant_message.get("content") or ""
+            history.append(assistant_message)
+
+            tool_calls = assistant_message.get("tool_calls")
+            if not tool_calls:
+                break
 
-        logger.info("Received direct response from GROQ API (no tool calls)")
-        return response_message.content
-
-
-def process_streaming_response(response_stream, stream_handler):
-    """Process a streaming response from GROQ API."""
+            logger.info(f"Received tool calls: {len(tool_calls)}")
+            await append_tool_results(tool_calls, futures, history)
+            calls = []
+    except asyncio.CancelledError:
+        logger.info("Agent turn cancelled by the operator")
+        # Earlier rounds were answered in full. The calls of this one are
+        # recorded again, only with those that ran and their results, the
+        # API rejects unanswered calls on the next turn
+        del history[round_start:]
+        await record_interrupted_calls(calls, history)
+        history.append({
+            "role": "assistant",
+            "content": "".join(streamed) + " [interrupted by the operator]"
+        })
+        history.save()
+        raise
+
+    history.save()
+    logger.info("Received final response from GROQ API")
+    return content
+
+
+async def run_local_intent(tool_name: str, tool_args: dict,
+                           stream_handler=None, history=None):
+    """Answer a simple radio command without an LLM round trip.
+
+    The exchange is recorded in the history as a regular tool call so the
+    conversation stays consistent for the model on the next turn.
+    """
+    if history is None:
+        history = get_messages()
+
+    logger.info(f"Answering locally with {tool_name}")
+    tool_call = {
+        "id": f"local_{uuid.uuid4().hex[:12]}",
+        "type": "function",
+        "function": {"name": tool_name, "arguments": json.dumps(tool_args)},
+    }
+    history.append(
+        {"role": "assistant", "content": "", "tool_calls": [tool_call]})
+    future = submit_tool_call(tool_name, tool_call["function"]["arguments"])
+    try:
+        await append_tool_results([tool_call], [future], history)
+    except asyncio.CancelledError:
+        del history[-1]
+        await record_interrupted_calls([(tool_call, future)], history)
+        history.append({
+            "role": "assistant",
+            "content": "[interrupted by the operator]"
+        })
+        history.save()
+        raise
+
+    content = intents.render_reply(
+        tool_name, tool_args, history[-1]["content"])
+    history.append({"role": "assistant", "content": content})
+    history.save()
+    if stream_handler:
+        stream_handler(content)
+    return content
+
+
+async def append_tool_results(tool_calls: list, futures: list, history):
+    """Wait for the tool calls of a response and append their results to
+    the history in the original tool call order."""
+    results = await asyncio.gather(
+        *(asyncio.wrap_future(future) for future in futures),
+        return_exceptions=True)
+    for tool_call, result in zip(tool_calls, results):
+        _append_tool_result(tool_call, result, history)
+
+
+def _append_tool_result(tool_call: dict, result, history):
+    if isinstance(result, Exception):
+        logger.error(f"Error executing tool call: {result}", exc_info=result)
+        result = json.dumps({"error": str(result)})
+    history.append(
+        {
+            "role": "tool",
+            "content": result,
+            "tool_call_id": tool_call["id"],
+            "name": tool_call["function"]["name"]
+        }
+    )
+
+
+async def record_interrupted_calls(calls: list, history):
+    """Record the tool calls of a cancelled turn that already started.
+
+    Calls still queued are cancelled and forgotten. The others may have
+    retuned the radio, so they are waited for (up to
+    INTERRUPTED_TOOL_WAIT seconds) and recorded with their result, and the
+    history stays consistent with what was done.
+
+    Args:
+        calls (list): `(tool call, future)` pairs of the interrupted round
+        history (ConversationHistory): The conversation to record them in
+    """
+    started = [(tool_call, future) for tool_call, future in calls
+               if not future.cancel()]
+    if not started:
+        return
+    history.append({"role": "assistant", "content": "",
+                    "tool_calls": [tool_call for tool_call, _ in started]})
+    await asyncio.wait(
+        [asyncio.wrap_future(future) for _, future in started],
+        timeout=INTERRUPTED_TOOL_WAIT)
+    for tool_call, future in started:
+        if not future.done():
+            result = json.dumps(
+                {"error": "Interrupted by the operator, the call was "
+                          "still running"})
+        elif future.exception() is not None:
+            result = future.exception()
+        else:
+            result = future.result()
+        _append_tool_result(tool_call, result, history)
+
+
+def _arguments_complete(arguments: str) -> bool:
+    """Whether a streamed tool call arguments string is a complete object."""
+    if not arguments.rstrip().endswith("}"):
+        return False
+    try:
+        return isinstance(json.loads(arguments), dict)
+    except ValueError:
+        return False
+
+
+async def process_streaming_response(response_stream, stream_handler,
+                                     calls: list = None):
+    """Process a streaming response from GROQ API.
+
+    Content is forwarded to `stream_handler` as it arrives. Each tool call
+    is submitted for execution as soon as its arguments are complete, so
+    tool latency overlaps with the rest of the generation.
+
+    Args:
+        response_stream: The streamed completion
+        stream_handler (callable): Called with each content chunk
+        calls (list, optional): Receives the `(tool call, future)` pairs as
+            they are submitted, they are left to the caller on cancel
+
+    Returns:
+        tuple: (assistant message dict, list of futures for its tool calls)
+    """
     collected_message = {"content": "", "tool_calls": []}
-    current_tool_call = None
-
-    for chunk in response_stream:
+    futures = []
+
+    def dispatch(up_to):
+        # Submit every collected tool call before index `up_to`, in order
+        while len(futures) < min(up_to, len(collected_message["tool_calls"])):
+            tool_call = collected_message["tool_calls"][len(futures)]
+            logger.debug(
+                f"Dispatching tool call {tool_call['function']['name']} "
+                "before the stream completed")
+            futures.append(submit_tool_call(
+                tool_call["function"]["name"],
+                tool_call["function"]["arguments"]))
+            if calls is not None:
+                calls.append((tool_call, futures[-1]))
+
+    def process_chunk(chunk):
+        if not chunk.choices:
+            return
         delta = chunk.choices[0].delta
 
         # Handle content chunks
@@ -111,87 +310,60 @@ def process_streaming_response(response_stream, stream_handler):
             stream_handler(delta.content)
 
         # Handle tool call chunks
-        if delta.tool_calls:
-            for tool_call_delta in delta.tool_calls:
-                if tool_call_delta.index is not None:
-                    idx = tool_call_delta.index
-
-                    # Extend the tool_calls list if needed
-                    while len(collected_message["tool_calls"]) <= idx:
-                        collected_message["tool_calls"].append({
-                            "id": "",
-                            "function": {"name": "", "arguments": ""},
-                            "type": "function"
-                        })
-
-                    current_tool_call = collected_message["tool_calls"][idx]
-
-                    # Update tool call data
-                    if tool_call_delta.id:
-                        current_tool_call["id"] = tool_call_delta.id
-
-                    if tool_call_delta.function:
-                        if tool_call_delta.function.name:
-                            current_tool_call["function"]["name"] = \
-                                tool_call_delta.function.name
-
-                        if tool_call_delta.function.arguments:
-                            current_tool_call["function"]["arguments"] += \
-                                tool_call_delta.function.arguments
-
-    # Add the collected message to our messages history
-    if collected_message["content"] or collected_message["tool_calls"]:
-        final_message = {
-            "role": "assistant",
-            "content": collected_message["content"]
-        }
-        if collected_message["tool_calls"]:
-            final_message["tool_calls"] = collected_message["tool_calls"]
-        messages.append(final_message)
-
-    # Process tool calls if any
+        for tool_call_delta in delta.tool_calls or []:
+            if tool_call_delta.index is None:
+                continue
+            idx = tool_call_delta.index
+
+            # Extend the tool_calls list if needed
+            while len(collected_message["tool_calls"]) <= idx:
+                collected_message["tool_calls"].append({
+                    "id": "",
+                    "function": {"name": "", "arguments": ""},
+                    "type": "function"
+                })
+
+            # A new tool call means the previous ones are complete
+            dispatch(idx)
+            current_tool_call = collected_message["tool_calls"][idx]
+
+            # Update tool call data
+            if tool_call_delta.id:
+                current_tool_call["id"] = tool_call_delta.id
+
+            if tool_call_delta.function:
+                if tool_call_delta.function.name:
+                    current_tool_call["function"]["name"] = \
+                        tool_call_delta.function.name
+
+                if tool_call_delta.function.arguments:
+                    current_tool_call["function"]["arguments"] += \
+                        tool_call_delta.function.arguments
+
+            if len(futures) == idx and \
+                    current_tool_call["function"]["name"] and \
+                    _arguments_complete(
+                        current_tool_call["function"]["arguments"]):
+                dispatch(idx + 1)
+
+    try:
+        async for chunk in response_stream:
+            process_chunk(chunk)
+    except asyncio.CancelledError:
+        if calls is None:
+            for future in futures:
+                future.cancel()
+        raise
+    finally:
+        # Release the connection early if the turn was cancelled
+        await response_stream.close()
+
+    dispatch(len(collected_message["tool_calls"]))
+
+    final_message = {
+        "role": "assistant",
+        "content": collected_message["content"]
+    }
     if collected_message["tool_calls"]:
-        logger.info(
-            f"Received tool calls: {len(collected_message['tool_calls'])}")
-
-        for tool_call in collected_message["tool_calls"]:
-            tool_name = tool_call["function"]["name"]
-            logger.info(f"Executing tool call: {tool_name}")
-            tool_function = available_tools[tool_name]
-            tool_args = json.loads(tool_call["function"]["arguments"])
-            logger.debug(f"Tool arguments: {tool_args}")
-            result = tool_function(**tool_args)
-            messages.append(
-                {
-                    "role": "tool",
-                    "content": result,
-                    "tool_call_id": tool_call["id"],
-                    "name": tool_name
-                }
-            )
-
-        # After tool calls, we need a follow-up response
-        logger.debug("Sending follow-up request to GROQ API")
-        response = groq.chat.completions.create(
-            model=model,
-            messages=messages,
-            max_tokens=4096,
-            stream=True,
-            temperature=temperature,
-        )
-
-        # Stream the follow-up response
-        second_response = ""
-        for chunk in response:
-            if chunk.choices[0].delta.content:
-                content = chunk.choices[0].delta.content
-                second_response += content
-                stream_handler(content)
-
-        # Add the final response to messages
-        messages.append({"role": "assistant", "content": second_response})
-        logger.info("Received final response from GROQ API")
-
-        return second_response
-
-    return collected_message["content"]
+        final_message["tool_calls"] = collected_message["tool_calls"]
+    return final_message, futures
@@ -1,43 +1,23 @@
+import argparse
 import logging
 import sys
-import os
 import atexit
 import time
-import datetime
 
 # Import modules from our application
 import database
 import gqrx_client as gqrx
 import chat_interface
 import stream_groq_whisper
-
-# Configure logging - do this before any other imports that might
-# configure logging
-# First, remove all existing handlers to ensure clean configuration
-for handler in logging.root.handlers[:]:
-    logging.root.removeHandler(handler)
-
-# Create logs directory if it doesn't exist
-logs_dir = "logs"
-if not os.path.exists(logs_dir):
-    os.makedirs(logs_dir)
-
-# Generate timestamp for the log file
-timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-log_filename = os.path.join(logs_dir, f"{timestamp}_sigint_agent.log")
-
-# Configure a file handler
-file_handler = logging.FileHandler(log_filename)
-file_handler.setFormatter(
-    logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
-
-# Configure the root logger
-logging.root.setLevel(logging.INFO)
-logging.root.addHandler(file_handler)
+import groq_client
+import log_config
+import scanner
+import similarity_index
+import telemetry
+import process_pipeline
+import profiling
 
 logger = logging.getLogger("sigint_app")
-logger.info(f"Logging to: {log_filename}")
 
 
 def initialize_system():
@@ -56,10 +36,8 @@ def initialize_system():
     try:
         logger.info("Getting current frequency from GQRX")
         frequency = gqrx.send("f")
-        gqrx.close()
     except Exception as e:
         logger.error(f"Error getting current frequency: {e}")
-        gqrx.close()
 
     if frequency:
         database.save_session(frequency)
@@ -77,7 +55,20 @@ def cleanup():
         chat_interface.reset_terminal()
 
         # Then stop the audio stream processing
-        stream_groq_whisper.stop_audio_stream()
+        if process_pipeline.pipeline is not None:
+            process_pipeline.stop()
+        else:
+            stream_groq_whisper.stop_audio_stream()
+
+        # Stop scanning and sampling before releasing the radio
+        scanner.stop_scan()
+        telemetry.stop_sampler()
+
+        # Write the CPU profile if one is still running
+        profiling.stop_cpu_profile()
+
+        # Release the persistent GQRX connection
+        gqrx.close()
 
         # Add a small sleep to ensure cleanup messages are displayed
         time.sleep(0.1)
@@ -88,8 +79,30 @@ def cleanup():
         logger.error(f"Error during cleanup: {e}")
 
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="SIGINT Agent")
+    parser.add_argument(
+        "--headless", action="store_true",
+        help="Serve the agent and live intercepts over HTTP/WebSocket "
+             "instead of the terminal chat")
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="API server listen address (headless mode)")
+    parser.add_argument("--port", type=int, default=8080,
+                        help="API server port (headless mode)")
+    parser.add_argument(
+        "--pipeline", choices=("thread", "process"),
+        default=process_pipeline.pipeline_mode,
+        help="Run capture and transcription on threads of this process, "
+             "or in separate supervised processes")
+    return parser.parse_args(argv)
+
+
 def main():
     """Main function to run the application."""
+    args = parse_args()
+    # Not at import time, the pipeline worker processes import this module
+    log_config.setup_logging()
+    startup_started = time.perf_counter()
     logger.info("Starting SIGINT Agent Application")
 
     try:
@@ -103,15 +116,40 @@ def main():
         import signal
         for sig in (signal.SIGINT, signal.SIGTERM):
             signal.signal(sig, lambda signum, frame: sys.exit(0))
+        # Thread stacks and CPU profiles on demand, also in headless mode
+        profiling.install_signal_handlers()
 
-        # Start the audio stream processing in a background thread
         logger.info("Starting audio stream processing")
-        stream_groq_whisper.run_audio_stream()
+        if args.pipeline == "process":
+            # Capture and workers in their own processes, sharing the
+            # audio through a ring buffer in shared memory
+            process_pipeline.start()
+        else:
+            # Start the audio stream processing in a background thread
+            stream_groq_whisper.run_audio_stream()
         logger.info("Audio stream processing started")
 
-        # Run the chat interface (main thread)
-        logger.info("Starting chat interface")
-        chat_interface.run()
+        # Open the API connection now rather than on the first chunk
+        groq_client.warm_up()
+
+        # Start sampling signal strength in the background
+        telemetry.start_sampler()
+
+        # Index past and new intercepts for similarity search
+        similarity_index.start()
+
+        logger.info(
+            "Startup completed in "
+            f"{(time.perf_counter() - startup_started) * 1000:.0f} ms")
+
+        if args.headless:
+            # Serve API clients on the main thread event loop
+            import server
+            server.run(args.host, args.port)
+        else:
+            # Run the chat interface (main thread)
+            logger.info("Starting chat interface")
+            chat_interface.run()
 
     except Exception as e:
         logger.error(f"Fatal error in main application: {e}", exc_info=True)
@@ -0,0 +1,147 @@
+import numpy as np
+
+# Transcription audio: 16kHz mono s16le
+SAMPLE_RATE = 16000
+# 25 ms frames every 10 ms
+FRAME_SIZE = 400
+HOP_SIZE = 160
+FFT_SIZE = 512
+# Band carrying most of the energy of (radio) speech, from below the
+# fundamental of low voices
+SPEECH_LOW = 100
+SPEECH_HIGH = 3400
+# A frame is voiced when it is this much louder than the noise floor
+SPEECH_MARGIN_DB = 6.0
+# Per frame limits of voiced frames, noise is broadband and flat
+MAX_SPEECH_FLATNESS = 0.4
+MIN_SPEECH_BAND_RATIO = 0.5
+MAX_SPEECH_ZCR = 0.45
+
+_EPS = 1e-10
+_window = np.hanning(FRAME_SIZE).astype(np.float32)
+
+
+def pcm_to_float(data: bytes) -> np.ndarray:
+    """Convert s16le PCM bytes to float32 samples in [-1, 1)."""
+    return np.frombuffer(data, dtype="<i2").astype(np.float32) / 32768
+
+
+def frame_signal(samples: np.ndarray, frame_size: int = FRAME_SIZE,
+                 hop: int = HOP_SIZE) -> np.ndarray:
+    """Split samples into overlapping frames, shape (n_frames, frame_size).
+
+    The frames are a read-only view, no samples are copied. A trailing
+    partial frame is dropped.
+    """
+    if len(samples) < frame_size:
+        return np.empty((0, frame_size), dtype=samples.dtype)
+    count = 1 + (len(samples) - frame_size) // hop
+    return np.lib.stride_tricks.as_strided(
+        samples, shape=(count, frame_size),
+        strides=(samples.strides[0] * hop, samples.strides[0]),
+        writeable=False)
+
+
+def power_spectra(frames: np.ndarray) -> np.ndarray:
+    """Power spectrum of every Hann windowed frame."""
+    spectra = np.fft.rfft(frames * _window, n=FFT_SIZE, axis=1)
+    return (spectra.real ** 2 + spectra.imag ** 2).astype(np.float32)
+
+
+def band_slice(low: float = SPEECH_LOW, high: float = SPEECH_HIGH,
+               sample_rate: int = SAMPLE_RATE) -> slice:
+    """Spectrum bins of a frequency band."""
+    resolution = sample_rate / FFT_SIZE
+    return slice(int(np.ceil(low / resolution)),
+                 int(np.floor(high / resolution)) + 1)
+
+
+def frame_energy_db(spectra: np.ndarray) -> np.ndarray:
+    """Speech band energy of every frame in dB.
+
+    Out of band noise does not mask weak voices this way.
+    """
+    return 10 * np.log10(spectra[:, band_slice()].sum(axis=1) + _EPS)
+
+
+def speech_band_ratio(spectra: np.ndarray) -> np.ndarray:
+    """Fraction of the energy of every frame in the speech band."""
+    band = spectra[:, band_slice()].sum(axis=1)
+    return band / (spectra.sum(axis=1) + _EPS)
+
+
+def zero_crossing_rate(frames: np.ndarray) -> np.ndarray:
+    """Fraction of consecutive samples changing sign, per frame."""
+    signs = np.signbit(frames)
+    return np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) \
+        / (frames.shape[1] - 1)
+
+
+def spectral_flatness(spectra: np.ndarray) -> np.ndarray:
+    """Geometric over arithmetic mean of the speech band, per frame.
+
+    Close to 1 for noise, low for harmonic (voiced) sound.
+    """
+    band = spectra[:, band_slice()] + _EPS
+    return np.exp(np.log(band).mean(axis=1)) / band.mean(axis=1)
+
+
+def speech_frame_mask(energy_db: np.ndarray, ratio: np.ndarray,
+                      flatness: np.ndarray, zcr: np.ndarray,
+                      floor_db: float,
+                      margin_db: float = SPEECH_MARGIN_DB) -> np.ndarray:
+    """Frames that are loud enough and have a speech-like spectrum."""
+    return (
+        (energy_db > floor_db + margin_db)
+        & (ratio >= MIN_SPEECH_BAND_RATIO)
+        & (flatness <= MAX_SPEECH_FLATNESS)
+        & (zcr <= MAX_SPEECH_ZCR)
+    )
+
+
+def analyze(samples: np.ndarray) -> dict:
+    """Per-frame features of float samples.
+
+    Returns:
+        dict: `frames`, `spectra`, `energy_db`, `ratio`, `flatness` and
+        `zcr` arrays, one row/value per frame
+    """
+    frames = frame_signal(samples)
+    spectra = power_spectra(frames)
+    return {
+        "frames": frames,
+        "spectra": spectra,
+        "energy_db": frame_energy_db(spectra),
+        "ratio": speech_band_ratio(spectra),
+        "flatness": spectral_flatness(spectra),
+        "zcr": zero_crossing_rate(frames),
+    }
+
+
+def chunk_features(data: bytes) -> dict:
+    """Summary features of a PCM chunk, estimated without any history.
+
+    The noise floor is taken from the quietest frames of the chunk itself.
+    Band ratio, zero-crossing rate and flatness are averaged over the
+    frames standing out of it, background noise alone gets the values of
+    white noise.
+    """
+    features = analyze(pcm_to_float(data))
+    summary = {"speech_band_ratio": 0.0, "zero_crossing_rate": 0.5,
+               "spectral_flatness": 1.0, "speech_fraction": 0.0}
+    if not len(features["frames"]):
+        return summary
+    floor_db = float(np.percentile(features["energy_db"], 10))
+    loud = features["energy_db"] > floor_db + SPEECH_MARGIN_DB
+    if not loud.any():
+        return summary
+    mask = speech_frame_mask(
+        features["energy_db"], features["ratio"], features["flatness"],
+        features["zcr"], floor_db)
+    summary.update({
+        "speech_band_ratio": float(features["ratio"][loud].mean()),
+        "zero_crossing_rate": float(features["zcr"][loud].mean()),
+        "spectral_flatness": float(features["flatness"][loud].mean()),
+        "speech_fraction": float(mask.mean()),
+    })
+    return summary
@@ -1,12 +1,18 @@
+import asyncio
 import logging
+import os
 import sys
-import select
 import termios
 import tty
-import time
 
 # Import agent module
 from agent import run as run_agent
+from intents import format_frequency, parse_frequency
+from line_editor import LineEditor
+import events
+import groq_client
+import process_pipeline
+import profiling
 
 logger = logging.getLogger("chat_interface")
 
@@ -36,8 +42,216 @@ def stream_output(text_chunk):
     sys.stdout.flush()
 
 
+# Escape key, interrupts the operator while an answer is being generated
+ESCAPE = b"\x1b"
+
+
+class KeyReader:
+    """Collect keystrokes from stdin on the event loop without polling."""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.fd = sys.stdin.fileno()
+        self.keys = asyncio.Queue()
+        # Keys typed while an answer streams, consumed by the next prompt
+        self.pending = b""
+
+    def start(self):
+        self.loop.add_reader(self.fd, self._on_readable)
+
+    def stop(self):
+        self.loop.remove_reader(self.fd)
+
+    def _on_readable(self):
+        data = os.read(self.fd, 1024)
+        if data:
+            self.keys.put_nowait(data)
+
+    async def read(self) -> bytes:
+        if self.pending:
+            data, self.pending = self.pending, b""
+            return data
+        return await self.keys.get()
+
+
+def feed_frequency(value: str):
+    """Frequency in Hz of a `.feed` filter, None for a keyword.
+
+    Only decimal MHz (145.500) and Hz values are frequencies, so short
+    numbers heard on the air ("unit 7") remain keywords.
+    """
+    if "." not in value and not (value.isdigit()
+                                 and int(value) >= 1_000_000):
+        return None
+    try:
+        return parse_frequency(value)
+    except ValueError:
+        return None
+
+
+class LiveFeed:
+    """Show new intercepts above the prompt as they are saved."""
+
+    def __init__(self, loop, editor: LineEditor):
+        self.loop = loop
+        self.editor = editor
+        self.subscription = None
+        self.description = None
+
+    def start(self, filters: list):
+        """Subscribe to new intercepts matching the filters.
+
+        Args:
+            filters (list): Frequencies and keywords, an intercept is shown
+                if it is on one of the frequencies (if any are given) and
+                contains one of the keywords (if any are given)
+        """
+        self.stop()
+        frequencies, keywords = set(), []
+        for value in filters:
+            frequency = feed_frequency(value)
+            if frequency:
+                frequencies.add(str(frequency))
+            else:
+                keywords.append(value.lower())
+
+        def matches(event):
+            if frequencies and event["frequency"] not in frequencies:
+                return False
+            text = event["text"].lower()
+            return not keywords or any(k in text for k in keywords)
+
+        self.subscription = events.subscribe(
+            events.TRANSCRIPT, matches, maxsize=200,
+            callback=lambda _: self.loop.call_soon_threadsafe(self.show))
+        self.description = ", ".join(
+            [format_frequency(f) for f in sorted(frequencies)] +
+            [f'"{k}"' for k in keywords]) or "all intercepts"
+
+    def stop(self):
+        if self.subscription is not None:
+            self.subscription.close()
+            self.subscription = None
+
+    def show(self):
+        """Print queued intercepts, only while the prompt is displayed."""
+        if self.subscription is None or not self.editor.active:
+            return
+        dropped, self.subscription.dropped = self.subscription.dropped, 0
+        if dropped:
+            self.editor.print_above(f"[feed] {dropped} intercepts skipped")
+        for event in self.subscription.drain():
+            # Sessions without GQRX have the frequency "unknown"
+            frequency = format_frequency(event["frequency"]) \
+                if str(event["frequency"]).isdigit() \
+                else "unknown frequency"
+            timestamp = event["timestamp"][11:19]
+            self.editor.print_above(
+                f"[{timestamp}] {frequency}: {event['text'].strip()}")
+
+
+def handle_feed_command(feed: LiveFeed, user_input: str):
+    """Handle `.feed [off | frequencies and keywords]`."""
+    args = user_input.split()[1:]
+    if args == ["off"]:
+        feed.stop()
+        print("Live feed off")
+        return
+    if args == ["on"]:
+        args = []
+    feed.start(args)
+    print(f"Live feed on: {feed.description}")
+
+
+def handle_profile_command(user_input: str):
+    """Handle `.prof [start | stop | status]`, `.mem [stop]` and `.stacks`."""
+    command, *args = user_input.split()
+    if process_pipeline.pipeline is not None:
+        print("Only this process is profiled, not the capture and"
+              " transcription worker processes")
+    if command == ".stacks":
+        print(f"Thread stacks written to {profiling.dump_stacks()}")
+    elif command == ".mem":
+        if args == ["stop"]:
+            profiling.stop_memory_tracing()
+            print("Memory tracing stopped")
+            return
+        path = profiling.snapshot_memory()
+        if path is None:
+            print("Memory tracing started, run '.mem' again for a report")
+        else:
+            print(f"Memory report written to {path}")
+    elif args == ["status"]:
+        status = profiling.get_status()
+        print(f"CPU profiling: "
+              f"{'on' if status['cpu_profiling'] else 'off'}"
+              f" ({status['cpu_samples']} samples), memory tracing: "
+              f"{'on' if status['memory_tracing'] else 'off'}")
+    elif args == ["start"] or (not args and not profiling.profiler.running):
+        if profiling.start_cpu_profile():
+            print("CPU profiling started, '.prof stop' writes the report")
+        else:
+            print("CPU profiling is already running")
+    else:
+        path = profiling.stop_cpu_profile()
+        print(f"CPU profile written to {path}" if path
+              else "CPU profiling is not running")
+
+
+async def read_line(reader: KeyReader, editor: LineEditor,
+                    feed: LiveFeed = None) -> str:
+    """Read and edit one line from the terminal in raw mode."""
+    tty.setraw(reader.fd)
+    try:
+        editor.start()
+        if feed is not None:
+            # Intercepts received while an answer was streaming
+            feed.show()
+        # Finish a line typed ahead while the previous answer streamed
+        line = editor.feed(b"")
+        while line is None:
+            line = editor.feed(await reader.read())
+        return line
+    finally:
+        # Restore terminal settings for normal processing
+        termios.tcsetattr(reader.fd, termios.TCSADRAIN, old_settings)
+
+
+async def run_turn(reader: KeyReader, user_input: str):
+    """Run the agent on a message, cancelling it if Escape is pressed."""
+    # cbreak keeps output processing on while still delivering single keys
+    tty.setcbreak(reader.fd)
+    task = asyncio.create_task(
+        run_agent(user_input, stream_handler=stream_output))
+    try:
+        while not task.done():
+            key_task = asyncio.create_task(reader.read())
+            done, _ = await asyncio.wait(
+                {task, key_task}, return_when=asyncio.FIRST_COMPLETED)
+            if key_task not in done:
+                key_task.cancel()
+                continue
+            data = key_task.result()
+            if data == ESCAPE and not task.done():
+                task.cancel()
+            else:
+                reader.pending += data
+        try:
+            await task
+        except asyncio.CancelledError:
+            sys.stdout.write("\n[Interrupted]")
+            sys.stdout.flush()
+    finally:
+        termios.tcsetattr(reader.fd, termios.TCSADRAIN, old_settings)
+
+
 def run():
     """Run the chat-like interface in the terminal."""
+    asyncio.run(run_async())
+
+
+async def run_async():
+    """Run the chat-like interface on the asyncio event loop."""
     global old_settings
 
     logger.info("Starting chat interface")
@@ -66,63 +280,49 @@ d88P     888  "Y8888P"  8888888888 888    Y888     888
 """
     print(sigint_ascii)
     print("Type '.exit' or '.quit' to end the session")
+    print("Press Esc to interrupt an answer")
+    print("Type '.feed [frequencies/keywords]' to follow new intercepts live,"
+          " '.feed off' to stop")
+    print("Type '.prof' to start/stop CPU profiling, '.mem' for a memory"
+          " report, '.stacks' to dump thread stacks")
     print("============================================================\n")
 
+    # Connect while the operator types the first message
+    warm_up = asyncio.create_task(groq_client.warm_up_async())
+
     # Save terminal settings
     old_settings = termios.tcgetattr(sys.stdin)
+    reader = KeyReader(asyncio.get_running_loop())
+    reader.start()
+    editor = LineEditor("You: ")
+    feed = LiveFeed(asyncio.get_running_loop(), editor)
     try:
         while True:
-            # Print prompt
-            sys.stdout.write("\nYou: ")
+            sys.stdout.write("\n")
             sys.stdout.flush()
 
-            # Collect input
-            user_input = ""
-
-            # Set terminal to raw mode to read characters one by one
-            tty.setraw(sys.stdin.fileno())
-
-            while True:
-                # Check if there's input ready to be read
-                if select.select([sys.stdin], [], [], 0)[0]:
-                    char = sys.stdin.read(1)
-
-                    # Handle special keys
-                    if ord(char) == 3:  # Ctrl+C
-                        raise KeyboardInterrupt
-
-                    # Handle Enter key
-                    if char == '\r' or char == '\n':
-                        sys.stdout.write('\n')
-                        sys.stdout.flush()
-                        break
-
-                    # Handle backspace
-                    if ord(char) == 127:
-                        if user_input:
-                            user_input = user_input[:-1]
-                            sys.stdout.write('\b \b')  # Erase character
-                            sys.stdout.flush()
-                    else:
-                        user_input += char
-                        sys.stdout.write(char)
-                        sys.stdout.flush()
-
-                # Yield to other threads, prevents CPU hogging
-                time.sleep(0.01)
-
-            # Restore terminal settings for normal processing
-            termios.tcsetattr(sys.stdin, termios.TCSADRAIN, old_settings)
+            try:
+                user_input = await read_line(reader, editor, feed)
+            except EOFError:
+                user_input = ".exit"
 
             # Check for exit command
             if user_input.lower() in ['.exit', '.quit']:
                 print("Exiting application...")
                 break
 
+            if user_input.split()[:1] == [".feed"]:
+                handle_feed_command(feed, user_input)
+                continue
+
+            if user_input.split()[:1] in ([".prof"], [".mem"], [".stacks"]):
+                handle_profile_command(user_input)
+                continue
+
             # Process the user's message using the agent with streaming
             sys.stdout.write("\nOperator: ")
             sys.stdout.flush()
-            run_agent(user_input, stream_handler=stream_output)
+            await run_turn(reader, user_input)
             # Add a new line after the streaming response
             sys.stdout.write("\n")
             sys.stdout.flush()
@@ -133,5 +333,8 @@ d88P     888  "Y8888P"  8888888888 888    Y888     888
         logger.error(f"Error in chat interface: {e}", exc_info=True)
         print(f"\nAn error occurred: {e}")
     finally:
+        warm_up.cancel()
+        feed.stop()
+        reader.stop()
         # Restore terminal settings
         reset_terminal()
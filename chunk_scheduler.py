@@ -0,0 +1,155 @@
+import heapq
+import itertools
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+import audio_features
+
+# Get logger for this module
+logger = logging.getLogger("sigint_chunk_scheduler")
+
+# Seconds a chunk may wait before it is served ahead of better scored ones
+max_chunk_age = float(os.environ.get("CHUNK_MAX_AGE", "120"))
+
+# Half the frames voiced is as speech-like as a radio chunk gets
+FULL_SPEECH_FRACTION = 0.5
+
+
+def score_chunk(data: bytes) -> float:
+    """Speech likelihood of a PCM chunk, from 0 (noise) to 1.
+
+    Cheap enough to run on the capture thread: about 30 ms for a
+    30 second chunk.
+    """
+    features = audio_features.chunk_features(data)
+    speech = min(1.0, features["speech_fraction"] / FULL_SPEECH_FRACTION)
+    return (
+        0.5 * speech
+        + 0.2 * features["speech_band_ratio"]
+        + 0.15 * (1 - features["spectral_flatness"])
+        + 0.15 * max(0.0, 1 - features["zero_crossing_rate"] / 0.5)
+    )
+
+
+class _Entry:
+    __slots__ = ("item", "score", "enqueued", "served")
+
+    def __init__(self, item, score: float):
+        self.item = item
+        self.score = score
+        self.enqueued = time.monotonic()
+        self.served = False
+
+
+class ChunkScheduler:
+    """Queue of audio chunks for transcription, served by speech likelihood.
+
+    Drop-in replacement for the `queue.Queue` in front of transcription
+    (put, get, get_nowait, task_done, join, qsize, empty). When
+    transcription falls behind, the chunks most likely to contain speech
+    are served first. A chunk waiting longer than `max_age` seconds is
+    served before any other, so marginal audio is delayed but never
+    starved. `None`, the stop sentinel, is served once no chunk is left.
+    """
+
+    def __init__(self, max_age: float = None, score=None):
+        self.max_age = max_chunk_age if max_age is None else max_age
+        # Items are (in_data, index, capture_time) tuples
+        self.score = score or (lambda item: score_chunk(item[0]))
+        self._heap = []
+        self._arrivals = deque()
+        self._counter = itertools.count()
+        self._pending = 0
+        self._sentinels = 0
+        self._unfinished = 0
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._all_done = threading.Condition(self._lock)
+        self.served = 0
+        self.served_by_age = 0
+
+    def put(self, item, block=True, timeout=None):
+        # Scored before taking the lock, getters are not held up by it
+        entry = None if item is None else _Entry(item, self.score(item))
+        with self._lock:
+            if entry is None:
+                self._sentinels += 1
+            else:
+                heapq.heappush(
+                    self._heap, (-entry.score, next(self._counter), entry))
+                self._arrivals.append(entry)
+                self._pending += 1
+                logger.debug("Queued chunk with score %.2f", entry.score)
+            self._unfinished += 1
+            self._not_empty.notify()
+
+    def _pop(self):
+        while self._arrivals and self._arrivals[0].served:
+            self._arrivals.popleft()
+        if self._arrivals and \
+                time.monotonic() - self._arrivals[0].enqueued >= self.max_age:
+            entry = self._arrivals.popleft()
+            self.served_by_age += 1
+        else:
+            while True:
+                _, _, entry = heapq.heappop(self._heap)
+                if not entry.served:
+                    break
+        entry.served = True
+        self._pending -= 1
+        self.served += 1
+        return entry.item
+
+    def get(self, block=True, timeout=None):
+        with self._not_empty:
+            deadline = None if timeout is None \
+                else time.monotonic() + timeout
+            while not self._pending and not self._sentinels:
+                if not block:
+                    raise queue.Empty
+                if deadline is None:
+                    self._not_empty.wait()
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise queue.Empty
+                    self._not_empty.wait(remaining)
+            if self._pending:
+                return self._pop()
+            self._sentinels -= 1
+            return None
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def task_done(self):
+        with self._lock:
+            if self._unfinished <= 0:
+                raise ValueError("task_done() called too many times")
+            self._unfinished -= 1
+            if not self._unfinished:
+                self._all_done.notify_all()
+
+    def join(self):
+        with self._all_done:
+            while self._unfinished:
+                self._all_done.wait()
+
+    def qsize(self) -> int:
+        with self._lock:
+            return self._pending + self._sentinels
+
+    def empty(self) -> bool:
+        return not self.qsize()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                "pending": self._pending,
+                "served": self.served,
+                "served_by_age": self.served_by_age,
+            }
@@ -0,0 +1,190 @@
+import difflib
+import json
+import os
+import re
+import logging
+
+# Get logger for this module
+logger = logging.getLogger("sigint_agent.compaction")
+
+# Token budget for a single tool result entering the LLM context
+tool_token_budget = int(os.environ.get("TOOL_TOKEN_BUDGET", "2000"))
+
+# Intercepts at least this similar to an already kept one are merged
+similarity_threshold = 0.9
+
+# How many of the most recently kept intercepts to compare against
+similarity_window = 20
+
+_punctuation_re = re.compile(r"[^\w\s]", re.UNICODE)
+_whitespace_re = re.compile(r"\s+")
+
+
+def estimate_tokens(text: str) -> int:
+    """Roughly estimate the number of LLM tokens in a string.
+
+    Uses the common ~4 characters per token heuristic, which is close
+    enough for budgeting without pulling in a tokenizer.
+
+    Args:
+        text (str): The text to measure
+
+    Returns:
+        int: The estimated token count
+    """
+    return (len(text) + 3) // 4
+
+
+def normalize_text(text: str) -> str:
+    """Normalize an intercept for duplicate detection.
+
+    Args:
+        text (str): The raw transcript text
+
+    Returns:
+        str: Lower-cased text without punctuation or repeated whitespace
+    """
+    text = _punctuation_re.sub(" ", text.lower())
+    return _whitespace_re.sub(" ", text).strip()
+
+
+def format_offset(seconds: float) -> str:
+    """Format a number of seconds as a compact relative offset (+MM:SS)."""
+    seconds = int(round(seconds))
+    hours, remainder = divmod(seconds, 3600)
+    minutes, secs = divmod(remainder, 60)
+    if hours:
+        return f"+{hours}:{minutes:02d}:{secs:02d}"
+    return f"+{minutes:02d}:{secs:02d}"
+
+
+def dedupe_transcripts(transcripts):
+    """Merge repeated or near-identical intercepts.
+
+    Args:
+        transcripts (list): Transcript instances ordered by timestamp
+
+    Returns:
+        tuple: (entries, duplicates) where entries is a list of dicts with
+        the first transcript of each group and its repeat count, and
+        duplicates is the number of merged intercepts
+    """
+    entries = []
+    seen = {}
+    duplicates = 0
+    for transcript in transcripts:
+        key = normalize_text(transcript.text)
+        if not key:
+            duplicates += 1
+            continue
+
+        match = seen.get(key)
+        if match is None:
+            for entry in entries[-similarity_window:]:
+                matcher = difflib.SequenceMatcher(None, key, entry["key"])
+                # quick_ratio is an upper bound, skip the full diff if low
+                if matcher.quick_ratio() >= similarity_threshold and \
+                        matcher.ratio() >= similarity_threshold:
+                    match = entry
+                    break
+
+        if match is not None:
+            match["repeats"] += 1
+            match["last"] = transcript.timestamp
+            duplicates += 1
+            continue
+
+        entry = {
+            "key": key,
+            "text": transcript.text.strip(),
+            "first": transcript.timestamp,
+            "last": transcript.timestamp,
+            "repeats": 1,
+        }
+        seen[key] = entry
+        entries.append(entry)
+    return entries, duplicates
+
+
+def sample_evenly(items: list, count: int) -> list:
+    """Pick `count` items spread evenly over the list, keeping both ends."""
+    if count >= len(items):
+        return list(items)
+    if count <= 0:
+        return []
+    if count == 1:
+        return [items[-1]]
+    step = (len(items) - 1) / (count - 1)
+    return [items[round(i * step)] for i in range(count)]
+
+
+def compact_transcripts(transcripts, token_budget=None) -> str:
+    """Serialize transcripts for the LLM within a token budget.
+
+    Repeated intercepts are merged, timestamps are collapsed into offsets
+    relative to the first intercept and, if the result still exceeds the
+    budget, the intercepts are sampled evenly over the time window. The
+    returned JSON reports everything that was elided.
+
+    Args:
+        transcripts (list): Transcript instances ordered by timestamp
+        token_budget (int, optional): Maximum estimated tokens for the result
+
+    Returns:
+        str: JSON encoded tool result
+    """
+    if token_budget is None:
+        token_budget = tool_token_budget
+
+    transcripts = list(transcripts)
+    if not transcripts:
+        return json.dumps({"result": []})
+
+    entries, duplicates = dedupe_transcripts(transcripts)
+    start = transcripts[0].timestamp
+
+    def serialize(selected, sampled_out):
+        result = []
+        for entry in selected:
+            item = {
+                "t": format_offset((entry["first"] - start).total_seconds()),
+                "text": entry["text"],
+            }
+            if entry["repeats"] > 1:
+                item["repeats"] = entry["repeats"]
+                item["until"] = format_offset(
+                    (entry["last"] - start).total_seconds())
+            result.append(item)
+        payload = {"start": start.isoformat(timespec="seconds"),
+                   "result": result}
+        if duplicates or sampled_out:
+            payload["elided"] = {
+                "total": len(transcripts),
+                "shown": len(selected),
+                "duplicates": duplicates,
+                "sampled_out": sampled_out,
+            }
+        return json.dumps(payload, ensure_ascii=False)
+
+    result = serialize(entries, 0)
+    tokens = estimate_tokens(result)
+    if tokens <= token_budget:
+        logger.debug(
+            f"Compacted {len(transcripts)} transcripts to {len(entries)} "
+            f"entries (~{tokens} tokens)")
+        return result
+
+    # Over budget: estimate how many entries fit and shrink until they do
+    keep = max(1, int(len(entries) * token_budget / tokens))
+    while True:
+        selected = sample_evenly(entries, keep)
+        result = serialize(selected, len(entries) - len(selected))
+        tokens = estimate_tokens(result)
+        if tokens <= token_budget or keep == 1:
+            break
+        keep = max(1, min(keep - 1, int(keep * token_budget / tokens)))
+
+    logger.info(
+        f"Compacted {len(transcripts)} transcripts to {len(selected)} "
+        f"entries (~{tokens} tokens, budget {token_budget})")
+    return result
@@ -1,14 +1,18 @@
 import datetime
 import os
 import logging
+
+import events
 from peewee import (
     BooleanField,
     CharField,
     DateTimeField,
+    FloatField,
     Model,
     SqliteDatabase,
     DoesNotExist
 )
+from playhouse.migrate import SqliteMigrator, migrate
 
 # Get logger for this module
 logger = logging.getLogger("sigint_database")
@@ -21,17 +25,21 @@ db = SqliteDatabase(database_name)
 
 
 class Transcript(Model):
-    timestamp = DateTimeField(default=datetime.datetime.now())
+    timestamp = DateTimeField(default=datetime.datetime.now)
     text = CharField(null=False)
     frequency = CharField(null=True)
     source_file = CharField(null=True)
+    language = CharField(null=True)
+    # Offsets in seconds of the transcribed audio in source_file
+    clip_start = FloatField(null=True)
+    clip_end = FloatField(null=True)
 
     class Meta:
         database = db
 
 
 class Session(Model):
-    timestamp = DateTimeField(default=datetime.datetime.now())
+    timestamp = DateTimeField(default=datetime.datetime.now)
     frequency = CharField(null=True)
     is_active = BooleanField(default=True)
 
@@ -44,6 +52,7 @@ def initialize_db():
     logger.info(f"Initializing database: {database_name}")
     db.connect()
     db.create_tables([Transcript, Session])
+    migrate_db()
 
     # Create default session if none exists
     try:
@@ -53,7 +62,24 @@ def initialize_db():
         save_session("unknown")
 
 
-def save_transcript(text, frequency, timestamp=None, source_file=None):
+def migrate_db():
+    """Add the columns introduced since an existing database was created."""
+    table = Transcript._meta.table_name
+    columns = {column.name for column in db.get_columns(table)}
+    added = [
+        ("language", CharField(null=True)),
+        ("clip_start", FloatField(null=True)),
+        ("clip_end", FloatField(null=True)),
+    ]
+    migrator = SqliteMigrator(db)
+    for name, field in added:
+        if name not in columns:
+            logger.info(f"Adding {name} column to {table}")
+            migrate(migrator.add_column(table, name, field))
+
+
+def save_transcript(text, frequency, timestamp=None, source_file=None,
+                    language=None, clip_start=None, clip_end=None):
     """Save a transcript to the database.
 
     Args:
@@ -61,6 +87,10 @@ def save_transcript(text, frequency, timestamp=None, source_file=None):
         frequency (str): The frequency when the transcript was recorded
         timestamp (datetime, optional): When the audio was captured
         source_file (str, optional): The name of the source audio file
+        language (str, optional): ISO 639-1 code of the transcription
+        clip_start (float, optional): Offset in seconds of the transcribed
+            audio in the source file
+        clip_end (float, optional): Offset in seconds of its end
 
     Returns:
         Transcript: The saved transcript instance
@@ -72,11 +102,28 @@ def save_transcript(text, frequency, timestamp=None, source_file=None):
         timestamp=timestamp or datetime.datetime.now(),
         frequency=frequency,
         source_file=source_file,
+        language=language,
+        clip_start=clip_start,
+        clip_end=clip_end,
     )
-    t.save()
+    events.publish(events.TRANSCRIPT, transcript_event(t))
     return t
 
 
+def transcript_event(transcript):
+    """Serialize a transcript for event subscribers and API clients."""
+    return {
+        "id": transcript.id,
+        "timestamp": transcript.timestamp.isoformat(),
+        "frequency": transcript.frequency,
+        "text": transcript.text,
+        "source_file": transcript.source_file,
+        "language": transcript.language,
+        "clip_start": transcript.clip_start,
+        "clip_end": transcript.clip_end,
+    }
+
+
 def get_transcripts(frequency, max_results=100):
     """Get all transcripts for a given frequency.
 
@@ -105,25 +152,88 @@ def get_last_transcripts(frequency, last_minutes=5):
     cutoff = datetime.datetime.now() - datetime.timedelta(minutes=last_minutes)
     return Transcript.select().where(
         (Transcript.frequency == frequency) & (Transcript.timestamp > cutoff)
-    )
+    ).order_by(Transcript.timestamp)
+
+
+def get_transcripts_page(frequency=None, before_id=None, limit=50):
+    """Get a page of transcripts, newest first.
+
+    Uses keyset pagination on the id so every page is an index lookup,
+    however deep the client pages.
+
+    Args:
+        frequency (str, optional): Only transcripts for this frequency
+        before_id (int, optional): Only transcripts older than this id
+        limit (int, optional): The maximum number of results to return
+
+    Returns:
+        list: A list of Transcript instances
+    """
+    query = Transcript.select().order_by(Transcript.id.desc()).limit(limit)
+    if frequency is not None:
+        query = query.where(Transcript.frequency == str(frequency))
+    if before_id is not None:
+        query = query.where(Transcript.id < before_id)
+    return list(query)
 
 
-def save_session(frequency):
+def save_session(frequency, timestamp=None):
     """Save a session to the database. Deactivate any existing session.
 
     Args:
         frequency (str): The frequency of the session
+        timestamp (datetime, optional): When the receiver was tuned
 
     Returns:
         Session: The created session
     """
     logger.info(f"Creating new session with frequency: {frequency}")
-    Session.update(is_active=False).where(Session.is_active).execute()
-    s = Session.create(frequency=frequency)
-    s.save()
+    with db.atomic():
+        Session.update(is_active=False).where(Session.is_active).execute()
+        s = Session.create(
+            frequency=frequency,
+            timestamp=timestamp or datetime.datetime.now(),
+        )
     return s
 
 
+def get_session_for_window(start, end):
+    """Get the session the receiver spent most of a time window on.
+
+    Used to attribute captured audio to the frequency it was recorded on,
+    even when the receiver was retuned while the audio waited in the queue.
+
+    Args:
+        start (datetime): Start of the window
+        end (datetime): End of the window
+
+    Returns:
+        Session: The session overlapping the window the most
+    """
+    sessions = list(
+        Session.select()
+        .where((Session.timestamp > start) & (Session.timestamp < end))
+        .order_by(Session.timestamp)
+    )
+    previous = Session.select() \
+        .where(Session.timestamp <= start) \
+        .order_by(Session.timestamp.desc(), Session.id.desc()) \
+        .first()
+    if previous is not None:
+        sessions.insert(0, previous)
+    if not sessions:
+        return get_current_session()
+
+    best, best_overlap = None, None
+    for i, session in enumerate(sessions):
+        session_end = sessions[i + 1].timestamp \
+            if i + 1 < len(sessions) else end
+        overlap = min(session_end, end) - max(session.timestamp, start)
+        if best_overlap is None or overlap >= best_overlap:
+            best, best_overlap = session, overlap
+    return best
+
+
 def get_current_session():
     """Get the current session from the database.
 
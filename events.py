@@ -0,0 +1,121 @@
+import logging
+import queue
+import threading
+
+# Get logger for this module
+logger = logging.getLogger("sigint_events")
+
+# Topic published by database.save_transcript for every new intercept
+TRANSCRIPT = "transcript"
+
+
+class Subscription:
+    """Bounded queue of events delivered to one subscriber.
+
+    When the subscriber falls behind, the oldest events are dropped (and
+    counted) so a slow consumer never blocks the publisher.
+    """
+
+    def __init__(self, bus, topic: str, maxsize: int = 100,
+                 predicate=None, callback=None):
+        self.bus = bus
+        self.topic = topic
+        self.predicate = predicate
+        self.callback = callback
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def deliver(self, event):
+        if self.predicate is not None and not self.predicate(event):
+            return
+        while True:
+            try:
+                self.queue.put_nowait(event)
+                break
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+        if self.callback is not None:
+            # Runs on the publisher thread, must be cheap and non-blocking
+            self.callback(self)
+
+    def get(self, timeout=None):
+        """Wait for the next event, raises queue.Empty on timeout."""
+        return self.queue.get(timeout=timeout)
+
+    def drain(self) -> list:
+        """Get all queued events without waiting."""
+        events = []
+        while True:
+            try:
+                events.append(self.queue.get_nowait())
+            except queue.Empty:
+                return events
+
+    def close(self):
+        self.bus.unsubscribe(self)
+
+
+class EventBus:
+    """In-process publish/subscribe bus with bounded subscriber queues."""
+
+    def __init__(self):
+        self._subscriptions = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, topic: str, predicate=None, maxsize: int = 100,
+                  callback=None) -> Subscription:
+        """Subscribe to a topic.
+
+        Args:
+            topic (str): The topic to receive events from
+            predicate (callable, optional): Only events for which it
+                returns True are queued
+            maxsize (int, optional): Maximum number of queued events
+            callback (callable, optional): Called with the subscription
+                on the publisher thread after an event is queued
+
+        Returns:
+            Subscription: The subscription to read events from
+        """
+        subscription = Subscription(
+            self, topic, maxsize, predicate, callback)
+        with self._lock:
+            # Copy on write, publish iterates without holding the lock
+            subscriptions = list(self._subscriptions.get(topic, ()))
+            subscriptions.append(subscription)
+            self._subscriptions[topic] = subscriptions
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            subscriptions = [
+                s for s in self._subscriptions.get(subscription.topic, ())
+                if s is not subscription
+            ]
+            self._subscriptions[subscription.topic] = subscriptions
+
+    def publish(self, topic: str, event):
+        """Deliver an event to every subscriber of the topic."""
+        for subscription in self._subscriptions.get(topic, ()):
+            try:
+                subscription.deliver(event)
+            except Exception as e:
+                logger.error(
+                    f"Error delivering {topic} event: {e}", exc_info=True)
+
+
+# Bus shared by the whole application
+bus = EventBus()
+
+
+def subscribe(topic: str, predicate=None, maxsize: int = 100,
+              callback=None) -> Subscription:
+    return bus.subscribe(topic, predicate, maxsize, callback)
+
+
+def publish(topic: str, event):
+    bus.publish(topic, event)
@@ -0,0 +1,233 @@
+"""Bulk export of intercepts to JSONL, CSV or Parquet.
+
+Transcripts are read in bounded keyset batches and written as they are
+read, so memory use does not depend on the size of the database.
+
+Example:
+    python export.py --format csv --gzip --frequency-min 145 \\
+        --frequency-max 146 --since 2025-01-01 -o intercepts.csv.gz
+"""
+import argparse
+import csv
+import datetime
+import gzip
+import io
+import json
+import logging
+import sys
+
+import database
+from database import Transcript
+from intents import parse_frequency
+
+logger = logging.getLogger("sigint_export")
+
+FORMATS = ("jsonl", "csv", "parquet")
+COLUMNS = ["id", "timestamp", "frequency", "text", "language",
+           "source_file", "clip_start", "clip_end"]
+BATCH_SIZE = 5000
+
+
+def build_filters(frequency_min=None, frequency_max=None, channels=None,
+                  start=None, end=None) -> list:
+    """Query conditions for the given filters (frequencies in Hz)."""
+    conditions = []
+    # Frequencies are stored as text, compare them as numbers
+    frequency = Transcript.frequency.cast("INTEGER")
+    if frequency_min is not None:
+        conditions.append(frequency >= frequency_min)
+    if frequency_max is not None:
+        conditions.append(frequency <= frequency_max)
+    if channels:
+        conditions.append(
+            Transcript.frequency.in_(
+                [str(c) for c in channels if c is not None]))
+    if start is not None:
+        conditions.append(Transcript.timestamp >= start)
+    if end is not None:
+        conditions.append(Transcript.timestamp < end)
+    return conditions
+
+
+def iter_batches(batch_size: int = BATCH_SIZE, **filters):
+    """Yield the matching transcripts as lists of row dicts, oldest first.
+
+    Each batch is one indexed range query on the id, the database is not
+    held between batches.
+    """
+    conditions = build_filters(**filters)
+    last_id = 0
+    while True:
+        query = Transcript.select().where(Transcript.id > last_id)
+        for condition in conditions:
+            query = query.where(condition)
+        rows = list(query.order_by(Transcript.id).limit(batch_size).dicts())
+        if not rows:
+            return
+        last_id = rows[-1]["id"]
+        for row in rows:
+            row["timestamp"] = row["timestamp"].isoformat()
+            try:
+                row["frequency"] = int(row["frequency"])
+            except (TypeError, ValueError):
+                row["frequency"] = None
+        yield [{column: row.get(column) for column in COLUMNS}
+               for row in rows]
+
+
+def encode_batch(batch: list, fmt: str, header: bool = False) -> str:
+    """Encode rows as JSONL or CSV text."""
+    if fmt == "jsonl":
+        return "".join(
+            json.dumps(row, ensure_ascii=False) + "\n" for row in batch)
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=COLUMNS)
+    if header:
+        writer.writeheader()
+    writer.writerows(batch)
+    return buffer.getvalue()
+
+
+def write_text(stream, batches, fmt: str) -> int:
+    count = 0
+    if fmt == "csv":
+        stream.write(encode_batch([], fmt, header=True))
+    for batch in batches:
+        stream.write(encode_batch(batch, fmt))
+        count += len(batch)
+    return count
+
+
+def write_parquet(path: str, batches, compress: bool = False) -> int:
+    """Write one Parquet row group per batch."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export requires pyarrow "
+                           "(pip install pyarrow)")
+    schema = pa.schema([
+        ("id", pa.int64()),
+        ("timestamp", pa.timestamp("us")),
+        ("frequency", pa.int64()),
+        ("text", pa.string()),
+        ("language", pa.string()),
+        ("source_file", pa.string()),
+        ("clip_start", pa.float64()),
+        ("clip_end", pa.float64()),
+    ])
+    count = 0
+    with pq.ParquetWriter(path, schema,
+                          compression="zstd" if compress else "snappy") \
+            as writer:
+        for batch in batches:
+            for row in batch:
+                row["timestamp"] = datetime.datetime.fromisoformat(
+                    row["timestamp"])
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+            count += len(batch)
+    return count
+
+
+def export_transcripts(output: str, fmt: str = "jsonl",
+                       compress: bool = False,
+                       batch_size: int = BATCH_SIZE, **filters) -> int:
+    """Export the transcripts matching the filters to a file.
+
+    Args:
+        output (str): File path, "-" for stdout (JSONL and CSV only)
+        fmt (str): "jsonl", "csv" or "parquet"
+        compress (bool): Gzip JSONL/CSV, zstd for Parquet
+        batch_size (int): Rows read per query
+        **filters: frequency_min, frequency_max (Hz), channels (list of
+            Hz), start and end (datetime)
+
+    Returns:
+        int: The number of exported transcripts
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    batches = iter_batches(batch_size, **filters)
+    if fmt == "parquet":
+        if output == "-":
+            raise ValueError("Parquet cannot be written to stdout")
+        return write_parquet(output, batches, compress)
+
+    if output == "-":
+        if compress:
+            with gzip.GzipFile(fileobj=sys.stdout.buffer, mode="wb") as raw:
+                with io.TextIOWrapper(raw, encoding="utf-8",
+                                      newline="") as stream:
+                    return write_text(stream, batches, fmt)
+        return write_text(sys.stdout, batches, fmt)
+    if compress:
+        with gzip.open(output, "wt", encoding="utf-8", newline="") as stream:
+            return write_text(stream, batches, fmt)
+    with open(output, "w", encoding="utf-8", newline="") as stream:
+        return write_text(stream, batches, fmt)
+
+
+def _frequency_arg(value: str) -> int:
+    try:
+        frequency = parse_frequency(value)
+    except ValueError:
+        frequency = None
+    if frequency is None:
+        raise argparse.ArgumentTypeError(f"invalid frequency: {value}")
+    return frequency
+
+
+def _time_arg(value: str) -> datetime.datetime:
+    try:
+        return datetime.datetime.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid ISO time: {value}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Export intercepts to JSONL, CSV or Parquet")
+    parser.add_argument("-o", "--output", default="-",
+                        help="Output file, - for stdout (default)")
+    parser.add_argument("-f", "--format", choices=FORMATS, default="jsonl",
+                        help="Output format (default: jsonl)")
+    parser.add_argument("--gzip", action="store_true",
+                        help="Compress the output (zstd for Parquet)")
+    parser.add_argument("--frequency-min", type=_frequency_arg,
+                        help="Lowest frequency (MHz if decimal)")
+    parser.add_argument("--frequency-max", type=_frequency_arg,
+                        help="Highest frequency (MHz if decimal)")
+    parser.add_argument("--channel", type=_frequency_arg, action="append",
+                        dest="channels",
+                        help="Only this frequency (repeatable)")
+    parser.add_argument("--since", type=_time_arg,
+                        help="Start time, ISO format")
+    parser.add_argument("--until", type=_time_arg,
+                        help="End time (exclusive), ISO format")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE,
+                        help="Rows read per query")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    args = parse_args(argv)
+    database.db.connect()
+    database.migrate_db()
+    try:
+        count = export_transcripts(
+            args.output, args.format, args.gzip, args.batch_size,
+            frequency_min=args.frequency_min,
+            frequency_max=args.frequency_max,
+            channels=args.channels, start=args.since, end=args.until)
+    except (ValueError, RuntimeError) as e:
+        raise SystemExit(str(e))
+    finally:
+        database.db.close()
+    logger.info(f"Exported {count} intercepts")
+
+
+if __name__ == "__main__":
+    main()
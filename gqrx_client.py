@@ -1,59 +1,154 @@
 import socket
 import os
 import logging
+import threading
+import time
 
 # Get logger for this module
 logger = logging.getLogger('gqrx_client')
 
-gqrx_host = os.environ['GQRX_HOST']
+GQRX_PORT = 7356
 
-# Move socket creation into the connect function
-connected = False
-sock = None
+# Plain commands whose successful reply spans more than one line
+# (m: demodulator mode and passband)
+reply_lines = {"m": 2}
+
+
+class GqrxClient:
+    """Persistent, thread-safe connection to the GQRX remote control port.
+
+    Replies are parsed on line boundaries: most commands answer with one
+    line, `m` with two and extended (`+`) commands with several lines
+    terminated by an `RPRT` line. Commands sent together with
+    `send_batch` are pipelined in a single write. A broken connection is
+    re-established transparently with exponential backoff.
+    """
+
+    def __init__(self, host=None, port=None, timeout=5, max_retries=3,
+                 backoff=0.2, max_backoff=5.0):
+        self._host = host
+        self._port = port
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._lock = threading.RLock()
+        self._sock = None
+        self._reader = None
+
+    @property
+    def host(self):
+        # Read lazily so importing this module needs no environment
+        return self._host or os.environ.get("GQRX_HOST", "127.0.0.1")
+
+    @property
+    def port(self):
+        return self._port or int(os.environ.get("GQRX_PORT", GQRX_PORT))
+
+    @property
+    def connected(self):
+        return self._sock is not None
+
+    def connect(self):
+        with self._lock:
+            if self._sock is not None:
+                return
+            sock = socket.create_connection(
+                (self.host, self.port), timeout=self.timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._sock = sock
+            self._reader = sock.makefile("rb")
+            logger.info(f"Connected to GQRX at {self.host}:{self.port}")
+
+    def close(self):
+        with self._lock:
+            if self._sock is None:
+                return
+            try:
+                self._reader.close()
+                self._sock.close()
+            except OSError as e:
+                logger.debug(f"Error closing GQRX connection: {e}")
+            self._sock = None
+            self._reader = None
+            logger.info("Connection closed")
+
+    def _read_line(self) -> str:
+        line = self._reader.readline()
+        if not line:
+            raise ConnectionError("GQRX closed the connection")
+        return line.decode("utf-8", errors="replace").rstrip("\r\n")
+
+    def _read_reply(self, command: str) -> str:
+        lines = [self._read_line()]
+        if command.startswith("+"):
+            # Extended responses always end with the RPRT status line
+            while not lines[-1].startswith("RPRT"):
+                lines.append(self._read_line())
+        elif not lines[0].startswith("RPRT"):
+            name = command.split(" ", 1)[0]
+            for _ in range(reply_lines.get(name, 1) - 1):
+                lines.append(self._read_line())
+        return "\n".join(lines).strip()
+
+    def send_batch(self, commands: list) -> list:
+        """Send several commands in one write and read all their replies.
+
+        Args:
+            commands (list): Remote control commands, without newlines
+
+        Returns:
+            list: The reply of each command, in order
+        """
+        commands = [command.strip() for command in commands]
+        payload = "".join(f"{command}\n" for command in commands)
+        attempt = 0
+        with self._lock:
+            while True:
+                try:
+                    self.connect()
+                    logger.debug(f"Sending commands: {commands}")
+                    self._sock.sendall(payload.encode("utf-8"))
+                    replies = [self._read_reply(c) for c in commands]
+                    logger.debug(f"Responses: {replies}")
+                    return replies
+                except (OSError, ConnectionError) as e:
+                    # A timeout or a broken pipe leaves the line framing
+                    # in an unknown state, always start over
+                    self.close()
+                    if attempt >= self.max_retries:
+                        logger.error(f"Socket error: {e}")
+                        raise
+                    delay = min(self.backoff * 2 ** attempt, self.max_backoff)
+                    attempt += 1
+                    logger.warning(
+                        f"GQRX connection error ({e}), reconnecting in "
+                        f"{delay:.1f}s (attempt {attempt}/{self.max_retries})")
+                    time.sleep(delay)
+
+    def send(self, command: str) -> str:
+        """Send a single command and return its reply."""
+        logger.info(f"Sending command: {command.strip()}")
+        response = self.send_batch([command])[0]
+        logger.info(f"Response: {response}")
+        return response
+
+
+# Connection shared by the whole application
+client = GqrxClient()
 
 
 def connect():
-    global connected, sock
-    # Create a new socket each time we connect
-    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    sock.settimeout(5)  # Set a 5-second timeout
-    try:
-        sock.connect((gqrx_host, 7356))
-        connected = True
-        logger.info(f"Connected to GQRX at {gqrx_host}:7356")
-    except socket.error as e:
-        logger.error(f"Connection error: {e}")
-        raise
+    client.connect()
 
 
 def close():
-    global connected, sock
-    if sock:
-        sock.close()
-    connected = False
-    logger.info("Connection closed")
+    client.close()
 
 
 def send(command: str) -> str:
-    global connected, sock
-    if not connected:
-        connect()
-
-    logger.info(f"Sending command: {command}")
-
-    # Ensure command ends with newline
-    if not command.endswith('\n'):
-        command += '\n'
-
-    try:
-        sock.sendall(command.encode('utf-8'))
-        response = sock.recv(1024).decode('utf-8')
-        logger.info(f"Response: {response.strip()}")
-        return response.strip()
-    except socket.timeout:
-        logger.error("Socket timeout - no response received")
-        raise
-    except socket.error as e:
-        logger.error(f"Socket error: {e}")
-        connected = False
-        raise
+    return client.send(command)
+
+
+def send_batch(commands: list) -> list:
+    return client.send_batch(commands)
@@ -0,0 +1,343 @@
+"""Stand-in for GQRX for lab and load testing without radio hardware.
+
+Implements the subset of the GQRX remote control protocol used by the
+agent (frequency, signal level, squelch and mode get/set) on TCP and
+streams 48 kHz mono s16le audio over UDP like GQRX's UDP output. The audio
+follows the tuned frequency: channels declared active transmit in bursts,
+using synthetic speech-like audio or a recorded WAV file, everything else
+is band noise (or silence while the squelch is closed).
+
+Example:
+    python gqrx_emulator.py --active 145.500 --active 146.025=clip.wav \\
+        --latency-ms 20 --error-rate 0.01
+
+`--check-squelch` checks that the spectral squelch of the agent passes the
+speech of the active channels and rejects the band noise, then exits.
+"""
+import argparse
+import asyncio
+import logging
+import random
+import socket
+import time
+import wave
+
+import numpy as np
+
+import audio_features
+import spectral_squelch
+from intents import parse_frequency
+
+logger = logging.getLogger("gqrx_emulator")
+
+SAMPLE_RATE = 48000
+# GQRX sends small datagrams, 10 ms of audio each
+PACKET_SAMPLES = 480
+NOISE_FLOOR_DBFS = -95.0
+SIGNAL_DBFS = -30.0
+SQUELCH_OFF = -150.0
+# Formants (Hz) of the synthetic voice and top of the radio voice band
+FORMANTS = (700, 1200, 2500)
+VOICE_HIGH = 3400
+# Seconds of audio per squelch check
+CHECK_SECONDS = 10
+
+
+class Channel:
+    """Active channel transmitting in bursts."""
+
+    def __init__(self, frequency: int, recording=None):
+        self.frequency = frequency
+        self.recording = recording
+        self.position = 0
+        # Random phase so channels do not key up in lockstep
+        self.phase = random.random()
+
+    def transmitting(self, now: float, burst: float, duty: float) -> bool:
+        period = burst / duty
+        return ((now / period + self.phase) % 1.0) < duty
+
+    def read(self, count: int) -> np.ndarray:
+        if self.recording is None:
+            samples = synthetic_speech(self.position, count, self.frequency)
+        else:
+            indexes = (self.position + np.arange(count)) \
+                % len(self.recording)
+            samples = self.recording[indexes]
+        self.position += count
+        return samples
+
+
+def load_recording(path: str) -> np.ndarray:
+    """Load a mono 16-bit WAV recorded at 48 kHz as float samples."""
+    with wave.open(path, "rb") as wav_file:
+        if wav_file.getnchannels() != 1 or wav_file.getsampwidth() != 2:
+            raise ValueError(f"{path}: expected mono 16-bit audio")
+        if wav_file.getframerate() != SAMPLE_RATE:
+            raise ValueError(f"{path}: expected {SAMPLE_RATE} Hz audio")
+        data = wav_file.readframes(wav_file.getnframes())
+    return np.frombuffer(data, dtype=np.int16).astype(np.float32) / 32768
+
+
+def synthetic_speech(start: int, count: int, seed: int) -> np.ndarray:
+    """Generate voice-band audio with a syllable-rate envelope.
+
+    A glottal-like harmonic series (120-220 Hz fundamental) up to the top
+    of the radio voice band, weighted by vowel formants, and shaped by an
+    amplitude envelope at ~4 Hz: the kind of structure a speech detector
+    looks for, without being intelligible.
+    """
+    t = (start + np.arange(count)) / SAMPLE_RATE
+    f0 = 120 + (seed % 100)
+    pitch = f0 * (1 + 0.1 * np.sin(2 * np.pi * 0.7 * t))
+    phase = 2 * np.pi * np.cumsum(pitch) / SAMPLE_RATE + \
+        2 * np.pi * f0 * start / SAMPLE_RATE
+    harmonics = np.arange(1, int(VOICE_HIGH / f0) + 1)
+    # Glottal 1/k roll-off raised around the formants
+    gains = 1 / harmonics + sum(
+        np.exp(-((harmonics * f0 - formant) / 150.0) ** 2)
+        for formant in FORMANTS)
+    gains /= np.sqrt((gains ** 2).sum())
+    voice = sum(gain * np.sin(k * phase)
+                for k, gain in zip(harmonics, gains))
+    envelope = np.clip(np.sin(2 * np.pi * 4 * t), 0, None) ** 0.5
+    return (0.25 * voice * envelope).astype(np.float32)
+
+
+class Emulator:
+    def __init__(self, args):
+        self.args = args
+        self.frequency = parse_frequency(args.frequency)
+        self.squelch = SQUELCH_OFF
+        self.mode = "FM"
+        self.passband = 10000
+        self.channels = {}
+        for spec in args.active:
+            frequency, _, path = spec.partition("=")
+            recording = load_recording(path) if path else None
+            hz = parse_frequency(frequency)
+            self.channels[hz] = Channel(hz, recording)
+        self.started = time.monotonic()
+
+    def active_channel(self):
+        channel = self.channels.get(self.frequency)
+        if channel is None:
+            return None
+        now = time.monotonic() - self.started
+        if channel.transmitting(now, self.args.burst, self.args.duty):
+            return channel
+        return None
+
+    def signal_level(self) -> float:
+        base = SIGNAL_DBFS if self.active_channel() else NOISE_FLOOR_DBFS
+        return round(base + random.gauss(0, 1.5), 1)
+
+    def handle(self, line: str):
+        """Execute one remote control command.
+
+        Returns:
+            str: The reply, or None to drop the connection
+        """
+        parts = line.split()
+        if not parts:
+            return "RPRT 1"
+        command, params = parts[0], parts[1:]
+        if command in ("q", "c"):
+            return None
+        if command == "f":
+            return str(self.frequency)
+        if command == "F" and params:
+            try:
+                self.frequency = int(float(params[0]))
+            except ValueError:
+                return "RPRT 1"
+            return "RPRT 0"
+        if command == "l" and not params:
+            return str(self.signal_level())
+        if command == "l" and params == ["SQL"]:
+            return str(self.squelch)
+        if command == "L" and len(params) == 2 and params[0] == "SQL":
+            try:
+                self.squelch = float(params[1])
+            except ValueError:
+                return "RPRT 1"
+            return "RPRT 0"
+        if command == "m":
+            return f"{self.mode}\n{self.passband}"
+        if command == "M" and params:
+            self.mode = params[0]
+            if len(params) > 1:
+                self.passband = int(params[1])
+            return "RPRT 0"
+        return "RPRT 1"
+
+    async def handle_client(self, reader, writer):
+        peer = writer.get_extra_info("peername")
+        logger.info(f"Client connected: {peer}")
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if self.args.latency_ms or self.args.jitter_ms:
+                    delay = self.args.latency_ms + \
+                        random.uniform(0, self.args.jitter_ms)
+                    await asyncio.sleep(delay / 1000)
+                if random.random() < self.args.disconnect_rate:
+                    logger.info(f"Injected disconnect for {peer}")
+                    break
+                if random.random() < self.args.error_rate:
+                    reply = "RPRT 1"
+                else:
+                    reply = self.handle(line.decode(errors="replace"))
+                if reply is None:
+                    break
+                writer.write(f"{reply}\n".encode())
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+            logger.info(f"Client disconnected: {peer}")
+
+    def audio_packet(self) -> bytes:
+        channel = self.active_channel()
+        level = SIGNAL_DBFS if channel else NOISE_FLOOR_DBFS
+        if self.squelch > SQUELCH_OFF and level < self.squelch:
+            # GQRX mutes the audio while the squelch is closed
+            return bytes(PACKET_SAMPLES * 2)
+        samples = np.random.normal(
+            0, self.args.noise, PACKET_SAMPLES).astype(np.float32)
+        if channel:
+            samples += channel.read(PACKET_SAMPLES)
+        return (np.clip(samples, -1, 1) * 32767).astype("<i2").tobytes()
+
+    async def stream_audio(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        target = (self.args.audio_host, self.args.audio_port)
+        logger.info(f"Streaming audio to udp://{target[0]}:{target[1]}")
+        interval = PACKET_SAMPLES / SAMPLE_RATE * self.args.speed
+        next_packet = time.monotonic()
+        while True:
+            try:
+                sock.sendto(self.audio_packet(), target)
+            except OSError as e:
+                logger.debug(f"Error sending audio: {e}")
+            next_packet += interval
+            # Sleep against an absolute schedule so timing does not drift
+            await asyncio.sleep(max(0.0, next_packet - time.monotonic()))
+
+    async def serve(self):
+        server = await asyncio.start_server(
+            self.handle_client, self.args.host, self.args.port)
+        logger.info(
+            f"GQRX emulator listening on {self.args.host}:{self.args.port}, "
+            f"tuned to {self.frequency} Hz, "
+            f"{len(self.channels)} active channels")
+        async with server:
+            await asyncio.gather(server.serve_forever(), self.stream_audio())
+
+
+def _transcription_audio(samples: np.ndarray) -> bytes:
+    """Resample to the 16 kHz s16le audio FFmpeg feeds the transcription."""
+    ratio = SAMPLE_RATE // audio_features.SAMPLE_RATE
+    spectrum = np.fft.rfft(samples)
+    spectrum[len(spectrum) // ratio:] = 0
+    resampled = np.fft.irfft(spectrum, len(samples))[::ratio]
+    return (np.clip(resampled, -1, 1) * 32767).astype("<i2").tobytes()
+
+
+def check_squelch(args) -> bool:
+    """Gate emulated audio with the spectral squelch of the agent.
+
+    Every active channel must pass its speech over band noise, its speech
+    alone on a fresh channel (GQRX squelch open on a quiet channel), and
+    reject the band noise once the speech has been heard.
+
+    Returns:
+        bool: True when every check passed
+    """
+    count = SAMPLE_RATE * CHECK_SECONDS
+    specs = args.active or [args.frequency]
+    ok = True
+    for spec in specs:
+        frequency, _, path = spec.partition("=")
+        hz = parse_frequency(frequency)
+        speech = Channel(hz, load_recording(path) if path else None) \
+            .read(count)
+
+        def noise():
+            return np.random.normal(0, args.noise, count)
+        results = {
+            "speech over noise": spectral_squelch.gate(
+                _transcription_audio(noise()), hz) is None
+            and spectral_squelch.gate(
+                _transcription_audio(noise() + speech), hz) is not None,
+            "noise": spectral_squelch.gate(
+                _transcription_audio(noise()), hz) is None,
+            "speech alone": spectral_squelch.gate(
+                _transcription_audio(speech), f"fresh-{hz}") is not None,
+        }
+        for name, passed in results.items():
+            logger.info(f"{hz} Hz {name}: {'ok' if passed else 'FAILED'}")
+        ok = ok and all(results.values())
+    return ok
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Emulate the GQRX remote control and UDP audio output")
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="Remote control listen address")
+    parser.add_argument("--port", type=int, default=7356,
+                        help="Remote control port")
+    parser.add_argument("--audio-host", default="127.0.0.1",
+                        help="UDP audio destination host")
+    parser.add_argument("--audio-port", type=int, default=7355,
+                        help="UDP audio destination port")
+    parser.add_argument("--frequency", default="145.500",
+                        help="Initial frequency (MHz if decimal)")
+    parser.add_argument("--active", action="append", default=[],
+                        metavar="FREQ[=WAV]",
+                        help="Channel transmitting in bursts, optionally "
+                             "playing a 48 kHz mono WAV file (repeatable)")
+    parser.add_argument("--burst", type=float, default=5.0,
+                        help="Seconds per transmission")
+    parser.add_argument("--duty", type=float, default=0.3,
+                        help="Fraction of the time active channels transmit")
+    parser.add_argument("--noise", type=float, default=0.02,
+                        help="Band noise amplitude (0-1)")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="Audio packet interval multiplier, below 1 "
+                             "streams faster than real time")
+    parser.add_argument("--latency-ms", type=float, default=0.0,
+                        help="Delay added to every remote control reply")
+    parser.add_argument("--jitter-ms", type=float, default=0.0,
+                        help="Random extra delay added to every reply")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="Probability of replying RPRT 1")
+    parser.add_argument("--disconnect-rate", type=float, default=0.0,
+                        help="Probability of dropping the connection")
+    parser.add_argument("--check-squelch", action="store_true",
+                        help="Check that the spectral squelch passes the "
+                             "emulated speech and rejects noise, and exit")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    args = parse_args(argv)
+    if not 0 < args.duty <= 1:
+        raise SystemExit("--duty must be in (0, 1]")
+    if args.check_squelch:
+        raise SystemExit(0 if check_squelch(args) else 1)
+    try:
+        asyncio.run(Emulator(args).serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
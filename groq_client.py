@@ -0,0 +1,100 @@
+import os
+import logging
+import threading
+import time
+
+# Get logger for this module
+logger = logging.getLogger("sigint_groq_client")
+
+# Connection pool shared by every request to the GROQ API
+max_connections = int(os.environ.get("GROQ_MAX_CONNECTIONS", "10"))
+# Idle keep-alive connections are closed after this many seconds
+keepalive_expiry = float(os.environ.get("GROQ_KEEPALIVE", "120"))
+
+_client = None
+_async_client = None
+_lock = threading.Lock()
+
+
+def _limits():
+    import httpx
+    return httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_connections,
+        keepalive_expiry=keepalive_expiry,
+    )
+
+
+def get_client():
+    """Get the shared synchronous GROQ client, created on first use.
+
+    Used by the transcription worker and the tool threads, which all reuse
+    the same pool of keep-alive connections.
+    """
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                # Deferred, importing groq is a large part of startup time
+                import groq
+                _client = groq.Groq(
+                    http_client=groq.DefaultHttpxClient(limits=_limits()))
+                logger.info("Created GROQ client")
+    return _client
+
+
+def get_async_client():
+    """Get the shared asyncio GROQ client, created on first use.
+
+    The asyncio client keeps its own pool as its connections belong to the
+    event loop of the agent.
+    """
+    global _async_client
+    if _async_client is None:
+        with _lock:
+            if _async_client is None:
+                import groq
+                _async_client = groq.AsyncGroq(
+                    http_client=groq.DefaultAsyncHttpxClient(
+                        limits=_limits()))
+                logger.info("Created async GROQ client")
+    return _async_client
+
+
+def warm_up():
+    """Open a pooled connection to the API in the background.
+
+    The TLS handshake then happens at startup instead of delaying the first
+    transcription. The asyncio client is warmed up by warm_up_async, on
+    the event loop of the agent.
+    """
+    def connect():
+        start = time.perf_counter()
+        try:
+            get_client().models.list()
+            logger.info(
+                "GROQ connection warmed up in "
+                f"{(time.perf_counter() - start) * 1000:.0f} ms")
+        except Exception as e:
+            logger.warning(f"Error warming up GROQ connection: {e}")
+
+    thread = threading.Thread(target=connect, daemon=True,
+                              name="GroqWarmUpThread")
+    thread.start()
+    return thread
+
+
+async def warm_up_async():
+    """Open a pooled connection of the asyncio client.
+
+    Run on the event loop of the agent, the connections of the asyncio
+    client belong to it. The first chat turn then reuses the connection.
+    """
+    start = time.perf_counter()
+    try:
+        await get_async_client().models.list()
+        logger.info(
+            "Async GROQ connection warmed up in "
+            f"{(time.perf_counter() - start) * 1000:.0f} ms")
+    except Exception as e:
+        logger.warning(f"Error warming up async GROQ connection: {e}")
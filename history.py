@@ -0,0 +1,212 @@
+import json
+import os
+import logging
+
+from compaction import estimate_tokens
+
+# Get logger for this module
+logger = logging.getLogger("sigint_agent.history")
+
+# Approximate token budget for the whole conversation sent to the LLM
+history_token_budget = int(os.environ.get("HISTORY_TOKEN_BUDGET", "8000"))
+
+# Number of most recent turns that are always kept verbatim
+history_keep_turns = int(os.environ.get("HISTORY_KEEP_TURNS", "4"))
+
+# Directory where per-session conversation histories are stored
+history_dir = "history"
+
+# Marker identifying the system message holding compacted older turns
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+# Longest preview kept for tool outputs and messages of compacted turns
+TOOL_PREVIEW_CHARS = 200
+SUMMARY_LINE_CHARS = 240
+# Upper bound for the summary message itself
+SUMMARY_MAX_TOKENS = 1500
+
+
+def message_to_dict(message) -> dict:
+    """Convert a message (dict or GROQ response object) to a plain dict."""
+    if isinstance(message, dict):
+        return message
+    data = message.model_dump(exclude_none=True)
+    # The API rejects some response-only fields when they are sent back
+    data.pop("function_call", None)
+    return data
+
+
+def message_tokens(message: dict) -> int:
+    """Estimate the number of tokens a message adds to the prompt."""
+    return estimate_tokens(json.dumps(message, ensure_ascii=False)) + 4
+
+
+def _truncate(text: str, limit: int) -> str:
+    text = " ".join((text or "").split())
+    if len(text) <= limit:
+        return text
+    return text[:limit] + f"... [{len(text) - limit} chars elided]"
+
+
+class ConversationHistory(list):
+    """Token-bounded list of chat messages with per-session persistence.
+
+    The system prompt and the most recent turns are always sent verbatim.
+    When the estimated token count exceeds the budget, bulky tool outputs
+    of older turns are shortened first and then the oldest turns are
+    folded into a single summary message right after the system prompt.
+    """
+
+    def __init__(self, system_prompt: str, session_id: str = None,
+                 token_budget: int = None, keep_turns: int = None):
+        super().__init__()
+        self.session_id = session_id
+        self.token_budget = token_budget or history_token_budget
+        self.keep_turns = keep_turns if keep_turns is not None \
+            else history_keep_turns
+        super().append({"role": "system", "content": system_prompt})
+        if session_id:
+            self.load()
+
+    @property
+    def path(self):
+        return os.path.join(history_dir, f"{self.session_id}.json")
+
+    def append(self, message):
+        message = message_to_dict(message)
+        # A new user message starts a new turn, the previous one is complete
+        # so this is the safe point to compact without splitting tool calls.
+        if message.get("role") == "user":
+            self.compact()
+        super().append(message)
+
+    def token_count(self) -> int:
+        """Estimate the number of tokens of the whole conversation."""
+        return sum(message_tokens(m) for m in self)
+
+    def _split(self):
+        """Split into (system messages, summary message or None, turns)."""
+        head = [self[0]]
+        summary = None
+        index = 1
+        if len(self) > 1 and self[1].get("role") == "system" and \
+                self[1].get("content", "").startswith(SUMMARY_PREFIX):
+            summary = self[1]
+            index = 2
+
+        turns = []
+        for message in self[index:]:
+            if message.get("role") == "user" or not turns:
+                turns.append([])
+            turns[-1].append(message)
+        return head, summary, turns
+
+    def _rebuild(self, head, summary_lines, turns):
+        messages = list(head)
+        if summary_lines:
+            messages.append({
+                "role": "system",
+                "content": SUMMARY_PREFIX + "\n".join(summary_lines),
+            })
+        for turn in turns:
+            messages.extend(turn)
+        self[:] = messages
+
+    def compact(self):
+        """Shrink the conversation until it fits the token budget."""
+        before = self.token_count()
+        if before <= self.token_budget:
+            return
+
+        head, summary, turns = self._split()
+        summary_lines = []
+        if summary:
+            summary_lines = summary["content"][len(SUMMARY_PREFIX):] \
+                .splitlines()
+
+        older = turns[:-self.keep_turns] if self.keep_turns else turns
+
+        # First pass: shorten tool outputs of older turns
+        for turn in older:
+            for i, message in enumerate(turn):
+                if message.get("role") == "tool" and \
+                        len(message.get("content") or "") > TOOL_PREVIEW_CHARS:
+                    turn[i] = dict(message, content=_truncate(
+                        message["content"], TOOL_PREVIEW_CHARS))
+        self._rebuild(head, summary_lines, turns)
+
+        # Second pass: fold the oldest turns into the summary
+        while older and self.token_count() > self.token_budget:
+            turn = older.pop(0)
+            turns.pop(0)
+            summary_lines.extend(self._summarize_turn(turn))
+            while summary_lines and estimate_tokens(
+                    "\n".join(summary_lines)) > SUMMARY_MAX_TOKENS:
+                summary_lines.pop(0)
+            self._rebuild(head, summary_lines, turns)
+
+        logger.info(
+            f"Compacted conversation history from ~{before} to "
+            f"~{self.token_count()} tokens")
+
+    @staticmethod
+    def _summarize_turn(turn) -> list:
+        """Describe a turn in a few short lines."""
+        lines = []
+        for message in turn:
+            role = message.get("role")
+            if role == "user":
+                lines.append(
+                    "User: " + _truncate(message.get("content"),
+                                         SUMMARY_LINE_CHARS))
+            elif role == "assistant":
+                for tool_call in message.get("tool_calls") or []:
+                    function = tool_call.get("function", {})
+                    lines.append(
+                        f"Called {function.get('name')}"
+                        f"({_truncate(function.get('arguments'), 80)})")
+                if message.get("content"):
+                    lines.append(
+                        "Operator: " + _truncate(message["content"],
+                                                 SUMMARY_LINE_CHARS))
+            elif role == "tool":
+                lines.append(
+                    f"{message.get('name')} returned: "
+                    f"{_truncate(message.get('content'), 120)}")
+        return lines
+
+    def load(self):
+        """Restore a previously saved conversation for this session."""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as f:
+                saved = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Error loading history {self.path}: {e}")
+            return
+        # Always keep the current system prompt, not the saved one
+        self[1:] = [m for m in saved[1:] if isinstance(m, dict)]
+        # Drop a trailing turn interrupted before its final answer, the API
+        # rejects tool calls without results
+        while len(self) > 1 and not (
+                self[-1].get("role") == "assistant" and
+                not self[-1].get("tool_calls")):
+            self.pop()
+        logger.info(
+            f"Restored {len(self) - 1} messages for session "
+            f"{self.session_id}")
+
+    def save(self):
+        """Persist the conversation for this session, if it has one."""
+        if not self.session_id:
+            return
+        if not os.path.exists(history_dir):
+            os.makedirs(history_dir)
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(list(self), f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.error(f"Error saving history {self.path}: {e}")
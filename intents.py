@@ -0,0 +1,122 @@
+import json
+import os
+import re
+import logging
+
+# Get logger for this module
+logger = logging.getLogger("sigint_agent.intents")
+
+# Set FAST_PATH=0 to send every message to the LLM
+fast_path_enabled = os.environ.get("FAST_PATH", "1") != "0"
+
+_unit_multipliers = {
+    "ghz": 1_000_000_000,
+    "mhz": 1_000_000,
+    "khz": 1_000,
+    "hz": 1,
+}
+
+_get_frequency_re = re.compile(
+    r"^\s*(?:(?:what|which)(?:'s| is)?\s+(?:is\s+)?(?:the\s+)?"
+    r"(?:current\s+)?freq(?:uency)?(?:\s+(?:are\s+we\s+on|now))?"
+    r"|(?:get|show|tell\s+me)\s+(?:me\s+)?(?:the\s+)?(?:current\s+)?"
+    r"freq(?:uency)?"
+    r"|current\s+freq(?:uency)?"
+    r"|where\s+are\s+we\s+(?:tuned|listening))"
+    r"\s*[?.!]*\s*$",
+    re.IGNORECASE,
+)
+
+_set_frequency_re = re.compile(
+    r"^\s*(?:please\s+)?(?:tune|set|switch|change|go|move)"
+    r"(?:\s+(?:the\s+)?(?:receiver|radio|freq(?:uency)?))?"
+    r"(?:\s+(?:in|over))?(?:\s+to)?\s+"
+    r"(?P<value>\d+(?:\.\d+)?)\s*(?P<unit>ghz|mhz|khz|hz)?"
+    r"(?:\s+please)?\s*[.!]*\s*$",
+    re.IGNORECASE,
+)
+
+
+def parse_frequency(value: str, unit: str = None):
+    """Convert an operator frequency to Hz.
+
+    Values with a unit are converted from it. Without one, decimal values
+    and small integers are taken as MHz and large integers as Hz, anything
+    in between is ambiguous.
+
+    Args:
+        value (str): The number as typed by the operator
+        unit (str, optional): GHz, MHz, kHz or Hz (case insensitive)
+
+    Returns:
+        int: The frequency in Hz, or None if it is ambiguous
+    """
+    number = float(value)
+    if unit:
+        return int(round(number * _unit_multipliers[unit.lower()]))
+    if "." in value or number < 10_000:
+        return int(round(number * _unit_multipliers["mhz"]))
+    if number >= 1_000_000:
+        return int(number)
+    return None
+
+
+def format_frequency(hz) -> str:
+    """Format a frequency in Hz as MHz with at least kHz precision."""
+    mhz = f"{int(hz) / 1_000_000:.6f}".rstrip("0")
+    whole, _, decimals = mhz.partition(".")
+    return f"{whole}.{decimals.ljust(3, '0')} MHz"
+
+
+def match_intent(message: str):
+    """Recognize simple radio commands that need no LLM round trip.
+
+    Args:
+        message (str): The operator message
+
+    Returns:
+        tuple: (tool name, tool arguments dict) or None if the message
+        needs the LLM
+    """
+    if not fast_path_enabled:
+        return None
+
+    if _get_frequency_re.match(message):
+        return "get_current_frequency", {}
+
+    match = _set_frequency_re.match(message)
+    if match:
+        frequency = parse_frequency(match.group("value"), match.group("unit"))
+        if frequency:
+            return "set_frequency", {"frequency": frequency}
+    return None
+
+
+def render_reply(tool_name: str, tool_args: dict, result: str) -> str:
+    """Phrase the answer to a fast path command from the tool result."""
+    try:
+        data = json.loads(result)
+    except (TypeError, ValueError):
+        data = {"error": result}
+
+    if "error" in data:
+        return (
+            "The receiver is not answering, I could not complete the "
+            f"request: {data['error']}")
+
+    if tool_name == "get_current_frequency":
+        try:
+            frequency = format_frequency(data["result"])
+        except (TypeError, ValueError):
+            frequency = data["result"]
+        return f"We are listening on {frequency}."
+
+    if tool_name == "set_frequency":
+        response = str(data.get("result", ""))
+        frequency = format_frequency(tool_args["frequency"])
+        if response.startswith("RPRT") and response != "RPRT 0":
+            return (f"The receiver refused {frequency} ({response}). "
+                    "We stay where we are.")
+        return f"Tuned to {frequency}. Ears on, awaiting traffic."
+
+    return str(data.get("result", ""))
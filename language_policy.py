@@ -0,0 +1,241 @@
+import collections
+import logging
+import os
+import threading
+import time
+
+# Get logger for this module
+logger = logging.getLogger("sigint_language_policy")
+
+# ISO 639-1 code (e.g. "es") to transcribe every channel in, without
+# detection
+pinned_language = os.environ.get("TRANSCRIBE_LANGUAGE") or None
+# Transcriptions with automatic detection before a channel's language is
+# decided
+probe_count = int(os.environ.get("LANGUAGE_PROBES", "3"))
+# Seconds a decision is kept before the channel is probed again
+decision_ttl = float(os.environ.get("LANGUAGE_TTL", "3600"))
+
+# Share of the probes that must agree to decide on a language
+MIN_CONFIDENCE = 0.6
+# Mean segment log probability under which a transcription is degraded
+DEGRADED_LOGPROB = -1.0
+# Consecutive degraded transcriptions that reopen the decision
+DEGRADED_LIMIT = 2
+
+# Whisper reports detected languages by name, requests take a code
+LANGUAGE_CODES = {
+    "afrikaans": "af", "albanian": "sq", "amharic": "am", "arabic": "ar",
+    "armenian": "hy", "assamese": "as", "azerbaijani": "az",
+    "bashkir": "ba", "basque": "eu", "belarusian": "be", "bengali": "bn",
+    "bosnian": "bs", "breton": "br", "bulgarian": "bg", "cantonese": "yue",
+    "catalan": "ca", "chinese": "zh", "croatian": "hr", "czech": "cs",
+    "danish": "da", "dutch": "nl", "english": "en", "estonian": "et",
+    "faroese": "fo", "finnish": "fi", "french": "fr", "galician": "gl",
+    "georgian": "ka", "german": "de", "greek": "el", "gujarati": "gu",
+    "haitian creole": "ht", "hausa": "ha", "hawaiian": "haw",
+    "hebrew": "he", "hindi": "hi", "hungarian": "hu", "icelandic": "is",
+    "indonesian": "id", "italian": "it", "japanese": "ja", "javanese": "jw",
+    "kannada": "kn", "kazakh": "kk", "khmer": "km", "korean": "ko",
+    "lao": "lo", "latin": "la", "latvian": "lv", "lingala": "ln",
+    "lithuanian": "lt", "luxembourgish": "lb", "macedonian": "mk",
+    "malagasy": "mg", "malay": "ms", "malayalam": "ml", "maltese": "mt",
+    "maori": "mi", "marathi": "mr", "mongolian": "mn", "myanmar": "my",
+    "nepali": "ne", "norwegian": "no", "nynorsk": "nn", "occitan": "oc",
+    "pashto": "ps", "persian": "fa", "polish": "pl", "portuguese": "pt",
+    "punjabi": "pa", "romanian": "ro", "russian": "ru", "sanskrit": "sa",
+    "serbian": "sr", "shona": "sn", "sindhi": "sd", "sinhala": "si",
+    "slovak": "sk", "slovenian": "sl", "somali": "so", "spanish": "es",
+    "sundanese": "su", "swahili": "sw", "swedish": "sv", "tagalog": "tl",
+    "tajik": "tg", "tamil": "ta", "tatar": "tt", "telugu": "te",
+    "thai": "th", "tibetan": "bo", "turkish": "tr", "turkmen": "tk",
+    "ukrainian": "uk", "urdu": "ur", "uzbek": "uz", "vietnamese": "vi",
+    "welsh": "cy", "yiddish": "yi", "yoruba": "yo",
+}
+# Vote of a detected language without a known code. A channel decided on
+# it keeps automatic detection, but stops probing
+UNKNOWN = "unknown"
+
+
+def language_code(name):
+    """ISO 639-1 code of a language name or code, None if unknown."""
+    if not name:
+        return None
+    name = name.strip().lower()
+    if len(name) == 2 or name in LANGUAGE_CODES.values():
+        return name
+    return LANGUAGE_CODES.get(name)
+
+
+def _field(item, name):
+    # Segments come back as dicts or models depending on the client
+    if isinstance(item, dict):
+        return item.get(name)
+    return getattr(item, name, None)
+
+
+def transcription_quality(transcription):
+    """Mean log probability of the segments of a verbose_json response."""
+    segments = getattr(transcription, "segments", None) or []
+    logprobs = [
+        _field(segment, "avg_logprob") for segment in segments
+        if _field(segment, "avg_logprob") is not None
+    ]
+    if not logprobs:
+        return None
+    return sum(logprobs) / len(logprobs)
+
+
+def no_speech_probability(transcription):
+    """Highest no speech probability of the segments, None if unknown."""
+    segments = getattr(transcription, "segments", None) or []
+    probabilities = [
+        _field(segment, "no_speech_prob") for segment in segments
+        if _field(segment, "no_speech_prob") is not None
+    ]
+    return max(probabilities) if probabilities else None
+
+
+class ChannelLanguage:
+    """Language decision of one channel."""
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.reset()
+
+    def reset(self):
+        self.language = None
+        self.confidence = 0.0
+        self.decided_at = None
+        self.votes = collections.Counter()
+        self.probes = 0
+        self.degraded = 0
+
+    def to_dict(self) -> dict:
+        return {
+            "language": self.language,
+            "confidence": round(self.confidence, 2),
+            "probes": self.probes,
+            "votes": dict(self.votes),
+        }
+
+
+class LanguagePolicy:
+    """Per-channel transcription language, detected and cached.
+
+    Until a channel's language is decided, chunks are transcribed with
+    automatic detection and the detected languages are counted. After
+    `probe_count` probes the most frequent one is used for the channel, if
+    enough probes agree. The decision expires after `decision_ttl` seconds
+    or when transcriptions keep coming back with low confidence, and the
+    channel is probed again.
+    """
+
+    def __init__(self, pinned: str = None):
+        self.pinned = pinned
+        self.channels = {}
+        self._lock = threading.Lock()
+
+    def _get(self, channel) -> ChannelLanguage:
+        state = self.channels.get(channel)
+        if state is None:
+            state = self.channels[channel] = ChannelLanguage(channel)
+        return state
+
+    def language_for(self, channel):
+        """Language to request for a chunk, None to detect it."""
+        if self.pinned:
+            return self.pinned
+        with self._lock:
+            state = self._get(channel)
+            if state.language is not None and \
+                    time.monotonic() - state.decided_at > decision_ttl:
+                logger.info(
+                    f"Language decision for {channel} expired, probing")
+                state.reset()
+            if state.language == UNKNOWN:
+                return None
+            return state.language
+
+    def observe(self, channel, transcription, rejected: str = None):
+        """Learn from a verbose_json transcription of the channel.
+
+        Args:
+            channel: Frequency of the transcribed audio
+            transcription: The verbose_json response
+            rejected (str): Why the transcript filter dropped the text, a
+                hallucination or repetition counts as a degraded result
+                and not as a vote
+
+        Returns:
+            str: The language of the transcription, the code when it is
+            known and Whisper's name otherwise
+        """
+        if self.pinned:
+            return self.pinned
+        name = getattr(transcription, "language", None)
+        detected = language_code(name)
+        quality = transcription_quality(transcription)
+        # Duplicates and empty texts say nothing about the language
+        degraded = rejected in ("hallucination", "compression_ratio",
+                                "repetition") or \
+            (quality is not None and quality < DEGRADED_LOGPROB)
+        with self._lock:
+            state = self._get(channel)
+            if state.language is None:
+                if name and rejected is None:
+                    state.votes[detected or UNKNOWN] += 1
+                    state.probes += 1
+                if state.probes >= probe_count:
+                    self._decide(state)
+                return detected or (name.strip().lower() if name else None)
+
+            if degraded:
+                state.degraded += 1
+            elif rejected is None:
+                state.degraded = 0
+            if state.degraded >= DEGRADED_LIMIT:
+                logger.info(
+                    f"Transcriptions on {channel} degraded "
+                    f"({rejected or f'log probability {quality:.2f}'}), "
+                    "probing language")
+                state.reset()
+            if detected or name:
+                return detected or name.strip().lower()
+            return None if state.language == UNKNOWN else state.language
+
+    def _decide(self, state: ChannelLanguage):
+        language, votes = state.votes.most_common(1)[0]
+        confidence = votes / state.probes
+        if confidence < MIN_CONFIDENCE:
+            # Mixed traffic, keep detecting on every chunk for a while
+            logger.info(
+                f"No dominant language on {state.channel} "
+                f"({dict(state.votes)}), probing again")
+            state.reset()
+            return
+        state.language = language
+        state.confidence = confidence
+        state.decided_at = time.monotonic()
+        state.degraded = 0
+        logger.info(
+            f"Language of {state.channel}: {language} "
+            f"(confidence {confidence:.0%})")
+
+    def get_status(self) -> dict:
+        with self._lock:
+            return {
+                channel: state.to_dict()
+                for channel, state in self.channels.items()
+            }
+
+
+policy = LanguagePolicy(pinned_language)
+
+
+def language_for(channel):
+    return policy.language_for(channel)
+
+
+def observe(channel, transcription, rejected: str = None):
+    return policy.observe(channel, transcription, rejected)
@@ -0,0 +1,215 @@
+import codecs
+import sys
+import unicodedata
+
+# Control characters
+CTRL_A = "\x01"
+CTRL_C = "\x03"
+CTRL_D = "\x04"
+CTRL_E = "\x05"
+CTRL_K = "\x0b"
+CTRL_U = "\x15"
+CTRL_W = "\x17"
+BACKSPACE = ("\x7f", "\x08")
+ENTER = ("\r", "\n")
+ESCAPE = "\x1b"
+
+# Final characters of the escape sequences we handle, per key
+_sequences = {
+    "A": "up", "B": "down", "C": "right", "D": "left",
+    "H": "home", "F": "end",
+    "1~": "home", "7~": "home", "4~": "end", "8~": "end", "3~": "delete",
+}
+
+
+def display_width(text: str) -> int:
+    """Number of terminal columns used by `text`."""
+    width = 0
+    for char in text:
+        if unicodedata.combining(char):
+            continue
+        width += 2 if unicodedata.east_asian_width(char) in "WF" else 1
+    return width
+
+
+class LineEditor:
+    """Line editor for a terminal in raw mode, fed with raw input bytes.
+
+    Decodes UTF-8 incrementally (multibyte characters may be split across
+    reads), supports cursor movement, the usual readline kill shortcuts and
+    an input history. `print_above` writes asynchronous output above the
+    prompt without corrupting the line being edited.
+    """
+
+    def __init__(self, prompt: str, history_size: int = 500, output=None):
+        self.prompt = prompt
+        self.history_size = history_size
+        self.output = output or sys.stdout
+        self.history = []
+        self.buffer = []
+        self.cursor = 0
+        self.active = False
+        self._decoder = codecs.getincrementaldecoder("utf-8")("replace")
+        self._pending = ""
+        self._escape = None
+        self._history_index = 0
+        self._draft = ""
+
+    def _write(self, text: str):
+        self.output.write(text)
+        self.output.flush()
+
+    def render(self):
+        """Redraw the prompt and the current line."""
+        line = "".join(self.buffer)
+        tail = display_width("".join(self.buffer[self.cursor:]))
+        text = f"\r\x1b[K{self.prompt}{line}"
+        if tail:
+            text += f"\x1b[{tail}D"
+        self._write(text)
+
+    def start(self):
+        """Show the prompt for a new line."""
+        self.buffer = []
+        self.cursor = 0
+        self._history_index = len(self.history)
+        self.active = True
+        self.render()
+
+    def print_above(self, text: str):
+        """Write a message above the prompt and redraw the line."""
+        text = text.rstrip("\n").replace("\r\n", "\n").replace("\n", "\r\n")
+        if self.active:
+            self._write(f"\r\x1b[K{text}\r\n")
+            self.render()
+        else:
+            self._write(f"{text}\r\n")
+
+    def feed(self, data: bytes):
+        """Process input bytes.
+
+        Returns:
+            str: The completed line when Enter is pressed, else None.
+            Input following the Enter key is kept for the next line.
+
+        Raises:
+            KeyboardInterrupt: On Ctrl+C
+            EOFError: On Ctrl+D with an empty line
+        """
+        self._pending += self._decoder.decode(data)
+        while self._pending:
+            char, self._pending = self._pending[0], self._pending[1:]
+            line = self._handle(char)
+            if line is not None:
+                return line
+        # A lone Escape at the end of the input is the Escape key itself
+        if self._escape == "":
+            self._escape = None
+        return None
+
+    def _handle(self, char: str):
+        if self._escape is not None:
+            return self._handle_escape(char)
+
+        if char == ESCAPE:
+            self._escape = ""
+        elif char in ENTER:
+            return self._submit()
+        elif char == CTRL_C:
+            raise KeyboardInterrupt
+        elif char == CTRL_D:
+            if not self.buffer:
+                raise EOFError
+            self._delete()
+        elif char in BACKSPACE:
+            if self.cursor > 0:
+                self.cursor -= 1
+                del self.buffer[self.cursor]
+                self.render()
+        elif char == CTRL_A:
+            self._move(-self.cursor)
+        elif char == CTRL_E:
+            self._move(len(self.buffer) - self.cursor)
+        elif char == CTRL_U:
+            del self.buffer[:self.cursor]
+            self.cursor = 0
+            self.render()
+        elif char == CTRL_K:
+            del self.buffer[self.cursor:]
+            self.render()
+        elif char == CTRL_W:
+            start = self.cursor
+            while start > 0 and self.buffer[start - 1] == " ":
+                start -= 1
+            while start > 0 and self.buffer[start - 1] != " ":
+                start -= 1
+            del self.buffer[start:self.cursor]
+            self.cursor = start
+            self.render()
+        elif char.isprintable():
+            self.buffer.insert(self.cursor, char)
+            self.cursor += 1
+            if self.cursor == len(self.buffer):
+                # Appending at the end only needs the new character
+                self._write(char)
+            else:
+                self.render()
+        return None
+
+    def _handle_escape(self, char: str):
+        sequence = self._escape + char
+        if sequence in ("[", "O"):
+            self._escape = sequence
+            return None
+        if sequence[0] in "[O" and (char.isdigit() or char == ";"):
+            self._escape = sequence
+            return None
+        self._escape = None
+        key = _sequences.get(sequence[1:]) if len(sequence) > 1 else None
+        if key == "left":
+            self._move(-1)
+        elif key == "right":
+            self._move(1)
+        elif key == "home":
+            self._move(-self.cursor)
+        elif key == "end":
+            self._move(len(self.buffer) - self.cursor)
+        elif key == "delete":
+            self._delete()
+        elif key in ("up", "down"):
+            self._recall(-1 if key == "up" else 1)
+        return None
+
+    def _move(self, offset: int):
+        cursor = max(0, min(len(self.buffer), self.cursor + offset))
+        if cursor != self.cursor:
+            self.cursor = cursor
+            self.render()
+
+    def _delete(self):
+        if self.cursor < len(self.buffer):
+            del self.buffer[self.cursor]
+            self.render()
+
+    def _recall(self, offset: int):
+        index = self._history_index + offset
+        if index < 0 or index > len(self.history):
+            return
+        if self._history_index == len(self.history):
+            # Keep what was being typed before browsing the history
+            self._draft = "".join(self.buffer)
+        self._history_index = index
+        line = self.history[index] if index < len(self.history) \
+            else self._draft
+        self.buffer = list(line)
+        self.cursor = len(self.buffer)
+        self.render()
+
+    def _submit(self) -> str:
+        line = "".join(self.buffer)
+        self.active = False
+        self._write("\r\n")
+        if line.strip() and (not self.history or self.history[-1] != line):
+            self.history.append(line)
+            del self.history[:-self.history_size]
+        return line
@@ -0,0 +1,197 @@
+import atexit
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+
+# Logging level of the application
+log_level = os.environ.get("LOG_LEVEL", "INFO").upper()
+# "json" writes one JSON object per line instead of text
+log_format = os.environ.get("LOG_FORMAT", "text")
+# "size" rotates the log file when it reaches LOG_MAX_BYTES, "time" at
+# LOG_ROTATE_WHEN (a TimedRotatingFileHandler interval, e.g. "midnight")
+log_rotate = os.environ.get("LOG_ROTATE", "size")
+max_bytes = int(os.environ.get("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+rotate_when = os.environ.get("LOG_ROTATE_WHEN", "midnight")
+backup_count = int(os.environ.get("LOG_BACKUPS", "5"))
+# Records waiting to be written, more are dropped rather than blocking
+queue_size = int(os.environ.get("LOG_QUEUE_SIZE", "10000"))
+# Records let through per call site and interval, the rest are counted
+rate_burst = int(os.environ.get("LOG_RATE_BURST", "20"))
+rate_interval = float(os.environ.get("LOG_RATE_INTERVAL", "10"))
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_listener = None
+_handlers = []
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that drops records when the queue is full.
+
+    Logging then never blocks the thread that logs, whatever the speed of
+    the disk. Dropped records are reported once there is room again.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def enqueue(self, record):
+        with self._lock:
+            try:
+                if self.dropped:
+                    self.queue.put_nowait(logging.makeLogRecord({
+                        "name": __name__, "levelno": logging.WARNING,
+                        "levelname": "WARNING",
+                        "msg": f"Dropped {self.dropped} log records, "
+                               "the log queue was full",
+                    }))
+                    self.dropped = 0
+                self.queue.put_nowait(record)
+            except queue.Full:
+                self.dropped += 1
+
+
+class RateLimitFilter(logging.Filter):
+    """Limits the records logged from one call site.
+
+    At most `burst` records per `interval` seconds pass for each logging
+    call (file and line), the rest are counted and the count is appended to
+    the next record let through.
+    """
+
+    def __init__(self, burst: int = None, interval: float = None):
+        super().__init__()
+        self.burst = rate_burst if burst is None else burst
+        self.interval = rate_interval if interval is None else interval
+        self._sites = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record) -> bool:
+        if self.burst <= 0:
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            site = self._sites.get(key)
+            if site is None or now - site[0] >= self.interval:
+                suppressed = site[2] if site is not None else 0
+                site = self._sites[key] = [now, 0, 0]
+                if suppressed:
+                    record.msg = f"{record.msg} " \
+                        f"({suppressed} similar messages suppressed)"
+            if site[1] >= self.burst:
+                site[2] += 1
+                return False
+            site[1] += 1
+            return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record."""
+
+    def format(self, record) -> str:
+        data = {
+            "time": datetime.datetime.fromtimestamp(
+                record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "process": record.process,
+            "thread": record.threadName,
+        }
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False)
+
+
+def _file_handler(log_filename: str) -> logging.Handler:
+    if log_rotate == "time":
+        handler = logging.handlers.TimedRotatingFileHandler(
+            log_filename, when=rotate_when, backupCount=backup_count,
+            encoding="utf-8")
+    else:
+        handler = logging.handlers.RotatingFileHandler(
+            log_filename, maxBytes=max_bytes, backupCount=backup_count,
+            encoding="utf-8")
+    handler.setFormatter(
+        JsonFormatter() if log_format == "json"
+        else logging.Formatter(TEXT_FORMAT))
+    return handler
+
+
+def _install(handler: logging.Handler):
+    # First, remove all existing handlers to ensure clean configuration
+    for existing in logging.root.handlers[:]:
+        logging.root.removeHandler(existing)
+    handler.addFilter(RateLimitFilter())
+    logging.root.setLevel(log_level)
+    logging.root.addHandler(handler)
+
+
+def setup_logging(logs_dir: str = "logs") -> str:
+    """Send all log records to a new timestamped file under `logs_dir`.
+
+    Records are put on a bounded queue and written by a background
+    listener thread, so the audio and API threads never wait for the disk.
+
+    Returns:
+        str: The path of the log file
+    """
+    global _listener, _handlers
+
+    # Create logs directory if it doesn't exist
+    if not os.path.exists(logs_dir):
+        os.makedirs(logs_dir)
+
+    # Generate timestamp for the log file
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    log_filename = os.path.join(logs_dir, f"{timestamp}_sigint_agent.log")
+
+    _handlers = [_file_handler(log_filename)]
+    log_queue = queue.Queue(maxsize=queue_size)
+    _listener = logging.handlers.QueueListener(
+        log_queue, *_handlers, respect_handler_level=True)
+    _listener.start()
+    _install(DroppingQueueHandler(log_queue))
+    # Registered first, runs after every other exit handler has logged
+    atexit.register(shutdown)
+
+    logging.getLogger("sigint_app").info(f"Logging to: {log_filename}")
+    return log_filename
+
+
+def listen(log_queue):
+    """Write the records another process puts on `log_queue`.
+
+    Returns:
+        QueueListener: The started listener, None when logging is not set
+        up in this process
+    """
+    if not _handlers:
+        return None
+    listener = logging.handlers.QueueListener(
+        log_queue, *_handlers, respect_handler_level=True)
+    listener.start()
+    return listener
+
+
+def setup_process_logging(log_queue):
+    """Log through the queue of the application process (see listen)."""
+    _install(DroppingQueueHandler(log_queue))
+
+
+def shutdown():
+    """Write the queued records and stop the listener."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    for handler in _handlers:
+        handler.close()
@@ -0,0 +1,499 @@
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import events
+import log_config
+import transcript_filter
+from chunk_scheduler import ChunkScheduler, score_chunk
+from stream_groq_whisper import BYTES_PER_SECOND, chunk_frequency
+
+# Get logger for this module
+logger = logging.getLogger("sigint_pipeline")
+
+# "process" runs capture and transcription in their own processes, anything
+# else keeps them on threads of the application process
+pipeline_mode = os.environ.get("PIPELINE_MODE", "thread")
+# Number of transcription worker processes
+worker_count = int(os.environ.get("PIPELINE_WORKERS", "2"))
+# Seconds of audio kept in the shared ring buffer for the workers
+ring_seconds = float(os.environ.get("PIPELINE_RING_SECONDS", "300"))
+
+# Delay before restarting a stage that exited, doubled after every crash
+RESTART_BACKOFF = 1.0
+MAX_RESTART_BACKOFF = 30.0
+# A stage running this long is healthy again, its backoff is reset
+HEALTHY_AFTER = 60.0
+
+# The ring buffer starts with the total number of bytes ever written
+# (head) and the end of the write in progress (reserved)
+HEADER_SIZE = 16
+
+
+class RingBuffer:
+    """Single-producer byte ring buffer in shared memory.
+
+    Positions are offsets in the stream of all bytes ever written. The
+    writer never waits for readers: data older than the capacity is
+    overwritten, and reading it reports an overrun instead of returning
+    torn audio.
+    """
+
+    def __init__(self, capacity: int, name: str = None):
+        self.capacity = capacity
+        self.owner = name is None
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(
+                create=True, size=HEADER_SIZE + capacity)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.name = self.shm.name
+        self._header = np.ndarray((2,), dtype=np.uint64,
+                                  buffer=self.shm.buf)
+        self._data = np.ndarray((capacity,), dtype=np.uint8,
+                                buffer=self.shm.buf, offset=HEADER_SIZE)
+        if self.owner:
+            self._header[:] = 0
+
+    @property
+    def head(self) -> int:
+        return int(self._header[0])
+
+    @property
+    def reserved(self) -> int:
+        return int(self._header[1])
+
+    def write(self, data: bytes) -> int:
+        """Append bytes, returns their position in the stream."""
+        if len(data) > self.capacity:
+            raise ValueError(
+                f"{len(data)} bytes do not fit in a {self.capacity} byte ring")
+        data = np.frombuffer(data, dtype=np.uint8)
+        position = self.head
+        offset = position % self.capacity
+        first = min(len(data), self.capacity - offset)
+        # Announce the bytes about to be overwritten before touching them
+        self._header[1] = position + len(data)
+        self._data[offset:offset + first] = data[:first]
+        self._data[:len(data) - first] = data[first:]
+        # Publish the new head only once the bytes are in place
+        self._header[0] = position + len(data)
+        return position
+
+    def read(self, position: int, length: int):
+        """Copy bytes out of the ring.
+
+        Returns:
+            bytes: The data, or None if it was already overwritten
+        """
+        if self.head - position > self.capacity:
+            return None
+        offset = position % self.capacity
+        first = min(length, self.capacity - offset)
+        data = self._data[offset:offset + first].tobytes() + \
+            self._data[:length - first].tobytes()
+        # A write started during the copy may have overwritten the start
+        # of the data, even before it published the new head
+        if self.reserved - position > self.capacity:
+            return None
+        return data
+
+    def close(self):
+        # Views on the buffer must be gone before it can be closed
+        self._header = self._data = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def _init_process(log_queue):
+    """Common setup of a stage process."""
+    # Ctrl+C reaches the whole process group, shutdown is coordinated by
+    # the application process
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if log_queue is not None:
+        log_config.setup_process_logging(log_queue)
+
+
+def capture_main(ring_name, capacity, chunks, results, log_queue=None):
+    """Capture stage: read FFmpeg's output into the ring buffer.
+
+    Puts a `(position, length, index, capture_time, source_file)`
+    descriptor on `chunks` for every chunk written, and the status of the
+    sample clock on `results` as a `("clock", pid, status)` tuple.
+    """
+    _init_process(log_queue)
+    import stream_groq_whisper as audio
+    from sample_clock import SampleClock
+
+    ring = RingBuffer(capacity, ring_name)
+    clock = SampleClock(BYTES_PER_SECOND)
+    source_file = audio.new_session_filename()
+    process = audio.start_ffmpeg(source_file)
+    # Stopping FFmpeg ends the stream, the partial chunk is still queued
+    signal.signal(signal.SIGTERM, lambda signum, frame: process.terminate())
+
+    def emit(chunk, index, capture_time):
+        position = ring.write(chunk)
+        chunks.put((position, len(chunk), index, capture_time, source_file))
+        results.put(("clock", os.getpid(), clock.get_status()))
+
+    try:
+        count = audio.read_chunks(process, emit, clock)
+        logger.info(f"Capture stopped after {count} chunks")
+    finally:
+        process.stdout.close()
+        process.stderr.close()
+        process.wait()
+        ring.close()
+
+
+def worker_main(ring_name, capacity, chunks, demand, results,
+                log_queue=None):
+    """Transcription stage: process the chunks described on `chunks`.
+
+    `demand` is released whenever the worker is ready for a chunk, the
+    application process then picks the best one pending.
+
+    Intercepts are forwarded on `results`, the subscribers of the event
+    bus live in the application process, followed by the transcript filter
+    counts of the worker as a `("filter", pid, stats)` tuple.
+    """
+    _init_process(log_queue)
+    import stream_groq_whisper as audio
+
+    ring = RingBuffer(capacity, ring_name)
+
+    def forward(subscription):
+        for event in subscription.drain():
+            results.put(event)
+
+    subscription = events.subscribe(events.TRANSCRIPT, callback=forward)
+    processed_chunks = 0
+    try:
+        while True:
+            demand.release()
+            item = chunks.get()
+            if item is None:
+                break
+            position, length, index, capture_time, source_file, \
+                frequency = item
+            data = ring.read(position, length)
+            if data is None:
+                logger.warning(
+                    f"Chunk {index} was overwritten before it was "
+                    "processed, workers are falling behind")
+                continue
+            try:
+                audio.process_audio(data, index, capture_time, source_file,
+                                    frequency)
+            except Exception as e:
+                logger.error(
+                    f"Error processing chunk {index}: {e}", exc_info=True)
+            processed_chunks += 1
+            results.put(("filter", os.getpid(), transcript_filter.get_stats()))
+    finally:
+        subscription.close()
+        ring.close()
+        logger.info(
+            f"Worker stopping, processed {processed_chunks} chunks")
+
+
+class Stage:
+    """A supervised process of the pipeline."""
+
+    def __init__(self, name: str, target, args: tuple):
+        self.name = name
+        self.target = target
+        self.args = args
+        self.process = None
+        self.started_at = 0.0
+        self.restarts = 0
+        self.backoff = RESTART_BACKOFF
+        self.restart_at = 0.0
+
+    def start(self, context):
+        self.process = context.Process(
+            target=self.target, args=self.args,
+            name=f"sigint-{self.name}", daemon=True)
+        self.process.start()
+        self.started_at = time.monotonic()
+        logger.info(f"Started {self.name} process (pid {self.process.pid})")
+
+    def is_alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+
+class Pipeline:
+    """Capture and transcription in supervised processes.
+
+    The capture process writes PCM into a shared memory ring buffer and
+    queues chunk descriptors, worker processes transcribe them. The
+    descriptors go through a ChunkScheduler in this process, which scores
+    the audio in the ring, and are handed to the workers one at a time as
+    they ask for them, so the most speech-like chunks are transcribed first
+    like in the threaded pipeline.
+
+    Every frequency is pinned to one worker, with its own scheduler: the
+    per-channel state of the transcription (noise floor, recent
+    transcripts, language votes) lives in that worker only.
+
+    A stage that exits is restarted with a backoff while the others keep
+    running, and the UI/agent process is never blocked by the audio path.
+    """
+
+    def __init__(self, workers: int = None, seconds: float = None):
+        workers = worker_count if workers is None else workers
+        seconds = ring_seconds if seconds is None else seconds
+        # Spawned, the workers do not inherit the threads and locks of
+        # the application process
+        self.context = multiprocessing.get_context("spawn")
+        capacity = int(seconds * BYTES_PER_SECOND)
+        self.ring = RingBuffer(capacity)
+        # Descriptors from the capture process, scheduled here
+        self.captured = self.context.Queue()
+        workers = max(1, workers)
+        self.schedulers = [ChunkScheduler(score=self._score)
+                           for _ in range(workers)]
+        # The next chunk of a worker is picked only once it asks for one
+        self.chunks = [self.context.Queue() for _ in range(workers)]
+        self.demands = [self.context.Semaphore(0) for _ in range(workers)]
+        # Worker of every frequency seen, by index
+        self.assignments = {}
+        self.results = self.context.Queue()
+        # Records of the stage processes are written by this process
+        self.log_queue = self.context.Queue(log_config.queue_size)
+        self._log_listener = log_config.listen(self.log_queue)
+        # Without a listener nothing would drain the queue
+        log_queue = self.log_queue if self._log_listener else None
+        self.capture = Stage(
+            "capture", capture_main,
+            (self.ring.name, capacity, self.captured, self.results,
+             log_queue))
+        self.workers = [
+            Stage(f"worker-{i}", worker_main,
+                  (self.ring.name, capacity, self.chunks[i],
+                   self.demands[i], self.results, log_queue))
+            for i in range(workers)
+        ]
+        self._stopping = threading.Event()
+        self._supervisor = None
+        self._relay = None
+        self._scheduling = None
+        self._dispatchers = []
+        # Transcript filter counts of every worker process, by pid
+        self.filter_stats = {}
+        # Sample clock of the capture process as of its last chunk
+        self.clock_status = None
+
+    @property
+    def stages(self) -> list:
+        return [self.capture] + self.workers
+
+    def start(self):
+        for stage in self.stages:
+            stage.start(self.context)
+        self._relay = threading.Thread(
+            target=self._relay_events, daemon=True, name="PipelineRelay")
+        self._relay.start()
+        self._scheduling = threading.Thread(
+            target=self._schedule_chunks, daemon=True,
+            name="PipelineScheduler")
+        self._scheduling.start()
+        self._dispatchers = [
+            threading.Thread(target=self._dispatch_chunks, args=(i,),
+                             daemon=True, name=f"PipelineDispatcher-{i}")
+            for i in range(len(self.workers))
+        ]
+        for dispatcher in self._dispatchers:
+            dispatcher.start()
+        self._supervisor = threading.Thread(
+            target=self._supervise, daemon=True, name="PipelineSupervisor")
+        self._supervisor.start()
+
+    def _score(self, item) -> float:
+        position, length = item[0], item[1]
+        data = self.ring.read(position, length)
+        # Overwritten already, the worker skips it
+        return 0.0 if data is None else score_chunk(data)
+
+    def _assign(self, frequency) -> int:
+        """Worker of a frequency, new ones go to the least loaded."""
+        worker = self.assignments.get(frequency)
+        if worker is None:
+            loads = [0] * len(self.workers)
+            for assigned in self.assignments.values():
+                loads[assigned] += 1
+            worker = self.assignments[frequency] = loads.index(min(loads))
+            logger.debug(f"Frequency {frequency} assigned to worker-{worker}")
+        return worker
+
+    def _schedule_chunks(self):
+        while True:
+            item = self.captured.get()
+            if item is None:
+                break
+            _, length, _, capture_time, _ = item
+            try:
+                frequency = chunk_frequency(length, capture_time)
+            except Exception as e:
+                logger.error(f"Error resolving the chunk frequency: {e}")
+                frequency = None
+            self.schedulers[self._assign(frequency)].put(
+                item + (frequency,))
+
+    def _dispatch_chunks(self, worker: int):
+        scheduler = self.schedulers[worker]
+        while True:
+            self.demands[worker].acquire()
+            item = scheduler.get()
+            self.chunks[worker].put(item)
+            scheduler.task_done()
+            if item is None:
+                break
+
+    def _relay_events(self):
+        while True:
+            event = self.results.get()
+            if event is None:
+                break
+            if isinstance(event, tuple):
+                kind, pid, status = event
+                if kind == "filter":
+                    self.filter_stats[pid] = status
+                elif kind == "clock":
+                    self.clock_status = status
+                continue
+            events.publish(events.TRANSCRIPT, event)
+
+    def _supervise(self):
+        while not self._stopping.wait(0.5):
+            now = time.monotonic()
+            for stage in self.stages:
+                if stage.is_alive():
+                    if now - stage.started_at > HEALTHY_AFTER:
+                        stage.backoff = RESTART_BACKOFF
+                    continue
+                if stage.restart_at == 0.0:
+                    logger.error(
+                        f"{stage.name} process exited with code "
+                        f"{stage.process.exitcode}, restarting in "
+                        f"{stage.backoff:g}s")
+                    stage.restart_at = now + stage.backoff
+                    stage.backoff = min(stage.backoff * 2,
+                                        MAX_RESTART_BACKOFF)
+                elif now >= stage.restart_at:
+                    stage.restart_at = 0.0
+                    stage.restarts += 1
+                    stage.start(self.context)
+
+    def stop(self, timeout: float = 5):
+        logger.info("Stopping process pipeline...")
+        self._stopping.set()
+        if self._supervisor is not None:
+            self._supervisor.join()
+
+        # Terminating capture ends FFmpeg, the partial last chunk is queued
+        # and dropped with the other pending chunks below
+        if self.capture.is_alive():
+            self.capture.process.terminate()
+            self.capture.process.join(timeout)
+        if self._scheduling is not None:
+            self.captured.put(None)
+            self._scheduling.join(timeout)
+
+        # Like the threaded pipeline, pending chunks are dropped
+        dropped = 0
+        for pending in self.schedulers + self.chunks:
+            while True:
+                try:
+                    pending.get_nowait()
+                except queue.Empty:
+                    break
+                if isinstance(pending, ChunkScheduler):
+                    pending.task_done()
+                dropped += 1
+        if dropped:
+            logger.info(f"Dropped {dropped} pending chunks")
+        for scheduler, demand in zip(self.schedulers, self.demands):
+            scheduler.put(None)
+            # Also when a worker is gone, the dispatcher must not wait
+            demand.release()
+
+        for stage in self.stages:
+            if stage.process is None:
+                continue
+            stage.process.join(timeout)
+            if stage.process.is_alive():
+                logger.warning(
+                    f"{stage.name} process did not finish in time")
+                stage.process.kill()
+                stage.process.join()
+
+        for dispatcher in self._dispatchers:
+            dispatcher.join(timeout)
+        if self._relay is not None:
+            self.results.put(None)
+            self._relay.join(timeout)
+        self.ring.close()
+        logger.info("Process pipeline stopped")
+        if self._log_listener is not None:
+            self._log_listener.stop()
+
+    def get_filter_stats(self) -> dict:
+        """Transcript filter counts summed over the worker processes."""
+        accepted, rejected = 0, {}
+        for stats in list(self.filter_stats.values()):
+            accepted += stats["accepted"]
+            for reason, count in stats["rejected"].items():
+                rejected[reason] = rejected.get(reason, 0) + count
+        return {"accepted": accepted, "rejected": rejected}
+
+    def get_status(self) -> dict:
+        return {
+            "ring_bytes_written": self.ring.head,
+            "pending_chunks": sum(
+                pending.qsize() for pending in self.schedulers + self.chunks),
+            "schedulers": [scheduler.get_stats()
+                           for scheduler in self.schedulers],
+            "channels": len(self.assignments),
+            "stages": {
+                stage.name: {
+                    "alive": stage.is_alive(),
+                    "pid": stage.process.pid if stage.process else None,
+                    "restarts": stage.restarts,
+                }
+                for stage in self.stages
+            },
+        }
+
+
+pipeline = None
+
+
+def start(workers: int = None) -> Pipeline:
+    """Start the process pipeline (capture and transcription)."""
+    global pipeline
+    if pipeline is not None:
+        logger.warning("Process pipeline is already running")
+        return pipeline
+    pipeline = Pipeline(workers)
+    pipeline.start()
+    logger.info(
+        f"Process pipeline started with {len(pipeline.workers)} workers")
+    return pipeline
+
+
+def stop():
+    global pipeline
+    if pipeline is None:
+        return
+    pipeline.stop()
+    pipeline = None
@@ -0,0 +1,308 @@
+"""On-demand profiling of the running application.
+
+CPU profiles are sampled from the stacks of every thread, so the audio and
+API threads keep running while being profiled. Reports are written under
+`logs/`:
+
+- `*_cpu_profile.txt`: one collapsed stack per line with its sample count
+  (the input format of flamegraph.pl and speedscope), after a summary of
+  the functions the samples were taken in
+- `*_memory.txt`: top allocations of a tracemalloc snapshot and the
+  growth since the previous snapshot
+- `*_stacks.txt`: the current stack of every thread
+
+From the chat use `.prof`, `.mem` and `.stacks`. Without a terminal send
+SIGUSR1 to dump the thread stacks and SIGUSR2 to start or stop CPU
+profiling.
+
+Only the process they run in is profiled: with the process pipeline the
+capture and transcription worker processes are not.
+"""
+import collections
+import datetime
+import linecache
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+import traceback
+import tracemalloc
+
+# Get logger for this module
+logger = logging.getLogger("sigint_profiling")
+
+# Milliseconds between two samples of the thread stacks
+sample_interval_ms = float(os.environ.get("PROFILE_INTERVAL_MS", "10"))
+# Frames recorded per allocation by tracemalloc, more frames cost more
+# memory and time per allocation
+tracemalloc_frames = int(os.environ.get("TRACEMALLOC_FRAMES", "10"))
+# Directory the reports are written to
+reports_dir = "logs"
+
+# Functions and allocation sites listed in the summaries
+TOP_COUNT = 25
+
+
+def _report_path(kind: str) -> str:
+    if not os.path.exists(reports_dir):
+        os.makedirs(reports_dir)
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    path = os.path.join(reports_dir, f"{timestamp}_{kind}.txt")
+    # Several reports of a kind within a second
+    suffix = 1
+    while os.path.exists(path):
+        suffix += 1
+        path = os.path.join(reports_dir, f"{timestamp}_{kind}_{suffix}.txt")
+    return path
+
+
+def _thread_names() -> dict:
+    return {thread.ident: thread.name for thread in threading.enumerate()}
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+class SamplingProfiler:
+    """Statistical CPU profiler of all the threads of the process.
+
+    A background thread wakes up every `interval` seconds and counts the
+    stack of every other thread (`sys._current_frames`). Unlike cProfile,
+    nothing is traced between samples, so the overhead stays low and does
+    not depend on how much code runs.
+    """
+
+    def __init__(self, interval: float = None):
+        self.interval = interval or sample_interval_ms / 1000
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self.started_at = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self):
+        if self.running:
+            return
+        self.stacks.clear()
+        self.samples = 0
+        self.started_at = time.monotonic()
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._run, daemon=True, name="SamplingProfiler")
+        self._thread.start()
+        logger.info("CPU profiling started")
+
+    def _run(self):
+        own_ident = threading.get_ident()
+        names = _thread_names()
+        while not self._stop_event.wait(self.interval):
+            frames = sys._current_frames()
+            if any(ident not in names for ident in frames):
+                names = _thread_names()
+            for ident, frame in frames.items():
+                if ident == own_ident:
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame))
+                    frame = frame.f_back
+                labels.append(names.get(ident, f"thread-{ident}"))
+                self.stacks[";".join(reversed(labels))] += 1
+            self.samples += 1
+
+    def stop(self) -> str:
+        """Stop profiling and write the report.
+
+        Returns:
+            str: The path of the report, None if profiling was not running
+        """
+        if not self.running:
+            return None
+        self._stop_event.set()
+        self._thread.join()
+        self._thread = None
+        path = _report_path("cpu_profile")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.summary())
+            f.write("\n# Collapsed stacks\n")
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        logger.info("CPU profile written to %s", path)
+        return path
+
+    def summary(self) -> str:
+        """Functions the samples were taken in (self) or under (total)."""
+        own = collections.Counter()
+        total = collections.Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")[1:]
+            if not frames:
+                continue
+            own[frames[-1]] += count
+            for label in set(frames):
+                total[label] += count
+        stack_samples = sum(self.stacks.values()) or 1
+        duration = time.monotonic() - self.started_at \
+            if self.started_at is not None else 0.0
+        lines = [
+            f"# {self.samples} samples over {duration:.1f}s, "
+            f"{sample_interval_ms:g} ms interval",
+            "", "# Self", "",
+        ]
+        lines += [f"{count / stack_samples:7.1%}  {label}"
+                  for label, count in own.most_common(TOP_COUNT)]
+        lines += ["", "# Total", ""]
+        lines += [f"{count / stack_samples:7.1%}  {label}"
+                  for label, count in total.most_common(TOP_COUNT)]
+        return "\n".join(lines) + "\n"
+
+
+profiler = SamplingProfiler()
+_last_snapshot = None
+_lock = threading.Lock()
+
+
+def start_cpu_profile() -> bool:
+    """Start CPU profiling, False if it is already running."""
+    with _lock:
+        if profiler.running:
+            return False
+        profiler.start()
+        return True
+
+
+def stop_cpu_profile() -> str:
+    """Stop CPU profiling.
+
+    Returns:
+        str: The path of the report, None if profiling was not running
+    """
+    with _lock:
+        return profiler.stop()
+
+
+def toggle_cpu_profile() -> str:
+    """Start CPU profiling, or stop it and return the report path."""
+    with _lock:
+        if profiler.running:
+            return profiler.stop()
+        profiler.start()
+        return None
+
+
+def snapshot_memory() -> str:
+    """Take a tracemalloc snapshot and diff it with the previous one.
+
+    The first call starts tracing, only allocations made from then on are
+    seen. Call again later to get a report.
+
+    Returns:
+        str: The path of the report, None when tracing was just started
+    """
+    global _last_snapshot
+    with _lock:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(tracemalloc_frames)
+            _last_snapshot = None
+            logger.info("Memory tracing started")
+            return None
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            # Source lines cached while formatting the previous report
+            tracemalloc.Filter(False, linecache.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ])
+        previous, _last_snapshot = _last_snapshot, snapshot
+
+    current, peak = tracemalloc.get_traced_memory()
+    path = _report_path("memory")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f"# Traced memory: {current / 2**20:.1f} MiB, "
+                f"peak {peak / 2**20:.1f} MiB\n\n# Top allocations\n\n")
+        for stat in snapshot.statistics("lineno")[:TOP_COUNT]:
+            f.write(f"{stat}\n")
+        if previous is not None:
+            f.write("\n# Growth since the previous snapshot\n\n")
+            for stat in snapshot.compare_to(previous, "lineno")[:TOP_COUNT]:
+                f.write(f"{stat}\n")
+        f.write("\n# Largest allocation tracebacks\n")
+        for stat in snapshot.statistics("traceback")[:5]:
+            f.write(f"\n{stat.count} blocks, {stat.size / 1024:.1f} KiB\n")
+            f.writelines(f"{line}\n" for line in stat.traceback.format())
+    logger.info("Memory report written to %s", path)
+    return path
+
+
+def stop_memory_tracing():
+    """Stop tracing allocations and release the snapshots."""
+    global _last_snapshot
+    with _lock:
+        _last_snapshot = None
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+            logger.info("Memory tracing stopped")
+
+
+def dump_stacks() -> str:
+    """Write the current stack of every thread.
+
+    Returns:
+        str: The path of the report
+    """
+    names = _thread_names()
+    path = _report_path("stacks")
+    with open(path, "w", encoding="utf-8") as f:
+        for ident, frame in sys._current_frames().items():
+            f.write(f"# Thread {names.get(ident, '?')} ({ident})\n")
+            f.writelines(traceback.format_stack(frame))
+            f.write("\n")
+    logger.info("Thread stacks written to %s", path)
+    return path
+
+
+def get_status() -> dict:
+    """State of the CPU profiler and of memory tracing."""
+    return {
+        "cpu_profiling": profiler.running,
+        "cpu_samples": profiler.samples,
+        "memory_tracing": tracemalloc.is_tracing(),
+    }
+
+
+def install_signal_handlers():
+    """SIGUSR1 dumps the thread stacks, SIGUSR2 toggles CPU profiling."""
+    if not hasattr(signal, "SIGUSR1"):
+        return
+
+    # Not in the handlers, they interrupt the main thread which may hold
+    # the profiler lock or the lock of a logging handler
+    def on_stacks(signum, frame):
+        threading.Thread(target=_dump_from_signal, daemon=True).start()
+
+    def on_profile(signum, frame):
+        threading.Thread(target=_toggle_from_signal, daemon=True).start()
+
+    signal.signal(signal.SIGUSR1, on_stacks)
+    signal.signal(signal.SIGUSR2, on_profile)
+
+
+def _dump_from_signal():
+    try:
+        dump_stacks()
+    except Exception as e:
+        logger.error("Error dumping thread stacks: %s", e)
+
+
+def _toggle_from_signal():
+    try:
+        toggle_cpu_profile()
+    except Exception as e:
+        logger.error("Error toggling CPU profiling: %s", e)
@@ -0,0 +1,172 @@
+import bisect
+import datetime
+import logging
+import os
+import time
+
+# Get logger for this module
+logger = logging.getLogger("sigint_sample_clock")
+
+# Seconds the sample clock may fall behind wall time before it is
+# corrected (samples lost on the UDP stream)
+max_drift = float(os.environ.get("SAMPLE_CLOCK_MAX_DRIFT", "1.0"))
+# Seconds the sample clock may run ahead of wall time before it is pulled
+# back (live input faster than its nominal rate), 0 for no limit
+max_lead = float(os.environ.get("SAMPLE_CLOCK_MAX_LEAD", "1.0"))
+# Seconds of wall time between two drift corrections
+correction_interval = float(os.environ.get("SAMPLE_CLOCK_INTERVAL", "60"))
+# Seconds without audio after which the stream is considered interrupted
+gap_seconds = float(os.environ.get("SAMPLE_CLOCK_GAP", "2.0"))
+
+# Anchors kept, older chunks are long processed
+MAX_ANCHORS = 1000
+# Seconds the clock is pulled back by at most per correction, less than a
+# chunk so the times of consecutive chunks stay in order
+MAX_STEP_BACK = 5.0
+# Audio arriving this much faster than real time over a correction window
+# is a replay, the clock of a live source is off by far less
+REPLAY_RATE = 0.05
+
+
+class SampleClock:
+    """Time base of an audio stream derived from its sample count.
+
+    The time of a byte offset in the stream is the time of the last anchor
+    before it plus the duration of the audio in between, so timestamps do
+    not depend on when the audio is read or processed. The first anchor is
+    set when the first audio arrives.
+
+    Wall time is only used to correct the clock: when the stream resumes
+    after a gap, when the audio consistently arrives later than its sample
+    time would allow (samples were lost), and when it consistently arrives
+    more than `max_lead` before its sample time, which live audio cannot
+    do. A clock running ahead is pulled back by at most MAX_STEP_BACK per
+    correction. Audio arriving more than REPLAY_RATE faster than real time
+    is a faster than real time replay, it is left on the sample time.
+    """
+
+    def __init__(self, bytes_per_second: int):
+        self.bytes_per_second = bytes_per_second
+        self.position = 0
+        # (byte offset, time) pairs, sorted
+        self.offsets = []
+        self.times = []
+        self.started_at = None
+        self.corrections = 0
+        self.replay = False
+        self._last_advance = None
+        self._window_start = None
+        self._window_time = None
+        self._window_position = 0
+        self._min_lateness = None
+        self._max_lateness = None
+
+    def _duration(self, nbytes: int) -> datetime.timedelta:
+        return datetime.timedelta(seconds=nbytes / self.bytes_per_second)
+
+    def _anchor(self, offset: int, at: datetime.datetime):
+        self.offsets.append(offset)
+        self.times.append(at)
+        if len(self.offsets) > MAX_ANCHORS:
+            del self.offsets[0], self.times[0]
+
+    def time_at(self, offset: int) -> datetime.datetime:
+        """Time the audio at a byte offset of the stream was captured."""
+        if not self.offsets:
+            return datetime.datetime.now()
+        i = max(0, bisect.bisect_right(self.offsets, offset) - 1)
+        return self.times[i] + self._duration(offset - self.offsets[i])
+
+    def advance(self, nbytes: int, now: datetime.datetime = None):
+        """Count `nbytes` of audio just received.
+
+        Args:
+            nbytes (int): Bytes received
+            now (datetime): Time they were received, defaults to now
+        """
+        now = now or datetime.datetime.now()
+        received = time.monotonic()
+        start = self.position
+        self.position += nbytes
+        if not self.offsets:
+            # The audio read ends now
+            self.started_at = now - self._duration(nbytes)
+            self._anchor(start, self.started_at)
+            self._reset_window(received, now)
+            self._last_advance = received
+            return
+
+        # How much later than its sample time the audio arrived
+        lateness = (now - self.time_at(self.position)).total_seconds()
+        waited = received - self._last_advance
+        self._last_advance = received
+        if waited > gap_seconds and lateness > max_drift and \
+                nbytes / self.bytes_per_second < waited / 2:
+            # Little audio came for a while, the stream was interrupted and
+            # the audio read now was captured just now. A stalled reader
+            # finds the audio of the stall waiting in the pipe instead
+            self._anchor(start, now - self._duration(nbytes))
+            self.corrections += 1
+            self._reset_window(received, now)
+            logger.info(
+                "Audio stream resumed after %.1fs, clock re-anchored",
+                lateness)
+            return
+
+        if self._min_lateness is None or lateness < self._min_lateness:
+            self._min_lateness = lateness
+        if self._max_lateness is None or lateness > self._max_lateness:
+            self._max_lateness = lateness
+        if received - self._window_start < correction_interval:
+            return
+        # The least lateness of the window is the pipe latency when the
+        # clock is right, a backlog being read does not raise it
+        if self._min_lateness > max_drift:
+            self._anchor(self.position, self.time_at(self.position)
+                         + datetime.timedelta(seconds=self._min_lateness))
+            self.corrections += 1
+            logger.info("Sample clock %.2fs behind wall time, corrected",
+                        self._min_lateness)
+        # All the audio of the window arrived before its sample time
+        elif max_lead > 0 and self._max_lateness < -max_lead \
+                and not self._replaying(now):
+            step = min(-self._max_lateness, MAX_STEP_BACK)
+            self._anchor(self.position, self.time_at(self.position)
+                         - datetime.timedelta(seconds=step))
+            self.corrections += 1
+            logger.info("Sample clock %.2fs ahead of wall time, pulled "
+                        "back %.2fs", -self._max_lateness, step)
+        self._reset_window(received, now)
+
+    def _replaying(self, now: datetime.datetime) -> bool:
+        audio = (self.position - self._window_position) \
+            / self.bytes_per_second
+        wall = (now - self._window_time).total_seconds()
+        replay = audio > wall * (1 + REPLAY_RATE)
+        if replay != self.replay:
+            self.replay = replay
+            logger.info("Audio %s", "faster than real time, replay kept on "
+                        "its sample time" if replay else "back to real time")
+        return replay
+
+    def _reset_window(self, received: float, now: datetime.datetime):
+        self._window_start = received
+        self._window_time = now
+        self._window_position = self.position
+        self._min_lateness = None
+        self._max_lateness = None
+
+    def get_status(self) -> dict:
+        """Audio seconds counted, start time, current lateness (negative
+        when ahead of wall time) and the number of corrections."""
+        lateness = (datetime.datetime.now()
+                    - self.time_at(self.position)).total_seconds() \
+            if self.offsets else None
+        return {
+            "seconds": self.position / self.bytes_per_second,
+            "started_at": self.started_at.isoformat()
+            if self.started_at else None,
+            "lateness": lateness,
+            "corrections": self.corrections,
+            "replay": self.replay,
+        }
@@ -0,0 +1,245 @@
+import datetime
+import os
+import logging
+import threading
+import time
+
+import database
+import gqrx_client as gqrx
+from intents import parse_frequency
+
+# Get logger for this module
+logger = logging.getLogger("sigint_scanner")
+
+# Time for GQRX to settle on a new frequency before measuring (seconds)
+settle_time = float(os.environ.get("SCAN_SETTLE_MS", "60")) / 1000
+# Signal level (dBFS) counted as activity when the GQRX squelch is off
+activity_threshold = float(os.environ.get("SCAN_THRESHOLD", "-60"))
+# Keep dwelling this long after the signal drops (seconds)
+hang_time = float(os.environ.get("SCAN_HANG", "2.0"))
+# Stop dwelling after this long even if the channel stays busy, 0 = never
+max_dwell = float(os.environ.get("SCAN_MAX_DWELL", "0"))
+# Base interval between two visits of an idle channel (seconds)
+revisit_interval = float(os.environ.get("SCAN_REVISIT", "2.0"))
+# Step used for ranges without an explicit step (Hz)
+default_step = 25_000
+# Polling interval while dwelling on an active channel (seconds)
+dwell_poll = 0.1
+# Decay applied to the activity score of a channel on every visit
+activity_decay = 0.9
+# Squelch level reported by GQRX when the squelch is disabled
+SQUELCH_OFF = -150.0
+
+scan_thread = None
+stop_event = threading.Event()
+channels = []
+# Frequency the scanner is currently dwelling on, if any
+dwelling_on = None
+
+
+class Channel:
+    """Scan list entry with its hit statistics."""
+
+    def __init__(self, frequency: int):
+        self.frequency = frequency
+        self.hits = 0
+        self.visits = 0
+        self.active_seconds = 0.0
+        self.last_hit = None
+        self.activity = 0.0
+        self.next_visit = 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "frequency": self.frequency,
+            "hits": self.hits,
+            "visits": self.visits,
+            "active_seconds": round(self.active_seconds, 1),
+            "last_hit": self.last_hit.isoformat(timespec="seconds")
+            if self.last_hit else None,
+        }
+
+
+def parse_channels(spec: str) -> list:
+    """Parse a scan list into frequencies in Hz.
+
+    The list is comma separated. Each entry is a single frequency or a
+    `start-end` range with an optional `:step`, using the same units as
+    the operator commands (decimals are MHz), e.g.
+    `145.500, 146.000-146.100:0.025`.
+
+    Args:
+        spec (str): The scan list
+
+    Returns:
+        list: Sorted unique frequencies in Hz
+
+    Raises:
+        ValueError: If an entry cannot be parsed
+    """
+    frequencies = set()
+    for entry in spec.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        range_part, _, step_part = entry.partition(":")
+        start_part, _, end_part = range_part.partition("-")
+        start = parse_frequency(start_part.strip())
+        end = parse_frequency(end_part.strip()) if end_part else start
+        step = parse_frequency(step_part.strip()) if step_part \
+            else default_step
+        if not start or not end or not step:
+            raise ValueError(f"Invalid scan list entry: {entry}")
+        if end < start:
+            start, end = end, start
+        frequencies.update(range(start, end + 1, step))
+    return sorted(frequencies)
+
+
+def measure():
+    """Read the signal level and squelch from GQRX.
+
+    Returns:
+        tuple: (signal level in dBFS, activity threshold in dBFS)
+    """
+    level, squelch = gqrx.send_batch(["l", "l SQL"])
+    squelch = float(squelch)
+    threshold = squelch if squelch > SQUELCH_OFF else activity_threshold
+    return float(level), threshold
+
+
+def next_channel():
+    """Pick the channel due first, favoring channels with recent activity."""
+    return min(channels, key=lambda channel: channel.next_visit)
+
+
+def dwell(channel: Channel, tuned_at: datetime.datetime):
+    """Stay on an active channel while it keeps transmitting."""
+    global dwelling_on
+
+    logger.info(f"Activity on {channel.frequency} Hz, dwelling")
+    dwelling_on = channel.frequency
+    channel.hits += 1
+    channel.last_hit = tuned_at
+    # Start the session at tune time so the transmission is attributed
+    # to this frequency from its first sample
+    database.save_session(channel.frequency, timestamp=tuned_at)
+
+    started = time.monotonic()
+    last_active = started
+    try:
+        while not stop_event.is_set():
+            now = time.monotonic()
+            if now - last_active > hang_time:
+                break
+            if max_dwell and now - started > max_dwell:
+                logger.info(
+                    f"Max dwell reached on {channel.frequency} Hz")
+                break
+            stop_event.wait(dwell_poll)
+            level, threshold = measure()
+            if level > threshold:
+                last_active = time.monotonic()
+    finally:
+        channel.active_seconds += last_active - started
+        dwelling_on = None
+        # Audio captured while sweeping belongs to no frequency
+        database.save_session(None)
+        logger.info(
+            f"Channel {channel.frequency} Hz quiet again after "
+            f"{last_active - started:.1f}s")
+
+
+def scan_loop():
+    logger.info(f"Scanner started on {len(channels)} channels")
+    database.save_session(None)
+    while not stop_event.is_set():
+        channel = next_channel()
+        delay = channel.next_visit - time.monotonic()
+        if delay > 0:
+            stop_event.wait(delay)
+            continue
+
+        try:
+            gqrx.send_batch([f"F {channel.frequency}"])
+            tuned_at = datetime.datetime.now()
+            stop_event.wait(settle_time)
+            level, threshold = measure()
+        except Exception as e:
+            logger.error(f"Error scanning {channel.frequency} Hz: {e}")
+            stop_event.wait(1.0)
+            continue
+
+        channel.visits += 1
+        channel.activity *= activity_decay
+        if level > threshold:
+            channel.activity += 1.0
+            try:
+                dwell(channel, tuned_at)
+            except Exception as e:
+                logger.error(
+                    f"Error dwelling on {channel.frequency} Hz: {e}")
+
+        # Busy channels are revisited more often than idle ones
+        channel.next_visit = time.monotonic() + \
+            revisit_interval / (1.0 + channel.activity)
+    logger.info("Scanner stopped")
+
+
+def start_scan(frequencies: list):
+    """Start scanning the given frequencies in a background thread.
+
+    Args:
+        frequencies (list): Frequencies to scan in Hz
+
+    Returns:
+        threading.Thread: The scanner thread
+    """
+    global scan_thread, channels
+
+    stop_scan()
+    if not frequencies:
+        raise ValueError("Nothing to scan")
+    # Keep the statistics of channels that were already in the scan list
+    known = {channel.frequency: channel for channel in channels}
+    channels = [known.get(f) or Channel(f) for f in frequencies]
+    for channel in channels:
+        channel.next_visit = 0.0
+
+    stop_event.clear()
+    scan_thread = threading.Thread(
+        target=scan_loop,
+        daemon=True,
+        name="ScannerThread"
+    )
+    scan_thread.start()
+    return scan_thread
+
+
+def stop_scan():
+    """Stop the scanner, if it is running."""
+    if scan_thread is None or not scan_thread.is_alive():
+        return False
+    logger.info("Stopping scanner...")
+    stop_event.set()
+    scan_thread.join(timeout=5)
+    if scan_thread.is_alive():
+        logger.warning("Scanner thread did not finish in time")
+    return True
+
+
+def is_scanning() -> bool:
+    return scan_thread is not None and scan_thread.is_alive()
+
+
+def get_status() -> dict:
+    """Get the scanner state and hit statistics, busiest channels first."""
+    return {
+        "scanning": is_scanning(),
+        "dwelling_on": dwelling_on,
+        "channels": [
+            channel.to_dict()
+            for channel in sorted(
+                channels, key=lambda c: (-c.hits, c.frequency))
+        ],
+    }
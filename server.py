@@ -0,0 +1,316 @@
+import asyncio
+import datetime
+import json
+import os
+import logging
+import re
+import uuid
+
+from aiohttp import web, WSMsgType
+
+import agent
+import database
+import events
+import export
+import groq_client
+from history import history_dir
+from intents import parse_frequency
+
+# Get logger for this module
+logger = logging.getLogger("sigint_server")
+
+# Largest page of transcripts a client can request
+MAX_PAGE_SIZE = 500
+# Intercepts queued per live stream client before the oldest are dropped
+LIVE_QUEUE_SIZE = 200
+
+_session_id_re = re.compile(r"^[0-9a-f]{12}$")
+
+
+class ChatSession:
+    """Independent agent conversation of one API client."""
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.history = agent.new_history(f"api_{session_id}")
+        # One turn at a time, concurrent requests queue up
+        self.lock = asyncio.Lock()
+
+
+sessions = {}
+
+
+def query_frequency(value: str) -> int:
+    """Frequency in Hz of a query parameter.
+
+    Raises:
+        ValueError: If the value is not a number or is ambiguous
+    """
+    frequency = parse_frequency(value)
+    if frequency is None:
+        raise ValueError(f"Ambiguous frequency: {value}")
+    return frequency
+
+
+def get_session(session_id: str) -> ChatSession:
+    """Get a chat session, restoring it from disk after a restart."""
+    session = sessions.get(session_id)
+    if session is not None:
+        return session
+    path = os.path.join(history_dir, f"api_{session_id}.json")
+    if not _session_id_re.match(session_id) or not os.path.exists(path):
+        raise web.HTTPNotFound(
+            text=json.dumps({"error": "Unknown session"}),
+            content_type="application/json")
+    session = sessions[session_id] = ChatSession(session_id)
+    return session
+
+
+async def create_session(request):
+    session_id = uuid.uuid4().hex[:12]
+    session = sessions[session_id] = ChatSession(session_id)
+    session.history.save()
+    logger.info(f"Created chat session {session_id}")
+    return web.json_response({"session_id": session_id}, status=201)
+
+
+async def list_sessions(request):
+    return web.json_response({"sessions": sorted(sessions)})
+
+
+async def get_messages(request):
+    session = get_session(request.match_info["session_id"])
+    return web.json_response({"messages": list(session.history[1:])})
+
+
+async def post_message(request):
+    session = get_session(request.match_info["session_id"])
+    try:
+        body = await request.json()
+        message = str(body["message"]).strip()
+    except (ValueError, KeyError, TypeError):
+        return web.json_response(
+            {"error": "Expected a JSON body with a 'message'"}, status=400)
+    if not message:
+        return web.json_response({"error": "Empty message"}, status=400)
+
+    async with session.lock:
+        response = await agent.run(message, history=session.history)
+    return web.json_response({"response": response})
+
+
+async def chat_websocket(request):
+    """Stream agent answers over a WebSocket.
+
+    The client sends `{"message": "..."}` and receives `chunk` events
+    followed by a `done` event. `{"type": "cancel"}` interrupts the answer.
+    """
+    session = get_session(request.match_info["session_id"])
+    ws = web.WebSocketResponse(heartbeat=30)
+    await ws.prepare(request)
+
+    outgoing = asyncio.Queue()
+    turn = None
+
+    async def sender():
+        while True:
+            await ws.send_json(await outgoing.get())
+
+    async def run_turn(message):
+        async with session.lock:
+            try:
+                content = await agent.run(
+                    message,
+                    stream_handler=lambda chunk: outgoing.put_nowait(
+                        {"type": "chunk", "content": chunk}),
+                    history=session.history)
+                outgoing.put_nowait({"type": "done", "content": content})
+            except asyncio.CancelledError:
+                outgoing.put_nowait({"type": "cancelled"})
+            except Exception as e:
+                logger.error(f"Error in chat session: {e}", exc_info=True)
+                outgoing.put_nowait({"type": "error", "error": str(e)})
+
+    sender_task = asyncio.create_task(sender())
+    try:
+        async for msg in ws:
+            if msg.type != WSMsgType.TEXT:
+                continue
+            try:
+                data = json.loads(msg.data)
+            except ValueError:
+                outgoing.put_nowait(
+                    {"type": "error", "error": "Invalid JSON"})
+                continue
+            if not isinstance(data, dict):
+                outgoing.put_nowait(
+                    {"type": "error", "error": "Expected a JSON object"})
+                continue
+            if data.get("type") == "cancel":
+                if turn is not None and not turn.done():
+                    turn.cancel()
+            elif data.get("message"):
+                if turn is not None and not turn.done():
+                    outgoing.put_nowait({
+                        "type": "error",
+                        "error": "An answer is already in progress"})
+                    continue
+                turn = asyncio.create_task(run_turn(str(data["message"])))
+    finally:
+        if turn is not None and not turn.done():
+            turn.cancel()
+        # Let queued events go out before closing
+        while not outgoing.empty() and not ws.closed:
+            await asyncio.sleep(0.01)
+        sender_task.cancel()
+    return ws
+
+
+async def get_transcripts(request):
+    """Page through transcripts, newest first.
+
+    Query parameters: `frequency`, `limit` and `before_id` (the
+    `next_before_id` of the previous page).
+    """
+    try:
+        frequency = request.query.get("frequency")
+        if frequency is not None:
+            frequency = query_frequency(frequency)
+        before_id = request.query.get("before_id")
+        before_id = int(before_id) if before_id else None
+        limit = min(int(request.query.get("limit", 50)), MAX_PAGE_SIZE)
+    except ValueError:
+        return web.json_response(
+            {"error": "Invalid query parameters"}, status=400)
+
+    # SQLite queries block, keep them off the event loop
+    loop = asyncio.get_running_loop()
+    transcripts = await loop.run_in_executor(
+        None, database.get_transcripts_page, frequency, before_id, limit)
+    return web.json_response({
+        "transcripts": [database.transcript_event(t) for t in transcripts],
+        "next_before_id": transcripts[-1].id
+        if len(transcripts) == limit else None,
+    })
+
+
+async def export_transcripts(request):
+    """Stream transcripts as JSONL or CSV, oldest first.
+
+    Query parameters: `format` (jsonl or csv), `frequency_min`,
+    `frequency_max`, `channel` (repeatable), `since` and `until` (ISO
+    times). The response is compressed when the client accepts it.
+    """
+    query = request.query
+    fmt = query.get("format", "jsonl")
+    try:
+        if fmt not in ("jsonl", "csv"):
+            raise ValueError(fmt)
+        filters = {
+            "frequency_min": query_frequency(query["frequency_min"])
+            if query.get("frequency_min") else None,
+            "frequency_max": query_frequency(query["frequency_max"])
+            if query.get("frequency_max") else None,
+            "channels": [query_frequency(c) for c in query.getall(
+                "channel", [])] or None,
+            "start": datetime.datetime.fromisoformat(query["since"])
+            if query.get("since") else None,
+            "end": datetime.datetime.fromisoformat(query["until"])
+            if query.get("until") else None,
+        }
+    except ValueError:
+        return web.json_response(
+            {"error": "Invalid query parameters"}, status=400)
+
+    response = web.StreamResponse(headers={
+        "Content-Type": "application/x-ndjson" if fmt == "jsonl"
+        else "text/csv",
+        "Content-Disposition": f'attachment; filename="intercepts.{fmt}"',
+    })
+    response.enable_compression()
+    await response.prepare(request)
+
+    loop = asyncio.get_running_loop()
+    batches = export.iter_batches(**filters)
+    if fmt == "csv":
+        await response.write(
+            export.encode_batch([], fmt, header=True).encode())
+    while True:
+        # One batch at a time in the executor, SQLite queries block
+        batch = await loop.run_in_executor(None, next, batches, None)
+        if batch is None:
+            break
+        await response.write(export.encode_batch(batch, fmt).encode())
+    await response.write_eof()
+    return response
+
+
+async def intercepts_websocket(request):
+    """Stream new intercepts, optionally filtered by `frequency`."""
+    frequency = request.query.get("frequency")
+    try:
+        frequency = str(query_frequency(frequency)) if frequency else None
+    except ValueError:
+        return web.json_response({"error": "Invalid frequency"}, status=400)
+
+    ws = web.WebSocketResponse(heartbeat=30)
+    await ws.prepare(request)
+
+    loop = asyncio.get_running_loop()
+    wakeup = asyncio.Event()
+    subscription = events.subscribe(
+        events.TRANSCRIPT,
+        (lambda event: event["frequency"] == frequency)
+        if frequency else None,
+        maxsize=LIVE_QUEUE_SIZE,
+        # Published from the audio worker thread, never block it
+        callback=lambda _: loop.call_soon_threadsafe(wakeup.set))
+
+    async def forward():
+        while True:
+            await wakeup.wait()
+            wakeup.clear()
+            if subscription.dropped:
+                dropped, subscription.dropped = subscription.dropped, 0
+                await ws.send_json({"type": "dropped", "count": dropped})
+            for event in subscription.drain():
+                await ws.send_json({"type": "intercept", **event})
+
+    forward_task = asyncio.create_task(forward())
+    try:
+        # Wait for the client to close the connection
+        async for _ in ws:
+            pass
+    finally:
+        forward_task.cancel()
+        subscription.close()
+    return ws
+
+
+async def _warm_up(app):
+    # On the server's event loop, the agent's connections belong to it
+    app["warm_up"] = asyncio.create_task(groq_client.warm_up_async())
+
+
+def create_app() -> web.Application:
+    app = web.Application()
+    app.on_startup.append(_warm_up)
+    app.add_routes([
+        web.post("/api/sessions", create_session),
+        web.get("/api/sessions", list_sessions),
+        web.get("/api/sessions/{session_id}/messages", get_messages),
+        web.post("/api/sessions/{session_id}/messages", post_message),
+        web.get("/api/sessions/{session_id}/ws", chat_websocket),
+        web.get("/api/transcripts", get_transcripts),
+        web.get("/api/export", export_transcripts),
+        web.get("/api/intercepts/ws", intercepts_websocket),
+    ])
+    return app
+
+
+def run(host: str = "127.0.0.1", port: int = 8080):
+    """Serve the API until interrupted (blocking)."""
+    logger.info(f"Starting API server on http://{host}:{port}")
+    print(f"SIGINT Agent API listening on http://{host}:{port}")
+    web.run_app(create_app(), host=host, port=port, print=None,
+                handle_signals=True)
@@ -0,0 +1,612 @@
+import collections
+import datetime
+import itertools
+import logging
+import os
+import queue
+import re
+import threading
+import time
+import zlib
+
+import numpy as np
+
+import database
+import events
+from transcript_filter import normalize_text
+
+# Get logger for this module
+logger = logging.getLogger("sigint_similarity_index")
+
+# Size of the hash space of the n-grams. Vectors are sparse, memory depends
+# on the n-grams of each intercept: 3 bytes per n-gram up to 65536, 5 above,
+# and 2 bytes of postings
+vector_dim = int(os.environ.get("SIMILARITY_DIM", str(2 ** 16)))
+# Intercepts kept in the index, the oldest are aged out beyond it
+max_rows = int(os.environ.get("SIMILARITY_MAX_ROWS", "500000"))
+# Seconds between two clusterings of the recent intercepts
+cluster_interval = float(os.environ.get("CLUSTER_INTERVAL", "600"))
+# Number of most recent intercepts clustered
+cluster_window = int(os.environ.get("CLUSTER_WINDOW", "2000"))
+
+# Character n-gram sizes
+NGRAM_SIZES = (3, 4)
+# Similarity from which two intercepts follow the same template
+CLUSTER_SIMILARITY = 0.8
+# Less similar intercepts are not returned by a search
+MIN_SIMILARITY = 0.1
+# Intercepts per storage block, the index grows by whole blocks
+BLOCK_ROWS = 4096
+# Full blocks merged into one segment, searched as a single block. Rows
+# of a segment are numbered on 16 bits
+SEGMENT_BLOCKS = 16
+# N-grams per intercept a new block has room for
+BLOCK_NGRAMS = 128
+# Sublinear term frequency of an n-gram count, counts are stored on 8 bits
+LOG_TF = (1 + np.log(np.maximum(np.arange(256), 1))).astype(np.float32)
+# N-grams in more of the intercepts of a block than this are not posted,
+# their weight is low and their postings long
+STOP_FRACTION = 0.2
+# Best candidates found in the postings, scored exactly
+SEARCH_CANDIDATES = 500
+BACKFILL_BATCH = 1000
+# The IDF weights and row norms are recomputed when this fraction of the
+# index was added since the last time
+REWEIGHT_GROWTH = 0.1
+
+
+_digit_re = re.compile(r"\d")
+
+
+def ngram_counts(text: str, dim: int = None):
+    """Hashed character n-grams of a text.
+
+    Character n-grams make the vectors robust to the spelling variations
+    and misheard words of transcriptions. Digits are folded together, so
+    messages differing only in times or numbers follow the same template.
+
+    Returns:
+        tuple: Sorted `indices` of the n-gram hashes and their `counts`
+    """
+    dim = dim or vector_dim
+    normalized = _digit_re.sub("0", f" {normalize_text(text)} ")
+    hashes = [
+        zlib.crc32(normalized[i:i + n].encode("utf-8")) % dim
+        for n in NGRAM_SIZES
+        for i in range(len(normalized) - n + 1)
+    ]
+    if not hashes:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return np.unique(np.array(hashes, dtype=np.int64), return_counts=True)
+
+
+def vectorize(text: str, dim: int = None):
+    """Sparse term frequency vector of a text, L2 normalized.
+
+    Returns:
+        tuple: Sorted `indices` of the n-gram hashes and their `values`
+    """
+    indices, counts = ngram_counts(text, dim)
+    # Sublinear term frequency, repeated words do not dominate
+    values = LOG_TF[np.minimum(counts, 255)]
+    if len(values):
+        values = values / np.linalg.norm(values)
+    return indices, values
+
+
+def _timestamp(value) -> float:
+    return value.timestamp() if value is not None else 0.0
+
+
+def _frequency(value) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _ranges(starts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """Concatenation of the `arange(start, start + length)` ranges."""
+    ends = np.cumsum(lengths)
+    return np.repeat(starts - ends + lengths, lengths) + np.arange(ends[-1]) \
+        if len(lengths) else np.zeros(0, dtype=np.int64)
+
+
+def _row_sums(products: np.ndarray, indptr: np.ndarray) -> np.ndarray:
+    # Rows are never empty, each segment sums one row
+    return np.add.reduceat(products, indptr[:-1]) if len(products) \
+        else np.zeros(len(indptr) - 1, dtype=np.float32)
+
+
+class _Block:
+    """Fixed number of sparse rows in CSR layout.
+
+    A row stores its n-gram hashes and counts, and the scale normalizing
+    its term frequencies, so an n-gram takes 3 bytes. Once full, the block
+    also gets postings: the rows of every n-gram, 2 bytes per n-gram of a
+    row, except for the n-grams of more than STOP_FRACTION of the rows.
+    Until then the rows of its n-grams are kept in lists.
+    """
+
+    def __init__(self, index_dtype=np.uint16, rows: int = None):
+        rows = rows or BLOCK_ROWS
+        self.count = 0
+        self.capacity = rows
+        self.ids = np.zeros(rows, dtype=np.int64)
+        self.frequencies = np.zeros(rows, dtype=np.int64)
+        self.times = np.zeros(rows, dtype=np.float64)
+        self.scales = np.zeros(rows, dtype=np.float32)
+        self.norms = np.ones(rows, dtype=np.float32)
+        self.indptr = np.zeros(rows + 1, dtype=np.int64)
+        self.indices = np.zeros(rows * BLOCK_NGRAMS, dtype=index_dtype)
+        self.counts = np.zeros(rows * BLOCK_NGRAMS, dtype=np.uint8)
+        # Posted n-grams (sorted), where their rows start in `posting_rows`
+        self.keys = None
+        self.posting_starts = None
+        self.posting_rows = None
+        self._live = collections.defaultdict(list)
+
+    @property
+    def full(self) -> bool:
+        return self.count == self.capacity
+
+    @classmethod
+    def merge(cls, blocks: list):
+        """One full block holding the rows of full blocks, posted."""
+        merged = cls.__new__(cls)
+        merged.count = merged.capacity = sum(b.count for b in blocks)
+        for name in ("ids", "frequencies", "times", "scales", "norms",
+                     "indices", "counts"):
+            setattr(merged, name,
+                    np.concatenate([getattr(b, name) for b in blocks]))
+        ends = np.cumsum([b.indptr[-1] for b in blocks])
+        merged.indptr = np.r_[0, np.concatenate(
+            [b.indptr[1:] + end - b.indptr[-1]
+             for b, end in zip(blocks, ends)])]
+        merged._post()
+        return merged
+
+    @property
+    def nbytes(self) -> int:
+        arrays = [self.ids, self.frequencies, self.times, self.scales,
+                  self.norms, self.indptr, self.indices, self.counts]
+        if self.keys is not None:
+            arrays += [self.keys, self.posting_starts, self.posting_rows]
+        return sum(a.nbytes for a in arrays)
+
+    def rows(self, start: int = 0):
+        """`indptr`, `indices` and term frequencies of the rows from
+        `start`, the term frequencies are not scaled."""
+        begin, end = self.indptr[start], self.indptr[self.count]
+        return (self.indptr[start:self.count + 1] - begin,
+                self.indices[begin:end], LOG_TF[self.counts[begin:end]])
+
+    def _resize(self, size: int):
+        # Only the n-grams of this block are copied
+        end = self.indptr[self.count]
+        for name in ("indices", "counts"):
+            array = getattr(self, name)
+            resized = np.zeros(size, dtype=array.dtype)
+            resized[:end] = array[:end]
+            setattr(self, name, resized)
+
+    def append(self, transcript_id, frequency, timestamp, indices, counts):
+        begin = self.indptr[self.count]
+        end = begin + len(indices)
+        if end > len(self.indices):
+            self._resize(max(end, len(self.indices) * 3 // 2))
+        self.indices[begin:end] = indices
+        self.counts[begin:end] = np.minimum(counts, 255)
+        row = self.count
+        self.ids[row] = transcript_id
+        self.frequencies[row] = _frequency(frequency)
+        self.times[row] = _timestamp(timestamp)
+        self.scales[row] = 1 / np.linalg.norm(LOG_TF[self.counts[begin:end]])
+        self.indptr[row + 1] = end
+        self.count += 1
+        for key in indices.tolist():
+            self._live[key].append(row)
+        if self.full:
+            if end < len(self.indices):
+                # Release the room left for more n-grams
+                self._resize(end)
+            self._post()
+        return row
+
+    def _post(self):
+        indptr, indices, _ = self.rows()
+        rows = np.repeat(np.arange(self.count).astype(np.uint16),
+                         np.diff(indptr))
+        order = np.argsort(indices, kind="stable")
+        keys, counts = np.unique(indices[order], return_counts=True)
+        posted = counts <= STOP_FRACTION * self.count
+        self.keys = keys[posted]
+        self.posting_starts = np.r_[0, np.cumsum(counts[posted])] \
+            .astype(np.int32)
+        self.posting_rows = rows[order][np.repeat(posted, counts)]
+        self._live = None
+
+    def candidates(self, query_indices: np.ndarray,
+                   query_weights: np.ndarray) -> np.ndarray:
+        """Weight of the posted query n-grams in every row."""
+        if self.keys is None:
+            postings = [self._live.get(key, ())
+                        for key in query_indices.tolist()]
+            lengths = [len(rows) for rows in postings]
+            rows = np.fromiter(itertools.chain.from_iterable(postings),
+                               dtype=np.int64, count=sum(lengths))
+            return np.bincount(rows, np.repeat(query_weights, lengths),
+                               minlength=self.count)
+        found = np.searchsorted(self.keys, query_indices)
+        found[found == len(self.keys)] = 0
+        hits = self.keys[found] == query_indices
+        found = found[hits]
+        starts = self.posting_starts[found]
+        lengths = self.posting_starts[found + 1] - starts
+        rows = self.posting_rows[_ranges(starts, lengths)]
+        return np.bincount(rows, np.repeat(query_weights[hits], lengths),
+                           minlength=self.count)
+
+    def dot(self, rows: np.ndarray, weights: np.ndarray) -> np.ndarray:
+        """Dot products of some rows with a dense vector."""
+        starts = self.indptr[rows]
+        lengths = self.indptr[rows + 1] - starts
+        positions = _ranges(starts, lengths)
+        products = LOG_TF[self.counts[positions]] \
+            * weights[self.indices[positions]]
+        return _row_sums(products, np.r_[0, np.cumsum(lengths)]) \
+            * self.scales[rows]
+
+
+class SimilarityIndex:
+    """In-memory sparse vector index of the intercepts.
+
+    The hashed n-gram vectors of the intercepts are stored as sparse rows
+    (n-gram hash and count), in blocks of BLOCK_ROWS intercepts. The index
+    grows by adding blocks, and every SEGMENT_BLOCKS full blocks are merged
+    into a segment, so a row is copied once. The oldest block or segment
+    is dropped beyond `max_rows`. The hash space is large enough for the
+    n-grams of two intercepts to rarely collide.
+
+    IDF weights are applied at query time, from document frequencies kept
+    up to date as intercepts are added and aged out, so the stored vectors
+    never need to be rebuilt. A search looks the query n-grams up in the
+    postings of the full blocks and scores the best candidates of each
+    exactly, the block being filled is scanned. Intercepts sharing only
+    very common n-grams with the query are not found, they would score
+    low anyway.
+    """
+
+    def __init__(self, dim: int = None, rows: int = None):
+        self.dim = dim or vector_dim
+        self.max_rows = rows or max_rows
+        self.index_dtype = np.uint16 if self.dim <= 2 ** 16 else np.uint32
+        self.blocks = collections.deque()
+        self.count = 0
+        self.document_frequency = np.zeros(self.dim, dtype=np.float64)
+        self.last_id = 0
+        self.clusters = []
+        self.clustered_at = None
+        self._added = 0
+        self._idf = np.ones(self.dim, dtype=np.float32)
+        self._lock = threading.RLock()
+
+    @property
+    def nbytes(self) -> int:
+        """Memory used by the stored vectors."""
+        return sum(block.nbytes for block in self.blocks)
+
+    def _norms(self, block: _Block, start: int = 0) -> np.ndarray:
+        # Norms of the IDF weighted rows
+        indptr, indices, tf = block.rows(start)
+        weighted = tf * self._idf[indices]
+        return np.sqrt(_row_sums(weighted * weighted, indptr)) \
+            * block.scales[start:block.count]
+
+    def _reweight(self):
+        # Smoothed IDF
+        self._idf = (np.log((1 + self.count)
+                            / (1 + self.document_frequency)) + 1) \
+            .astype(np.float32)
+        for block in self.blocks:
+            block.norms[:block.count] = self._norms(block)
+        self._added = 0
+
+    def _age_out(self):
+        while self.count > self.max_rows and len(self.blocks) > 1:
+            block = self.blocks.popleft()
+            _, indices, _ = block.rows()
+            self.document_frequency -= np.bincount(
+                indices, minlength=self.dim)
+            self.count -= block.count
+
+    def _merge_blocks(self):
+        tail = []
+        for block in reversed(self.blocks):
+            if block.capacity != BLOCK_ROWS or len(tail) == SEGMENT_BLOCKS:
+                break
+            tail.append(block)
+        if len(tail) < SEGMENT_BLOCKS:
+            return
+        for _ in tail:
+            self.blocks.pop()
+        self.blocks.append(_Block.merge(tail[::-1]))
+
+    def add(self, transcript_id: int, text: str, frequency=None,
+            timestamp=None):
+        indices, counts = ngram_counts(text, self.dim)
+        if not len(indices):
+            return
+        with self._lock:
+            if not self.blocks or self.blocks[-1].full:
+                self.blocks.append(_Block(self.index_dtype))
+                self._age_out()
+            block = self.blocks[-1]
+            row = block.append(transcript_id, frequency, timestamp,
+                               indices, counts)
+            self.document_frequency[indices] += 1
+            block.norms[row] = self._norms(block, row)[0]
+            if block.full:
+                self._merge_blocks()
+            self.count += 1
+            self._added += 1
+            self.last_id = max(self.last_id, transcript_id)
+            if self._added > self.count * REWEIGHT_GROWTH:
+                self._reweight()
+
+    def search(self, text: str, limit: int = 10, frequency=None,
+               exclude_id=None) -> list:
+        """Find the intercepts most similar to a text.
+
+        Returns:
+            list: `(transcript_id, similarity)` tuples, most similar first
+        """
+        query_indices, query_values = vectorize(text, self.dim)
+        with self._lock:
+            if not self.count or not len(query_indices):
+                return []
+            query_idf = self._idf[query_indices]
+            query_norm = np.linalg.norm(query_values * query_idf)
+            query_weights = query_values * query_idf ** 2
+            weights = np.zeros(self.dim, dtype=np.float32)
+            weights[query_indices] = query_weights
+            # Weight of the posted n-grams shared with the query, by row
+            found = []
+            for number, block in enumerate(self.blocks):
+                candidates = block.candidates(query_indices, query_weights)
+                if frequency is not None:
+                    candidates[block.frequencies[:block.count]
+                               != _frequency(frequency)] = 0
+                rows = np.flatnonzero(candidates)
+                # As if the shared n-grams occurred once in the row
+                found.append((np.full(len(rows), number), rows,
+                              candidates[rows] * block.scales[rows]
+                              / block.norms[rows]))
+            numbers, rows, weight = (
+                np.concatenate(parts) for parts in zip(*found))
+            if len(rows) > SEARCH_CANDIDATES:
+                best = np.argpartition(
+                    -weight, SEARCH_CANDIDATES - 1)[:SEARCH_CANDIDATES]
+                numbers, rows = numbers[best], rows[best]
+            scores, ids = [], []
+            for number, block in enumerate(self.blocks):
+                block_rows = rows[numbers == number]
+                scores.append(
+                    block.dot(block_rows, weights)
+                    / (block.norms[block_rows] * query_norm + 1e-9))
+                ids.append(block.ids[block_rows])
+        scores, ids = np.concatenate(scores), np.concatenate(ids)
+        if exclude_id is not None:
+            scores[ids == exclude_id] = -1
+        limit = min(limit, len(scores))
+        if limit <= 0:
+            return []
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top])]
+        return [
+            (int(ids[i]), float(scores[i]))
+            for i in top if scores[i] >= MIN_SIMILARITY
+        ]
+
+    def _window(self, window: int):
+        """The last `window` rows as one IDF weighted, normalized CSR."""
+        parts, remaining = [], window
+        for block in reversed(self.blocks):
+            if remaining <= 0:
+                break
+            start = max(0, block.count - remaining)
+            remaining -= block.count - start
+            parts.append((block, start))
+        indptrs, indices, values = [], [], []
+        ids, frequencies, times = [], [], []
+        offset = 0
+        for block, start in reversed(parts):
+            indptr, block_indices, tf = block.rows(start)
+            indptrs.append(indptr[:-1] + offset)
+            offset += indptr[-1]
+            indices.append(block_indices)
+            # Normalized below, the row scales cancel out
+            values.append(tf * self._idf[block_indices])
+            ids.append(block.ids[start:block.count])
+            frequencies.append(block.frequencies[start:block.count])
+            times.append(block.times[start:block.count])
+        indptr = np.r_[np.concatenate(indptrs), offset]
+        indices, values = np.concatenate(indices), np.concatenate(values)
+        norms = np.sqrt(_row_sums(values * values, indptr))
+        values /= np.repeat(norms + 1e-9, np.diff(indptr))
+        return (indptr, indices, values, np.concatenate(ids),
+                np.concatenate(frequencies), np.concatenate(times))
+
+    def cluster(self, window: int = None,
+                threshold: float = CLUSTER_SIMILARITY) -> list:
+        """Group the recent intercepts following the same template.
+
+        Greedy leader clustering over the IDF weighted cosine similarity of
+        the last `window` intercepts. The most central member is the one
+        closest to the sum of the cluster.
+
+        Returns:
+            list: Clusters as dicts with the member `ids`, the `leader_id`
+            (most central member), `frequencies`, `first_seen` and
+            `last_seen`, largest first
+        """
+        window = window or cluster_window
+        with self._lock:
+            if not self.count:
+                return []
+            indptr, indices, values, ids, frequencies, times = \
+                self._window(window)
+        lengths = np.diff(indptr)
+        dense = np.zeros(self.dim, dtype=np.float32)
+
+        def similarity_to(row_indices, row_values):
+            np.add.at(dense, row_indices, row_values)
+            similarity = _row_sums(values * dense[indices], indptr)
+            dense[row_indices] = 0
+            return similarity
+
+        unassigned = np.ones(len(ids), dtype=bool)
+        clusters = []
+        for i in range(len(ids)):
+            if not unassigned[i]:
+                continue
+            row = slice(indptr[i], indptr[i + 1])
+            similarity = similarity_to(indices[row], values[row])
+            members = np.flatnonzero(unassigned & (similarity >= threshold))
+            unassigned[members] = False
+            if len(members) < 2:
+                continue
+            member_rows = np.concatenate(
+                [np.arange(indptr[m], indptr[m] + lengths[m])
+                 for m in members])
+            centrality = similarity_to(
+                indices[member_rows], values[member_rows])[members]
+            clusters.append({
+                "ids": ids[members].tolist(),
+                "leader_id": int(ids[members[np.argmax(centrality)]]),
+                "frequencies": sorted(
+                    {int(f) for f in frequencies[members] if f}),
+                "first_seen": float(times[members].min()),
+                "last_seen": float(times[members].max()),
+            })
+        clusters.sort(key=lambda c: len(c["ids"]), reverse=True)
+        with self._lock:
+            self.clusters = clusters
+            self.clustered_at = time.monotonic()
+        logger.info(
+            f"Clustered {len(ids)} intercepts into {len(clusters)} "
+            "recurring messages")
+        return clusters
+
+
+index = SimilarityIndex()
+_indexer_thread = None
+
+
+def backfill() -> int:
+    """Index the transcripts already in the database.
+
+    Returns:
+        int: The id of the last indexed transcript
+    """
+    started = time.perf_counter()
+    last_id = 0
+    while True:
+        batch = list(
+            database.Transcript.select()
+            .where(database.Transcript.id > last_id)
+            .order_by(database.Transcript.id)
+            .limit(BACKFILL_BATCH))
+        if not batch:
+            break
+        for transcript in batch:
+            index.add(transcript.id, transcript.text, transcript.frequency,
+                      transcript.timestamp)
+        last_id = batch[-1].id
+    logger.info(
+        f"Indexed {index.count} intercepts in "
+        f"{time.perf_counter() - started:.1f}s "
+        f"({index.nbytes / 2**20:.0f} MiB)")
+    return last_id
+
+
+def _indexer(subscription):
+    backfilled_id = backfill()
+    clustered_count = 0
+    while True:
+        try:
+            event = subscription.get(timeout=cluster_interval)
+        except queue.Empty:
+            event = None
+        # Intercepts saved during the backfill were indexed by it
+        if event is not None and event["id"] > backfilled_id:
+            index.add(event["id"], event["text"], event["frequency"],
+                      datetime.datetime.fromisoformat(event["timestamp"]))
+        stale = index.clustered_at is None or \
+            time.monotonic() - index.clustered_at > cluster_interval
+        if stale and index.count != clustered_count:
+            clustered_count = index.count
+            try:
+                index.cluster()
+            except Exception as e:
+                logger.error(f"Error clustering intercepts: {e}",
+                             exc_info=True)
+
+
+def start():
+    """Build the index in the background and keep it up to date."""
+    global _indexer_thread
+    if _indexer_thread is not None:
+        return _indexer_thread
+    # Subscribed before the backfill so no intercept is missed in between
+    subscription = events.subscribe(events.TRANSCRIPT, maxsize=10000)
+    _indexer_thread = threading.Thread(
+        target=_indexer, args=(subscription,), daemon=True,
+        name="SimilarityIndexer")
+    _indexer_thread.start()
+    return _indexer_thread
+
+
+def find_similar(text: str, limit: int = 10, frequency=None,
+                 exclude_id=None) -> list:
+    """Intercepts similar to a text, with their similarity.
+
+    Returns:
+        list: Transcript events (see database.transcript_event) with a
+        `similarity` key, most similar first
+    """
+    matches = index.search(text, limit, frequency, exclude_id)
+    transcripts = {
+        t.id: t for t in database.Transcript.select().where(
+            database.Transcript.id.in_([i for i, _ in matches]))
+    }
+    return [
+        dict(database.transcript_event(transcripts[i]),
+             similarity=round(score, 3))
+        for i, score in matches if i in transcripts
+    ]
+
+
+def get_recurring_messages(min_count: int = 3, limit: int = 10) -> list:
+    """Recurring message templates among the recent intercepts."""
+    if index.clustered_at is None:
+        index.cluster()
+    clusters = [c for c in index.clusters if len(c["ids"]) >= min_count]
+    clusters = clusters[:limit]
+    leaders = {
+        t.id: t for t in database.Transcript.select().where(
+            database.Transcript.id.in_([c["leader_id"] for c in clusters]))
+    }
+    results = []
+    for cluster in clusters:
+        leader = leaders.get(cluster["leader_id"])
+        results.append({
+            "example": leader.text if leader else None,
+            "count": len(cluster["ids"]),
+            "frequencies": cluster["frequencies"],
+            "first_seen": time.strftime(
+                "%Y-%m-%d %H:%M:%S", time.localtime(cluster["first_seen"])),
+            "last_seen": time.strftime(
+                "%Y-%m-%d %H:%M:%S", time.localtime(cluster["last_seen"])),
+        })
+    return results
@@ -0,0 +1,141 @@
+import logging
+import os
+import threading
+
+import numpy as np
+
+import audio_features
+
+# Get logger for this module
+logger = logging.getLogger("sigint_spectral_squelch")
+
+# Set SPECTRAL_SQUELCH=0 to gate chunks on their RMS level only
+squelch_enabled = os.environ.get("SPECTRAL_SQUELCH", "1") != "0"
+# How far above the channel noise floor a frame must be to count as speech
+margin_db = float(os.environ.get(
+    "SQUELCH_MARGIN_DB", str(audio_features.SPEECH_MARGIN_DB)))
+# Least amount of speech for a chunk to be transcribed
+min_speech_ms = float(os.environ.get("SQUELCH_MIN_SPEECH_MS", "300"))
+# Audio kept around speech, also bridges pauses between words
+pad_ms = float(os.environ.get("SQUELCH_PAD_MS", "300"))
+
+FRAME_MS = audio_features.HOP_SIZE * 1000 / audio_features.SAMPLE_RATE
+# Frames quieter than this are digital silence (GQRX squelch closed) and
+# say nothing about the noise floor
+SILENCE_DB = -90.0
+# Percentile of the frame energies of a chunk taken as its noise level
+FLOOR_PERCENTILE = 20
+# The floor follows a quieter band at once but rises slowly, so long
+# transmissions do not raise it
+FLOOR_RISE = 0.1
+
+
+class SpectralSquelch:
+    """Speech detector of one channel with an adaptive noise floor.
+
+    Every chunk is split in 25 ms frames. A frame is speech when its speech
+    band energy is `margin_db` above the noise floor of the channel and its
+    spectrum is speech-like (energy in the speech band, harmonic rather
+    than flat). The floor is learnt from the chunks themselves, so the
+    threshold calibrates itself to each channel.
+    """
+
+    def __init__(self, channel=None):
+        self.channel = channel
+        self.floor_db = None
+        self.chunks = 0
+        self.passed = 0
+        # Detectors are not thread-safe, chunks of one channel are gated in
+        # turn while other channels proceed
+        self.lock = threading.Lock()
+
+    def _update_floor(self, energy_db: np.ndarray):
+        audible = energy_db[energy_db > SILENCE_DB]
+        if not len(audible):
+            return
+        level = float(np.percentile(audible, FLOOR_PERCENTILE))
+        if self.floor_db is None or level < self.floor_db:
+            self.floor_db = level
+        else:
+            self.floor_db += FLOOR_RISE * (level - self.floor_db)
+
+    def process(self, data: bytes):
+        """Find the speech in a PCM chunk.
+
+        Returns:
+            tuple: `(start, end)` byte offsets of the speech in the chunk,
+            padded, or None when the chunk has too little speech
+        """
+        self.chunks += 1
+        features = audio_features.analyze(audio_features.pcm_to_float(data))
+        energy_db = features["energy_db"]
+        if not len(energy_db):
+            return None
+        self._update_floor(energy_db)
+        if self.floor_db is None:
+            return None
+
+        speech = audio_features.speech_frame_mask(
+            energy_db, features["ratio"], features["flatness"],
+            features["zcr"], self.floor_db, margin_db)
+        if speech.sum() * FRAME_MS < min_speech_ms:
+            return None
+
+        voiced = np.flatnonzero(speech)
+        pad = int(pad_ms / FRAME_MS)
+        first = max(0, voiced[0] - pad)
+        last = min(len(speech), voiced[-1] + 1 + pad)
+        # Frame indexes to byte offsets of 16-bit samples
+        start = first * audio_features.HOP_SIZE * 2
+        end = min(len(data), (last * audio_features.HOP_SIZE
+                              + audio_features.FRAME_SIZE) * 2)
+        if last == len(speech):
+            # Keep the samples past the last full frame too
+            end = len(data)
+        self.passed += 1
+        logger.debug("Channel %s: %.0f%% speech frames, noise floor %.1f dB",
+                     self.channel, speech.mean() * 100, self.floor_db)
+        return start, end
+
+
+squelches = {}
+_lock = threading.Lock()
+
+
+def get_squelch(channel) -> SpectralSquelch:
+    """Get the detector of a channel (frequency), created on first use."""
+    with _lock:
+        squelch = squelches.get(channel)
+        if squelch is None:
+            squelch = squelches[channel] = SpectralSquelch(channel)
+        return squelch
+
+
+def gate(data: bytes, channel=None):
+    """Trim a PCM chunk to its speech.
+
+    Args:
+        data (bytes): 16kHz mono s16le audio
+        channel: Frequency the audio was received on, each channel keeps
+            its own noise floor
+
+    Returns:
+        tuple: `(audio, offset)`, the speech with its padding and its byte
+        offset in the chunk, or None when the chunk should be skipped
+    """
+    squelch = get_squelch(channel)
+    with squelch.lock:
+        span = squelch.process(data)
+    if span is None:
+        return None
+    start, end = span
+    return data[start:end], start
+
+
+def get_noise_floors() -> dict:
+    """Current noise floor (dB) of every channel seen so far."""
+    with _lock:
+        return {
+            channel: squelch.floor_db
+            for channel, squelch in squelches.items()
+        }
@@ -8,22 +8,37 @@ import numpy as np
 import wave
 import io
 
-from groq import Groq
 import database
+from chunk_scheduler import ChunkScheduler
+from groq_client import get_client
+from sample_clock import SampleClock
+import language_policy
+import spectral_squelch
+import transcript_filter
 
 # Configure logging
 logger = logging.getLogger("sigint_audio_stream")
 
-client = Groq()
+# Chunks waiting for transcription, most speech-like first
+audio_queue = ChunkScheduler()
 
-audio_queue = queue.Queue()
+# UDP port GQRX streams the demodulated audio to
+audio_udp_port = int(os.environ.get("AUDIO_UDP_PORT", "7355"))
+
+# sample_rate(16000 samples/sec) * 2 bytes/sample
+BYTES_PER_SECOND = 16000 * 2
 
 # 30 seconds of 16kHZ:
 # sample_rate(16000 samples/sec) * 30 sec * 2 bytes/sample
-CHUNK_SIZE = 30 * 16000 * 2
+CHUNK_SIZE = 30 * BYTES_PER_SECOND
+
+# Largest read from the FFmpeg pipe, about 2 seconds of audio
+READ_SIZE = 64 * 1024
 
 # Global variable to store the current resampled audio filename
 current_resampled_filename = None
+# Time base of the audio stream being read
+audio_clock = None
 
 
 def is_audio_silent(wav_bytes, silence_threshold=150.0):
@@ -80,12 +95,49 @@ def audio_worker():
         audio_queue.task_done()
 
 
-def process_audio(in_data, index=0, capture_time=None, source_file=None):
-    # Process the audio data here
-    frequency = database.get_current_session().frequency
-    logger.debug(
-        f"Processing audio chunk {index}, captured at {capture_time}, "
-        f"frequency: {frequency}")
+def chunk_frequency(length: int, capture_time=None) -> str:
+    """Frequency the receiver was on while a chunk was captured.
+
+    Not when it is processed, the scanner retunes meanwhile.
+
+    Args:
+        length (int): Size of the chunk in bytes
+        capture_time (datetime): Time the chunk starts at
+    """
+    if capture_time is None:
+        return database.get_current_session().frequency
+    capture_end = capture_time + datetime.timedelta(
+        seconds=length / BYTES_PER_SECOND)
+    return database.get_session_for_window(
+        capture_time, capture_end).frequency
+
+
+def process_audio(in_data, index=0, capture_time=None, source_file=None,
+                  frequency=None):
+    if frequency is None:
+        frequency = chunk_frequency(len(in_data), capture_time)
+    logger.debug("Processing audio chunk %d, captured at %s, frequency: %s",
+                 index, capture_time, frequency)
+
+    # Byte offset of the audio sent for transcription in the chunk
+    offset = 0
+    speech_time = capture_time
+    if spectral_squelch.squelch_enabled:
+        # Only speech goes to the API, trimmed of leading/trailing noise
+        gated = spectral_squelch.gate(in_data, frequency)
+        if gated is None:
+            logger.info("Chunk %d has no speech, skipping transcription",
+                        index)
+            return
+        in_data, offset = gated
+        if capture_time is not None:
+            # Stored intercepts are timed at the start of their speech
+            speech_time = capture_time + datetime.timedelta(
+                seconds=offset / BYTES_PER_SECOND)
+        logger.debug("Chunk %d speech at %.1fs, %.1fs long", index,
+                     offset / BYTES_PER_SECOND,
+                     len(in_data) / BYTES_PER_SECOND)
+
     try:
         wav_bytes, _ = (
             ffmpeg.input(
@@ -110,47 +162,61 @@ def process_audio(in_data, index=0, capture_time=None, source_file=None):
         logger.error(f"ffmpeg error during chunk->wav: {e.stderr.decode()}")
         return
 
-    # Check if the audio is silent to avoid unnecessary API calls
-    is_silent, rms = is_audio_silent(wav_bytes)
-    if is_silent:
-        logger.info(
-            f"Chunk {index} detected as silence "
-            f"(RMS: {rms:.2f}), skipping transcription")
-        return
-
-    logger.debug(
-        f"Chunk {index} contains audio "
-        f"(RMS: {rms:.2f}), proceeding with transcription")
-
-    logger.debug(f"Sending chunk {index} to Groq Whisper API")
-    transcription = client.audio.transcriptions.create(
+    if not spectral_squelch.squelch_enabled:
+        # Check if the audio is silent to avoid unnecessary API calls
+        is_silent, rms = is_audio_silent(wav_bytes)
+        if is_silent:
+            logger.info(
+                "Chunk %d detected as silence (RMS: %.2f), "
+                "skipping transcription", index, rms)
+            return
+
+        logger.debug(
+            "Chunk %d contains audio (RMS: %.2f), "
+            "proceeding with transcription", index, rms)
+
+    logger.debug("Sending chunk %d to Groq Whisper API", index)
+    # Without a language the API detects it, until the channel's language
+    # is known. verbose_json reports the detected language and confidence
+    language = language_policy.language_for(frequency)
+    transcription = get_client().audio.transcriptions.create(
         file=(f"chunk_{index}.wav", wav_bytes),
         model="whisper-large-v3-turbo",
-        language="es",
+        response_format="verbose_json",
+        **({"language": language} if language else {}),
     )
 
-    # Weird edge case, background noise detected as these phrases
-    # in Spanish communications.
-    if transcription.text not in [
-       " Gracias.",
-       " ¡Gracias!",
-       " Gracias por ver el video.",
-       " ¡Suscríbete al canal!"]:
-        logger.info(f"Transcription: {transcription.text}")
-        # Save transcript to database
-        try:
-            database.save_transcript(
-                text=transcription.text,
-                frequency=frequency,
-                timestamp=capture_time,
-                source_file=source_file,
-            )
+    # Whisper turns noise into stock phrases ("Gracias.") and repeats
+    # itself, and a retransmitted message would be stored twice
+    reason = transcript_filter.check(
+        transcription.text, frequency, speech_time,
+        language_policy.no_speech_probability(transcription))
+    # Hallucinations also tell the policy the language may be wrong
+    language = language_policy.observe(frequency, transcription, reason)
+    if reason is not None:
+        logger.info("Dropped transcription of chunk %d (%s): %r",
+                    index, reason, transcription.text)
+        return
 
-            logger.debug(
-                "Saved transcript to database: "
-                f"{transcription.text[:30]}...")
-        except Exception as e:
-            logger.error(f"Failed to save transcript to database: {e}")
+    logger.info("Transcription (%s): %s", language, transcription.text)
+    # Save transcript to database
+    try:
+        database.save_transcript(
+            text=transcription.text,
+            frequency=frequency,
+            timestamp=speech_time,
+            source_file=source_file,
+            language=language,
+            # Chunks are cut back to back from the start of the recording
+            clip_start=(index * CHUNK_SIZE + offset) / BYTES_PER_SECOND,
+            clip_end=(index * CHUNK_SIZE + offset + len(in_data))
+            / BYTES_PER_SECOND,
+        )
+
+        logger.debug("Saved transcript to database: %.30s...",
+                     transcription.text)
+    except Exception as e:
+        logger.error(f"Failed to save transcript to database: {e}")
 
 
 # Global variable to track the audio stream thread
@@ -230,24 +296,21 @@ def stderr_reader(process):
             if not line:
                 logger.info("FFmpeg stderr closed, exiting reader thread")
                 break
-            # Log any non-empty output at debug level
+            # Log any non-empty output at debug level, ffmpeg reports its
+            # progress several times a second
+            if not logger.isEnabledFor(logging.DEBUG):
+                continue
             line_str = line.decode('utf-8', errors='replace').strip()
             if line_str:
-                logger.debug(f"FFmpeg: {line_str}")
+                logger.debug("FFmpeg: %s", line_str)
         except Exception as e:
             logger.error(f"Error reading FFmpeg stderr: {e}")
             break
     logger.info("FFmpeg stderr reader thread stopped")
 
 
-def run_ffmpeg():
-    logger.info("Starting FFmpeg processing pipeline")
-    global ffmpeg_process, current_resampled_filename
-
-    worker_thread = threading.Thread(target=audio_worker,
-                                     daemon=True)
-    worker_thread.start()
-
+def new_session_filename():
+    """Path of the resampled recording of a new capture session."""
     # Create sessions directory if it doesn't exist
     sessions_dir = "sessions"
     if not os.path.exists(sessions_dir):
@@ -261,16 +324,21 @@ def run_ffmpeg():
     resampled_filename = os.path.join(
         sessions_dir, f"{timestamp}_resampled.wav")
 
-    # Store the filename in the global variable
-    current_resampled_filename = resampled_filename
-
     logger.info(f"Recording session: {timestamp}")
     logger.info(f"Saving resampled audio to: {resampled_filename}")
+    return resampled_filename
+
+
+def start_ffmpeg(resampled_filename):
+    """Start FFmpeg receiving the UDP audio.
 
+    FFmpeg resamples the audio to 16kHz, records it to `resampled_filename`
+    and pipes the raw PCM to stdout.
+    """
     # Define the input stream
-    logger.info("Setting up FFmpeg UDP input stream on port 7355")
+    logger.info(f"Setting up FFmpeg UDP input stream on port {audio_udp_port}")
     input_stream = ffmpeg.input(
-        'udp://@:7355',
+        f'udp://@:{audio_udp_port}',
         format='s16le',
         ar='48000',
         ac='1'
@@ -303,7 +371,7 @@ def run_ffmpeg():
 
     # Merge the outputs and run asynchronously
     logger.info("Starting FFmpeg process")
-    ffmpeg_process = ffmpeg.merge_outputs(output1, output2).run_async(
+    process = ffmpeg.merge_outputs(output1, output2).run_async(
         pipe_stdout=True,
         pipe_stderr=True
     )
@@ -311,45 +379,77 @@ def run_ffmpeg():
     # Start stderr reader thread to prevent buffer filling up
     stderr_thread = threading.Thread(
         target=stderr_reader,
-        args=(ffmpeg_process,),
+        args=(process,),
         daemon=True
     )
     stderr_thread.start()
+    return process
 
-    accumulated = b''
-    chunk_index = 0
-    # Store the start time of the current chunk being accumulated
-    current_chunk_start_time = datetime.datetime.now()
 
-    logger.info("Starting to process audio stream")
-    # Read and process audio data from stdout
-    try:
-        while True:
-            in_bytes = ffmpeg_process.stdout.read(2)
-            if not in_bytes:
-                if accumulated:
-                    logger.debug(
-                        "Processing final accumulated chunk "
-                        f"({len(accumulated)} bytes)")
-                    audio_queue.put((
-                        accumulated,
-                        chunk_index,
-                        current_chunk_start_time))
-                break
+def read_chunks(process, emit, clock=None):
+    """Split the FFmpeg output into chunks until the stream ends.
 
-            accumulated += in_bytes
+    Calls `emit(chunk, index, capture_time)` for every CHUNK_SIZE bytes of
+    audio, and for the trailing partial chunk. The capture time is derived
+    from the position of the chunk in the stream (see SampleClock), not
+    from when it was read.
 
-            while len(accumulated) >= CHUNK_SIZE:
-                chunk = accumulated[:CHUNK_SIZE]
-                # Pass the capture time along with the audio data
-                audio_queue.put((chunk, chunk_index, current_chunk_start_time))
+    Returns:
+        int: The number of chunks emitted
+    """
+    global audio_clock
+    accumulated = bytearray()
+    chunk_index = 0
+    clock = clock or SampleClock(BYTES_PER_SECOND)
+    audio_clock = clock
+
+    logger.info("Starting to process audio stream")
+    while True:
+        # Take whatever is available, small reads can't keep up with the
+        # pipe when the process is busy
+        in_bytes = process.stdout.read1(READ_SIZE)
+        if not in_bytes:
+            if accumulated:
                 logger.debug(
-                    f"Queued chunk {chunk_index} for processing, "
-                    f"size: {len(chunk)} bytes")
+                    "Processing final accumulated chunk (%d bytes)",
+                    len(accumulated))
+                emit(bytes(accumulated), chunk_index,
+                     clock.time_at(chunk_index * CHUNK_SIZE))
                 chunk_index += 1
-                accumulated = accumulated[CHUNK_SIZE:]
-                # Reset the start time for the next chunk
-                current_chunk_start_time = datetime.datetime.now()
+            break
+
+        clock.advance(len(in_bytes))
+        accumulated += in_bytes
+
+        while len(accumulated) >= CHUNK_SIZE:
+            chunk = bytes(accumulated[:CHUNK_SIZE])
+            # Pass the capture time along with the audio data
+            emit(chunk, chunk_index, clock.time_at(chunk_index * CHUNK_SIZE))
+            logger.debug("Queued chunk %d for processing, size: %d bytes",
+                         chunk_index, len(chunk))
+            chunk_index += 1
+            del accumulated[:CHUNK_SIZE]
+    return chunk_index
+
+
+def run_ffmpeg():
+    logger.info("Starting FFmpeg processing pipeline")
+    global ffmpeg_process, current_resampled_filename
+
+    worker_thread = threading.Thread(target=audio_worker,
+                                     daemon=True)
+    worker_thread.start()
+
+    # Store the filename in the global variable
+    current_resampled_filename = new_session_filename()
+    ffmpeg_process = start_ffmpeg(current_resampled_filename)
+
+    chunk_index = 0
+    # Read and process audio data from stdout
+    try:
+        chunk_index = read_chunks(
+            ffmpeg_process,
+            lambda *item: audio_queue.put(item))
     except Exception as e:
         logger.error(
             "Error occurred during FFmpeg processing: "
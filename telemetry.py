@@ -0,0 +1,332 @@
+import os
+import logging
+import threading
+import time
+
+import numpy as np
+
+import gqrx_client as gqrx
+import scanner
+
+# Get logger for this module
+logger = logging.getLogger("sigint_telemetry")
+
+# Signal strength samples per second
+sample_rate = float(os.environ.get("TELEMETRY_RATE", "1.0"))
+# Sample counts of a minute are stored on 16 bits
+MAX_SAMPLE_RATE = 1000.0
+# Directory holding one raw and one rollup file per channel
+telemetry_dir = "telemetry"
+# Samples buffered in memory before they are appended to disk
+flush_every = 60
+# Days of raw samples kept, older ones are only in the rollups; 0 keeps all
+raw_days = float(os.environ.get("TELEMETRY_RAW_DAYS", "7"))
+# Raw files are rewritten once their oldest sample is this much past the
+# retention, not on every flush
+EXPIRE_SLACK_MS = 24 * 3600 * 1000
+# Width of a rollup bucket (seconds)
+ROLLUP_SECONDS = 60
+# Squelch level reported by GQRX when the squelch is disabled
+SQUELCH_OFF = -150.0
+
+# Raw sample: time in ms since the epoch, level in centi-dBFS, squelch open
+SAMPLE_DTYPE = np.dtype([
+    ("t", "<i8"),
+    ("level", "<i2"),
+    ("open", "u1"),
+])
+
+# One minute rollup: bucket start (seconds since the epoch), level stats in
+# centi-dBFS and the number of samples / samples with the squelch open
+ROLLUP_DTYPE = np.dtype([
+    ("t", "<i8"),
+    ("min", "<i2"),
+    ("max", "<i2"),
+    ("mean", "<i2"),
+    ("count", "<u2"),
+    ("open", "<u2"),
+])
+
+
+class ChannelSeries:
+    """Append-only signal strength series of one channel.
+
+    Samples are buffered in a NumPy array and appended to
+    `<frequency>.raw` when the buffer is full. Completed minutes are rolled
+    up into `<frequency>.1m` for cheap queries over long periods. Both files
+    are plain packed records, read back with memory maps. Raw samples older
+    than `raw_days` are dropped, the rollups are kept.
+    """
+
+    def __init__(self, frequency: str):
+        self.frequency = str(frequency)
+        self.raw_path = os.path.join(telemetry_dir, f"{self.frequency}.raw")
+        self.rollup_path = os.path.join(
+            telemetry_dir, f"{self.frequency}.1m")
+        self.buffer = np.empty(flush_every, dtype=SAMPLE_DTYPE)
+        self.buffered = 0
+        # Samples of the minute not rolled up yet (may span flushes)
+        self.pending = np.empty(0, dtype=SAMPLE_DTYPE)
+        # Time of the oldest raw sample on disk, read on the first flush
+        self.raw_start = None
+        self.lock = threading.Lock()
+
+    def append(self, t_ms: int, level: float, is_open: bool):
+        with self.lock:
+            self.buffer[self.buffered] = (
+                t_ms, int(round(max(min(level, 327.0), -327.0) * 100)),
+                is_open)
+            self.buffered += 1
+            if self.buffered == len(self.buffer):
+                self._flush()
+
+    def flush(self, final: bool = False):
+        """Write the buffered samples.
+
+        Args:
+            final (bool): Also roll up the current minute, when no more
+                samples will follow
+        """
+        with self.lock:
+            self._flush(final)
+
+    def _flush(self, final: bool = False):
+        if not self.buffered:
+            if final and len(self.pending):
+                self._rollup(self.pending[:0], final)
+            return
+        samples = self.buffer[:self.buffered].copy()
+        self.buffered = 0
+        if not os.path.exists(telemetry_dir):
+            os.makedirs(telemetry_dir)
+        with open(self.raw_path, "ab") as f:
+            samples.tofile(f)
+        self._rollup(samples, final)
+        self._expire(int(samples["t"][-1]))
+
+    def _expire(self, now_ms: int):
+        if raw_days <= 0:
+            return
+        if self.raw_start is None:
+            self.raw_start = int(np.fromfile(
+                self.raw_path, dtype=SAMPLE_DTYPE, count=1)["t"][0])
+        cutoff = now_ms - int(raw_days * 24 * 3600 * 1000)
+        if self.raw_start >= cutoff - EXPIRE_SLACK_MS:
+            return
+        stored = self._read(self.raw_path, SAMPLE_DTYPE)
+        keep = int(np.searchsorted(stored["t"], cutoff))
+        kept = np.array(stored[keep:])
+        del stored
+        # Readers holding a map of the old file keep their view of it
+        temp_path = self.raw_path + ".tmp"
+        try:
+            kept.tofile(temp_path)
+            os.replace(temp_path, self.raw_path)
+        except OSError as e:
+            logger.error(f"Error expiring samples of {self.frequency}: {e}")
+            return
+        self.raw_start = int(kept["t"][0]) if len(kept) else now_ms
+        logger.info(f"Expired {keep} raw samples of {self.frequency}")
+
+    def _rollup(self, samples, final: bool = False):
+        samples = np.concatenate([self.pending, samples])
+        if not len(samples):
+            return
+        buckets = samples["t"] // (ROLLUP_SECONDS * 1000)
+        # The last bucket may still receive samples, keep it pending
+        complete = buckets <= buckets[-1] if final else \
+            buckets < buckets[-1]
+        self.pending = samples[~complete]
+        samples, buckets = samples[complete], buckets[complete]
+        if not len(samples):
+            return
+
+        starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+        levels = samples["level"].astype(np.int32)
+        counts = np.diff(np.r_[starts, len(samples)])
+        rollup = np.empty(len(starts), dtype=ROLLUP_DTYPE)
+        rollup["t"] = buckets[starts] * ROLLUP_SECONDS
+        rollup["min"] = np.minimum.reduceat(levels, starts)
+        rollup["max"] = np.maximum.reduceat(levels, starts)
+        rollup["mean"] = np.add.reduceat(levels, starts) // counts
+        rollup["count"] = counts
+        rollup["open"] = np.add.reduceat(
+            samples["open"].astype(np.int32), starts)
+        with open(self.rollup_path, "ab") as f:
+            rollup.tofile(f)
+
+    def _read(self, path, dtype):
+        if not os.path.exists(path) or os.path.getsize(path) < dtype.itemsize:
+            return np.empty(0, dtype=dtype)
+        count = os.path.getsize(path) // dtype.itemsize
+        return np.memmap(path, dtype=dtype, mode="r", shape=(count,))
+
+    def samples(self, start_ms: int, end_ms: int):
+        """Get the raw samples with start_ms <= t < end_ms."""
+        with self.lock:
+            stored = self._read(self.raw_path, SAMPLE_DTYPE)
+            buffered = self.buffer[:self.buffered].copy()
+        # Samples are appended in time order, binary search the range
+        lo, hi = np.searchsorted(stored["t"], [start_ms, end_ms])
+        selected = np.asarray(stored[lo:hi])
+        mask = (buffered["t"] >= start_ms) & (buffered["t"] < end_ms)
+        return np.concatenate([selected, buffered[mask]])
+
+    def rollups(self, start_s: int, end_s: int):
+        """Get the one minute rollups with start_s <= t < end_s."""
+        with self.lock:
+            stored = self._read(self.rollup_path, ROLLUP_DTYPE)
+        lo, hi = np.searchsorted(stored["t"], [start_s, end_s])
+        return np.asarray(stored[lo:hi])
+
+
+# Series by frequency, created on first use
+series = {}
+_series_lock = threading.Lock()
+
+sampler_thread = None
+stop_event = threading.Event()
+
+
+def get_series(frequency) -> ChannelSeries:
+    with _series_lock:
+        channel = series.get(str(frequency))
+        if channel is None:
+            channel = series[str(frequency)] = ChannelSeries(frequency)
+        return channel
+
+
+def record(frequency, level: float, is_open: bool, t_ms: int = None):
+    """Append one signal strength sample for a channel."""
+    if t_ms is None:
+        t_ms = int(time.time() * 1000)
+    get_series(frequency).append(t_ms, level, is_open)
+
+
+def flush_all(final: bool = False):
+    with _series_lock:
+        channels = list(series.values())
+    for channel in channels:
+        channel.flush(final)
+
+
+def sampler_loop():
+    rate = sample_rate
+    if rate > MAX_SAMPLE_RATE:
+        logger.warning(
+            f"TELEMETRY_RATE {rate} Hz is above the maximum, "
+            f"sampling at {MAX_SAMPLE_RATE} Hz")
+        rate = MAX_SAMPLE_RATE
+    interval = 1.0 / rate
+    logger.info(f"Telemetry sampler started at {rate} Hz")
+    next_sample = time.monotonic()
+    while not stop_event.is_set():
+        try:
+            # One pipelined round trip for frequency, level and squelch
+            frequency, level, squelch = gqrx.send_batch(["f", "l", "l SQL"])
+            level, squelch = float(level), float(squelch)
+            # With the squelch off (the GQRX default) every sample would
+            # count as open, use the scanner's activity threshold instead
+            threshold = squelch if squelch > SQUELCH_OFF \
+                else scanner.activity_threshold
+            is_open = level > threshold
+            record(frequency, level, is_open)
+        except Exception as e:
+            logger.error(f"Error sampling signal strength: {e}")
+
+        next_sample += interval
+        delay = next_sample - time.monotonic()
+        if delay < 0:
+            # Fell behind (e.g. GQRX reconnecting), do not try to catch up
+            next_sample = time.monotonic()
+            delay = 0
+        stop_event.wait(delay)
+    # The current minute is rolled up too, it would be lost on exit
+    flush_all(final=True)
+    logger.info("Telemetry sampler stopped")
+
+
+def start_sampler():
+    """Start the background signal strength sampler."""
+    global sampler_thread
+    if sample_rate <= 0:
+        logger.info("Telemetry sampler disabled")
+        return None
+    if sampler_thread is not None and sampler_thread.is_alive():
+        logger.warning("Telemetry sampler is already running")
+        return sampler_thread
+    stop_event.clear()
+    sampler_thread = threading.Thread(
+        target=sampler_loop,
+        daemon=True,
+        name="TelemetryThread"
+    )
+    sampler_thread.start()
+    return sampler_thread
+
+
+def stop_sampler():
+    """Stop the sampler and flush buffered samples to disk."""
+    if sampler_thread is None or not sampler_thread.is_alive():
+        flush_all(final=True)
+        return
+    stop_event.set()
+    sampler_thread.join(timeout=5)
+
+
+def get_activity(frequency, last_minutes: int = 60) -> dict:
+    """Summarize the signal activity of a channel over a time range.
+
+    Recent ranges (up to two hours) are computed from raw samples and
+    report every key-up, longer ranges use the one minute rollups.
+
+    Args:
+        frequency (int): The channel frequency in Hz
+        last_minutes (int, optional): The number of minutes to look back
+
+    Returns:
+        dict: Duty cycle, level statistics and key-up times
+    """
+    channel = get_series(frequency)
+    end = time.time()
+    start = end - last_minutes * 60
+
+    if last_minutes <= 120:
+        samples = channel.samples(int(start * 1000), int(end * 1000))
+        if not len(samples):
+            return {"samples": 0}
+        levels = samples["level"] / 100.0
+        is_open = samples["open"].astype(bool)
+        # A key-up is a closed -> open squelch transition
+        keyups = np.flatnonzero(is_open[1:] & ~is_open[:-1]) + 1
+        if is_open[0]:
+            keyups = np.r_[0, keyups]
+        return {
+            "samples": int(len(samples)),
+            "duty_cycle": round(float(is_open.mean()), 3),
+            "peak_dbfs": round(float(levels.max()), 1),
+            "mean_dbfs": round(float(levels.mean()), 1),
+            "keyups": int(len(keyups)),
+            "keyup_times": [
+                time.strftime("%Y-%m-%dT%H:%M:%S",
+                              time.localtime(t / 1000))
+                for t in samples["t"][keyups][-50:]
+            ],
+        }
+
+    rollups = channel.rollups(int(start), int(end))
+    if not len(rollups):
+        return {"samples": 0}
+    count = int(rollups["count"].sum())
+    active = rollups[rollups["open"] > 0]
+    return {
+        "samples": count,
+        "duty_cycle": round(float(rollups["open"].sum()) / count, 3),
+        "peak_dbfs": round(float(rollups["max"].max()) / 100, 1),
+        "mean_dbfs": round(float(
+            (rollups["mean"] * rollups["count"]).sum()) / count / 100, 1),
+        "active_minutes": int(len(active)),
+        "last_active": time.strftime(
+            "%Y-%m-%dT%H:%M:%S", time.localtime(int(active["t"][-1])))
+        if len(active) else None,
+    }
@@ -1,17 +1,43 @@
-from groq import Groq
+from concurrent.futures import ThreadPoolExecutor, wait
 import json
 import os
 import logging
+import threading
 from database import save_session, get_last_transcripts, get_transcripts
+from compaction import compact_transcripts
+from groq_client import get_client
 import gqrx_client as gqrx
+import process_pipeline
+import scanner
+import similarity_index
+import stream_groq_whisper
+import telemetry
+import transcript_filter
 
 # Get logger for this module
 logger = logging.getLogger("sigint_agent.tools")
 
-# Initialize GROQ client for summarization
-groq = Groq()
 model = os.environ.get("GROQ_MODEL", "llama-3.3-70b-versatile")
 
+# Bounded pool used to run the tool calls of one agent turn concurrently
+tool_workers = int(os.environ.get("TOOL_WORKERS", "4"))
+tool_executor = ThreadPoolExecutor(
+    max_workers=tool_workers, thread_name_prefix="ToolWorker")
+
+# Tools touching the same resource are serialized in submission order
+tool_resources = {
+    "set_frequency": "gqrx",
+    "get_current_frequency": "gqrx",
+    "start_scan": "gqrx",
+    "stop_scan": "gqrx",
+}
+resource_locks = {"gqrx": threading.Lock()}
+# Most similar intercepts returned by one search
+MAX_SIMILAR_INTERCEPTS = 50
+# Last submitted call for each resource, the next one waits for it
+_resource_tails = {}
+_resource_tails_lock = threading.Lock()
+
 # Tool definitions
 tool_definitions = [
     {
@@ -79,6 +105,141 @@ tool_definitions = [
                 "required": ["frequency"]
             }
         }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_signal_activity",
+            "description": "Get the signal activity of a frequency from the "
+                           "signal strength telemetry: duty cycle, levels "
+                           "and key-ups, including transmissions without "
+                           "speech.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "frequency": {
+                        "type": "integer",
+                        "description": "The frequency to get the activity "
+                                       "for in Hz."
+                    },
+                    "last_minutes": {
+                        "type": "integer",
+                        "description": "How many minutes to look back "
+                                       "(default 60)."
+                    }
+                },
+                "required": ["frequency"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "start_scan",
+            "description": "Start scanning a list of frequencies, dwelling "
+                           "on channels with activity.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "channels": {
+                        "type": "string",
+                        "description": "Comma separated frequencies or "
+                                       "ranges in MHz, a range can have a "
+                                       "step, e.g. '145.500, "
+                                       "146.000-146.100:0.025'."
+                    }
+                },
+                "required": ["channels"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "stop_scan",
+            "description": "Stop the frequency scanner.",
+            "parameters": {
+                "type": "object",
+                "properties": {},
+                "required": []
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_scan_status",
+            "description": "Get the scanner state and the activity "
+                           "statistics of the scanned channels.",
+            "parameters": {
+                "type": "object",
+                "properties": {},
+                "required": []
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "find_similar_intercepts",
+            "description": "Find the intercepts most similar to a text, "
+                           "on all frequencies or on one.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "text": {
+                        "type": "string",
+                        "description": "The message to look for."
+                    },
+                    "frequency": {
+                        "type": "integer",
+                        "description": "Only intercepts on this frequency "
+                                       "in Hz."
+                    },
+                    "limit": {
+                        "type": "integer",
+                        "description": "Maximum number of intercepts "
+                                       "(default 10, at most 50)."
+                    }
+                },
+                "required": ["text"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_recurring_messages",
+            "description": "Get the messages repeated with the same wording "
+                           "among the recent intercepts, with how often and "
+                           "where they were heard.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "min_count": {
+                        "type": "integer",
+                        "description": "Minimum number of repetitions "
+                                       "(default 3)."
+                    }
+                },
+                "required": []
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_transcription_stats",
+            "description": "Get how many transcriptions were kept and how "
+                           "many were dropped, by reason (hallucination, "
+                           "repetition, duplicate...), and how far the "
+                           "audio timestamps are from wall time.",
+            "parameters": {
+                "type": "object",
+                "properties": {},
+                "required": []
+            }
+        }
     }
 ]
 
@@ -90,6 +251,9 @@ def set_frequency(frequency: int):
     logger.info(f"Setting GQRX frequency to {frequency} Hz")
     result = None
     try:
+        # Manual tuning takes over from the scanner
+        if scanner.stop_scan():
+            logger.info("Scanner stopped by manual tuning")
         response = gqrx.send(f"F {frequency}")
         result = json.dumps({"result": response})
         logger.info(
@@ -101,8 +265,6 @@ def set_frequency(frequency: int):
     except Exception as e:
         logger.error(f"Error setting frequency: {e}", exc_info=True)
         result = json.dumps({"error": str(e)})
-    finally:
-        gqrx.close()
 
     return result
 
@@ -118,8 +280,6 @@ def get_current_frequency():
     except Exception as e:
         logger.error(f"Error getting frequency: {e}", exc_info=True)
         result = json.dumps({"error": str(e)})
-    finally:
-        gqrx.close()
     return result
 
 
@@ -132,15 +292,7 @@ def get_last_10_minutes(frequency: int):
     try:
         transcripts = get_last_transcripts(frequency, 10)
         logger.info(f"Found {len(transcripts)} transcripts")
-        result = json.dumps({
-            "result": [
-                {
-                    "timestamp": transcript.timestamp.isoformat(),
-                    "text": transcript.text
-                }
-                for transcript in transcripts
-            ]
-        })
+        result = compact_transcripts(transcripts)
     except Exception as e:
         logger.error(
             "Error getting last 10 minutes of transcripts: "
@@ -175,6 +327,112 @@ def get_frequency_summary(frequency: int):
     return result
 
 
+def get_signal_activity(frequency: int, last_minutes: int = 60):
+    """Get the signal activity of a frequency over the last minutes."""
+    logger.info(
+        f"Getting signal activity for frequency: {frequency} Hz "
+        f"(last {last_minutes} minutes)")
+    result = None
+    try:
+        activity = telemetry.get_activity(frequency, last_minutes)
+        if not activity["samples"]:
+            result = json.dumps({"error": "No telemetry recorded"})
+        else:
+            result = json.dumps({"result": activity})
+    except Exception as e:
+        logger.error(f"Error getting signal activity: {e}", exc_info=True)
+        result = json.dumps({"error": str(e)})
+    return result
+
+
+def start_scan(channels: str):
+    """Start scanning the given channels."""
+    logger.info(f"Starting scan of: {channels}")
+    result = None
+    try:
+        frequencies = scanner.parse_channels(channels)
+        scanner.start_scan(frequencies)
+        result = json.dumps({"result": f"Scanning {len(frequencies)} "
+                                       "channels"})
+    except Exception as e:
+        logger.error(f"Error starting scan: {e}", exc_info=True)
+        result = json.dumps({"error": str(e)})
+    return result
+
+
+def stop_scan():
+    """Stop the scanner and record the frequency it stopped on."""
+    logger.info("Stopping scan")
+    result = None
+    try:
+        if not scanner.stop_scan():
+            return json.dumps({"error": "The scanner is not running"})
+        frequency = gqrx.send("f")
+        save_session(frequency)
+        result = json.dumps({"result": scanner.get_status()})
+    except Exception as e:
+        logger.error(f"Error stopping scan: {e}", exc_info=True)
+        result = json.dumps({"error": str(e)})
+    return result
+
+
+def get_scan_status():
+    """Get the scanner state and per channel activity statistics."""
+    logger.info("Getting scan status")
+    return json.dumps({"result": scanner.get_status()})
+
+
+def find_similar_intercepts(text: str, frequency: int = None,
+                            limit: int = 10):
+    """Find the intercepts most similar to a text."""
+    logger.info(f"Finding intercepts similar to: {text}")
+    result = None
+    try:
+        # The limit comes from the model
+        limit = max(1, min(int(limit), MAX_SIMILAR_INTERCEPTS))
+        matches = similarity_index.find_similar(text, limit, frequency)
+        if not matches:
+            result = json.dumps({"error": "No similar intercepts found"})
+        else:
+            result = json.dumps({"result": matches})
+    except Exception as e:
+        logger.error(f"Error finding similar intercepts: {e}", exc_info=True)
+        result = json.dumps({"error": str(e)})
+    return result
+
+
+def get_recurring_messages(min_count: int = 3):
+    """Get the message templates repeated among the recent intercepts."""
+    logger.info("Getting recurring messages")
+    result = None
+    try:
+        messages = similarity_index.get_recurring_messages(min_count)
+        if not messages:
+            result = json.dumps({"error": "No recurring messages found"})
+        else:
+            result = json.dumps({"result": messages})
+    except Exception as e:
+        logger.error(f"Error getting recurring messages: {e}", exc_info=True)
+        result = json.dumps({"error": str(e)})
+    return result
+
+
+def get_transcription_stats():
+    """Get the kept and dropped transcription counts and the state of the
+    audio timestamps."""
+    logger.info("Getting transcription stats")
+    # In process mode the filters and the clock run in the stage processes
+    if process_pipeline.pipeline is not None:
+        stats = process_pipeline.pipeline.get_filter_stats()
+        clock = process_pipeline.pipeline.clock_status
+    else:
+        stats = transcript_filter.get_stats()
+        clock = stream_groq_whisper.audio_clock.get_status() \
+            if stream_groq_whisper.audio_clock else None
+    return json.dumps({"result": {"transcript_filter": stats,
+                                  "sample_clock": clock}})
+
+
 def summarize_transcripts(transcripts: list):
     """Summarize the intercepted communications."""
     logger.info("Summarizing transcripts")
@@ -195,7 +453,7 @@ def summarize_transcripts(transcripts: list):
         prompt = summarization_prompt.format(transcripts=transcripts_str)
 
         # Send the prompt to GROQ
-        response = groq.chat.completions.create(
+        response = get_client().chat.completions.create(
             model=model,
             messages=[{"role": "system", "content": prompt}],
             max_tokens=4096,
@@ -214,5 +472,70 @@ available_tools = {
     "set_frequency": set_frequency,
     "get_current_frequency": get_current_frequency,
     "get_last_10_minutes": get_last_10_minutes,
-    "get_frequency_summary": get_frequency_summary
+    "get_frequency_summary": get_frequency_summary,
+    "get_signal_activity": get_signal_activity,
+    "start_scan": start_scan,
+    "stop_scan": stop_scan,
+    "get_scan_status": get_scan_status,
+    "find_similar_intercepts": find_similar_intercepts,
+    "get_recurring_messages": get_recurring_messages,
+    "get_transcription_stats": get_transcription_stats
 }
+
+
+def execute_tool(name: str, arguments: str):
+    """Run a tool by name with its JSON encoded arguments.
+
+    Args:
+        name (str): The tool name as requested by the model
+        arguments (str): The JSON encoded tool arguments
+
+    Returns:
+        str: The JSON encoded tool result
+    """
+    logger.info(f"Executing tool call: {name}")
+    tool_function = available_tools.get(name)
+    if tool_function is None:
+        logger.error(f"Unknown tool requested: {name}")
+        return json.dumps({"error": f"Unknown tool: {name}"})
+    try:
+        tool_args = json.loads(arguments or "{}")
+    except ValueError as e:
+        logger.error(f"Invalid arguments for {name}: {arguments}")
+        return json.dumps({"error": f"Invalid arguments: {e}"})
+    logger.debug(f"Tool arguments: {tool_args}")
+    return tool_function(**tool_args)
+
+
+def _execute_serialized(resource: str, previous, name: str, arguments: str):
+    # The previous call on this resource was submitted first, so with the
+    # FIFO executor it is already running and waiting cannot deadlock.
+    if previous is not None:
+        wait([previous])
+    with resource_locks[resource]:
+        return execute_tool(name, arguments)
+
+
+def submit_tool_call(name: str, arguments: str):
+    """Schedule a tool call on the tool executor.
+
+    Calls on tools sharing a resource (e.g. the GQRX radio) run one at a
+    time in the order they were submitted, everything else runs in parallel.
+
+    Args:
+        name (str): The tool name as requested by the model
+        arguments (str): The JSON encoded tool arguments
+
+    Returns:
+        Future: A future resolving to the JSON encoded tool result
+    """
+    resource = tool_resources.get(name)
+    if resource is None:
+        return tool_executor.submit(execute_tool, name, arguments)
+
+    with _resource_tails_lock:
+        previous = _resource_tails.get(resource)
+        future = tool_executor.submit(
+            _execute_serialized, resource, previous, name, arguments)
+        _resource_tails[resource] = future
+    return future
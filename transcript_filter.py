@@ -0,0 +1,210 @@
+import collections
+import datetime
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+import zlib
+
+# Get logger for this module
+logger = logging.getLogger("sigint_transcript_filter")
+
+# Known hallucinated phrases, one per line
+phrases_file = os.environ.get(
+    "TRANSCRIPT_FILTER_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                 "filters", "hallucinations.txt"))
+# Short phrases also said on the air, dropped only from audio Whisper
+# reports as likely without speech
+quiet_phrases_file = os.environ.get(
+    "TRANSCRIPT_FILTER_QUIET_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                 "filters", "quiet_hallucinations.txt"))
+# Seconds within which a near-identical intercept on the same frequency is
+# dropped as a duplicate
+duplicate_window = float(os.environ.get("DUPLICATE_WINDOW", "120"))
+# Shingle similarity (Jaccard) above which two intercepts are duplicates
+duplicate_similarity = float(os.environ.get("DUPLICATE_SIMILARITY", "0.8"))
+
+# Whisper's own threshold: text compressing better than this is looping
+MAX_COMPRESSION_RATIO = 2.4
+# Shorter texts compress badly whatever they say
+MIN_COMPRESSION_LENGTH = 40
+# Below this share of distinct words a text is a repetition
+MIN_DISTINCT_WORDS = 0.3
+MIN_REPETITION_WORDS = 6
+SHINGLE_SIZE = 5
+# Recent intercepts compared per frequency
+RECENT_PER_FREQUENCY = 5
+# Shorter intercepts ("copy", "roger that") are legitimately repeated and
+# never dropped as duplicates
+MIN_DUPLICATE_WORDS = 4
+# No speech probability from which the quiet phrases are dropped, the
+# threshold Whisper uses to skip silent segments
+NO_SPEECH_THRESHOLD = 0.6
+# Seconds between two summaries of the rejections in the log
+SUMMARY_INTERVAL = 600
+
+_non_word_re = re.compile(r"[\W_]+")
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase, remove accents, punctuation and extra whitespace."""
+    text = unicodedata.normalize("NFKD", text.casefold())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return _non_word_re.sub(" ", text).strip()
+
+
+def shingles(normalized: str) -> set:
+    """Hashes of the overlapping character n-grams of a normalized text."""
+    if len(normalized) <= SHINGLE_SIZE:
+        return {hash(normalized)}
+    return {
+        hash(normalized[i:i + SHINGLE_SIZE])
+        for i in range(len(normalized) - SHINGLE_SIZE + 1)
+    }
+
+
+def compression_ratio(text: str) -> float:
+    data = text.encode("utf-8")
+    return len(data) / len(zlib.compress(data))
+
+
+def load_phrases(path: str) -> set:
+    """Normalized phrases of a filter file, empty if it is missing."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            lines = f.read().splitlines()
+    except FileNotFoundError:
+        logger.warning(f"Transcript filter file not found: {path}")
+        return set()
+    phrases = {
+        normalize_text(line) for line in lines
+        if line.strip() and not line.lstrip().startswith("#")
+    }
+    phrases.discard("")
+    logger.info(f"Loaded {len(phrases)} filtered phrases from {path}")
+    return phrases
+
+
+class TranscriptFilter:
+    """Rejects hallucinated, looping and duplicated transcriptions.
+
+    Checks, in order: empty text, known hallucinated phrases (short
+    everyday ones only for audio without speech), repetitive text
+    (compression ratio or few distinct words) and near-duplicates of a
+    recent intercept on the same frequency. Rejections are counted per
+    reason and summarized in the log.
+    """
+
+    def __init__(self, phrases: set = None, quiet_phrases: set = None):
+        self.phrases = load_phrases(phrases_file) if phrases is None \
+            else {normalize_text(p) for p in phrases}
+        self.quiet_phrases = load_phrases(quiet_phrases_file) \
+            if quiet_phrases is None \
+            else {normalize_text(p) for p in quiet_phrases}
+        self.recent = collections.defaultdict(
+            lambda: collections.deque(maxlen=RECENT_PER_FREQUENCY))
+        self.rejected = collections.Counter()
+        self.accepted = 0
+        self._summarized_at = time.monotonic()
+        self._summarized_count = 0
+        self._lock = threading.Lock()
+
+    def _is_duplicate(self, frequency, timestamp, text_shingles) -> bool:
+        for seen_at, seen_shingles in self.recent[frequency]:
+            if abs((timestamp - seen_at).total_seconds()) > duplicate_window:
+                continue
+            union = len(text_shingles | seen_shingles)
+            if union and len(text_shingles & seen_shingles) / union \
+                    >= duplicate_similarity:
+                return True
+        return False
+
+    def check(self, text: str, frequency=None, timestamp=None,
+              no_speech_prob: float = None):
+        """Check a transcription.
+
+        Args:
+            text (str): The transcribed text
+            frequency: Channel of the intercept
+            timestamp (datetime): Time of the intercept
+            no_speech_prob (float): Whisper's probability that the audio
+                has no speech, if known
+
+        Returns:
+            str: Why the text is rejected, or None if it should be kept
+        """
+        timestamp = timestamp or datetime.datetime.now()
+        normalized = normalize_text(text or "")
+        words = normalized.split()
+
+        reason = None
+        if not normalized:
+            reason = "empty"
+        elif normalized in self.phrases:
+            reason = "hallucination"
+        elif normalized in self.quiet_phrases and \
+                no_speech_prob is not None and \
+                no_speech_prob >= NO_SPEECH_THRESHOLD:
+            reason = "hallucination"
+        elif len(normalized) >= MIN_COMPRESSION_LENGTH and \
+                compression_ratio(normalized) > MAX_COMPRESSION_RATIO:
+            reason = "compression_ratio"
+        elif len(words) >= MIN_REPETITION_WORDS and \
+                len(set(words)) / len(words) < MIN_DISTINCT_WORDS:
+            reason = "repetition"
+
+        with self._lock:
+            if reason is None and len(words) >= MIN_DUPLICATE_WORDS:
+                text_shingles = shingles(normalized)
+                if self._is_duplicate(frequency, timestamp, text_shingles):
+                    reason = "duplicate"
+                else:
+                    self.recent[frequency].append((timestamp, text_shingles))
+            if reason is None:
+                self.accepted += 1
+            else:
+                self.rejected[reason] += 1
+            self._summarize()
+        return reason
+
+    def _summarize(self):
+        now = time.monotonic()
+        total = self.accepted + sum(self.rejected.values())
+        if now - self._summarized_at < SUMMARY_INTERVAL or \
+                total == self._summarized_count:
+            return
+        self._summarized_at = now
+        self._summarized_count = total
+        logger.info("Transcript filter: %d accepted, rejected %s",
+                    self.accepted, dict(self.rejected) or "none")
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {"accepted": self.accepted, "rejected": dict(self.rejected)}
+
+
+_filter = None
+_filter_lock = threading.Lock()
+
+
+def get_filter() -> TranscriptFilter:
+    """Get the shared filter, loading the phrases on first use."""
+    global _filter
+    if _filter is None:
+        with _filter_lock:
+            if _filter is None:
+                _filter = TranscriptFilter()
+    return _filter
+
+
+def check(text: str, frequency=None, timestamp=None,
+          no_speech_prob: float = None):
+    return get_filter().check(text, frequency, timestamp, no_speech_prob)
+
+
+def get_stats() -> dict:
+    return get_filter().get_stats()